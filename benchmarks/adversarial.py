@@ -0,0 +1,211 @@
+"""
+    benchmarks/adversarial.py
+
+    Worst case inputs for the parse stage: unterminated declarations, oddly
+    indented terminators, mission sized files and pathologically long lines.
+    Every case is scraped with every parser backend under a parse time budget
+    and must end either in a parsed file or in a parse timeout diagnostic for
+    it, within close to that budget; a case that overruns it, raises, or ends
+    in neither is a regression. The backends that promise to parse in linear
+    time are also timed on the unterminated cases at two sizes, and must not
+    slow down by much more than the input grew.
+
+    Usage: 'python benchmarks/adversarial.py [--budget=<secs>] [--scale=<factor>] [--keep=<dir>]'
+
+    Exits with status 1 when any case failed.
+"""
+
+import os
+import os.path
+import sys
+import io
+import time
+import shutil
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tsscraper
+import generate
+
+# How far past its budget a case may finish before it counts as an overrun,
+# as the deadline is only checked between matches and tokens
+BUDGET_SLACK = 1.0
+
+# Linearity checks time a case at its scale and at this many times that
+# scale. The larger input may take at most LINEARITY_SLACK times longer than
+# it grew, where a quadratic parser would take as much longer again
+LINEARITY_FACTOR = 4
+LINEARITY_SLACK = 2.0
+
+
+def unterminated_datablocks(scale):
+    # Every header starts a lazy match for "};" that runs to the end of file
+    block = "datablock ItemData(Broken%u)\n{\n   shapeFile = \"broken.dts\";\n   mass = 1;\n\n"
+    return "".join([block % index for index in range(2000 * scale)])
+
+def misindented_terminators(scale):
+    # "};" that is not at the start of its line, or split across lines
+    blocks = [ ]
+    for index in range(2000 * scale):
+        blocks.append("datablock ItemData(Odd%u)\n{\n   mass = 1;   };\n   image = Thing;\n}\n;\n" % index)
+    return "".join(blocks)
+
+def mission_file(scale):
+    # A multi megabyte mission: deeply nested object instantiations with many
+    # properties and no declarations the scraper cares about
+    lines = [ "new SimGroup(MissionGroup) {" ]
+    for index in range(20000 * scale):
+        lines.append("   new TSStatic(Static%u) {" % index)
+        lines.append("      position = \"%u %u %u\";" % (index, index * 2, index * 3))
+        lines.append("      rotation = \"1 0 0 0\";")
+        lines.append("      scale = \"1 1 1\";")
+        lines.append("      shapeName = \"static%u.dts\";" % index)
+        lines.append("   };")
+    lines.append("};")
+    return "\n".join(lines)
+
+def comma_lines(scale):
+    # Long lines of commas in a parameter list and in a property value
+    parameters = ", ".join(["%%p%s" % generate.letters(index) for index in range(20000 * scale)])
+    values = ",".join(["1"] * (200000 * scale))
+    return "function commas(%s)\n{\n}\n\ndatablock ItemData(Commas)\n{\n   values = %s;\n   list = %s\n};\n" % (parameters, values, values)
+
+def unterminated_functions(scale):
+    # Bodies that are never closed, each rescanned as top level code
+    return "".join(["function open%s(%%a)\n{\n   schedule(100, 0, \"open\", %%a;\n" % generate.letters(index) for index in range(2000 * scale)])
+
+def unterminated_strings(scale):
+    return "".join(["datablock AudioProfile(Sound%u)\n{\n   fileName = \"sound%u.wav;\n   /* description = Nothing;\n" % (index, index) for index in range(2000 * scale)])
+
+def deep_nesting(scale):
+    depth = 20000 * scale
+    return "function deep(%%a)\n%s\n   %%a = 1;\n%s\n" % ("{" * depth, "}" * depth)
+
+CASES = [ unterminated_datablocks, misindented_terminators, mission_file, comma_lines, unterminated_functions,
+unterminated_strings, deep_nesting ]
+
+# The cases each backend must parse in linear time
+LINEAR_CASES = { "lexer": [ unterminated_datablocks, unterminated_functions, unterminated_strings ] }
+
+def run_case(directory, backend, budget):
+    """
+        Runs the scraper over a directory holding the single file of a case.
+        Returns (parse stage seconds, outcome, failure), where failure is None
+        when the case passed and says why it did not otherwise.
+    """
+    scraper = tsscraper.TSScraper(directory, parser_backend=backend, parse_timeout=budget)
+    try:
+        # The scraper reports its progress on stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = scraper.process()
+    except Exception as e:
+        return (scraper.metrics.get_stage("parse").wall_time, "error", "%s: %s" % (type(e).__name__, e))
+    elapsed = scraper.metrics.get_stage("parse").wall_time
+
+    if (len(results["files"]) != 1):
+        return (elapsed, "error", "%u files were parsed instead of one" % len(results["files"]))
+
+    file = results["files"][0]
+    timeouts = [diagnostic for diagnostic in results["diagnostics"] if diagnostic.code == "parse-timeout"]
+
+    if (file.parse_error is not None):
+        outcome = "timed out"
+        if (len(timeouts) != 1 or timeouts[0].filepath != file.path):
+            return (elapsed, outcome, "the timeout was not reported as a diagnostic")
+    else:
+        outcome = "%u functions, %u datablocks" % (len(results["global_functions"]), len(results["datablocks"]))
+        if (len(timeouts) != 0):
+            return (elapsed, outcome, "a parse timeout was reported for a parsed file")
+
+    if (elapsed > budget + BUDGET_SLACK):
+        return (elapsed, outcome, "overran the %g second budget" % budget)
+    return (elapsed, outcome, None)
+
+def time_scrape(path, backend, repeat=3):
+    """
+        Returns the best time of scraping a file without a time budget.
+    """
+    best = None
+    for iteration in range(repeat):
+        start = time.perf_counter()
+        tsscraper.scrape_file((path, backend, None, False, True))
+        elapsed = time.perf_counter() - start
+
+        if (best is None or elapsed < best):
+            best = elapsed
+    return best
+
+def check_linearity(directory, case, backend, scale):
+    """
+        Times a case at the given scale and at LINEARITY_FACTOR times it.
+        Returns (small seconds, large seconds, failure), where failure is None
+        when the time grew linearly and says by how much it grew otherwise.
+    """
+    timings = [ ]
+    for case_scale in (scale, scale * LINEARITY_FACTOR):
+        path = os.path.join(directory, "%s-%u.cs" % (case.__name__, case_scale))
+        with open(path, "w") as handle:
+            handle.write(case(case_scale))
+        timings.append(time_scrape(path, backend))
+
+    small, large = timings
+    if (large > small * LINEARITY_FACTOR * LINEARITY_SLACK):
+        return (small, large, "took %.1f times longer for %u times the input" % (large / max(small, 1e-9), LINEARITY_FACTOR))
+    return (small, large, None)
+
+def main():
+    arguments, options = generate.parse_options(sys.argv[1:])
+
+    budget = float(options.get("budget", 5.0))
+    scale = int(options.get("scale", 1))
+
+    directory = options.get("keep")
+    if (directory is None):
+        directory = tempfile.mkdtemp(prefix="tsscraper-adversarial-")
+    elif (not os.path.isdir(directory)):
+        os.makedirs(directory)
+
+    failures = 0
+    try:
+        print("%-26s %-7s %7s %9s  %s" % ("Case", "Parser", "Size", "Seconds", "Outcome"))
+        for case in CASES:
+            case_directory = os.path.join(directory, case.__name__)
+            if (not os.path.isdir(case_directory)):
+                os.makedirs(case_directory)
+
+            path = os.path.join(case_directory, "%s.cs" % case.__name__)
+            with open(path, "w") as handle:
+                handle.write(case(scale))
+
+            for backend in tsscraper.PARSER_BACKENDS:
+                elapsed, outcome, failure = run_case(case_directory, backend, budget)
+
+                if (failure is not None):
+                    failures += 1
+                    outcome = "%s FAILED: %s" % (outcome, failure)
+                print("%-26s %-7s %6uK %9.3f  %s" % (case.__name__, backend, os.path.getsize(path) // 1024, elapsed, outcome))
+
+        print("")
+        print("%-26s %-7s %9s %9s  %s" % ("Linearity", "Parser", "x1", "x%u" % LINEARITY_FACTOR, "Outcome"))
+        for backend in sorted(LINEAR_CASES):
+            for case in LINEAR_CASES[backend]:
+                small, large, failure = check_linearity(directory, case, backend, scale)
+
+                outcome = "linear"
+                if (failure is not None):
+                    failures += 1
+                    outcome = "FAILED: %s" % failure
+                print("%-26s %-7s %9.3f %9.3f  %s" % (case.__name__, backend, small, large, outcome))
+    finally:
+        if ("keep" not in options):
+            shutil.rmtree(directory, True)
+
+    if (failures != 0):
+        print("%u cases failed." % failures)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+    benchmarks/generate.py
+
+    Generates synthetic TorqueScript mod trees for benchmarking. The output is
+    fully determined by the parameters and the seed, so the same corpus can be
+    rebuilt anywhere instead of shipping real mods around.
+
+    Usage: 'python benchmarks/generate.py [options] <output directory>'
+"""
+
+import os
+import os.path
+import sys
+import random
+
+# Files per generated subdirectory
+FILES_PER_DIRECTORY = 50
+
+# Parameters of a corpus and their defaults
+DEFAULTS = { "files": 200, "file-size": 0, "functions": 20, "datablocks": 20, "inheritance-depth": 4, "fan-out": 3, "seed": 1 }
+
+DATABLOCK_TYPES = [ "ItemData", "ShapeBaseImageData", "ProjectileData", "ExplosionData", "ParticleData", "AudioProfile" ]
+
+
+def parse_options(arguments):
+    """
+        Splits the command line into positional arguments and '--name' or
+        '--name=value' options.
+    """
+    positional = [ ]
+    options = { }
+
+    for argument in arguments:
+        if (argument[0:2] == "--"):
+            name, separator, value = argument[2:].partition("=")
+            options[name] = value if separator != "" else True
+        else:
+            positional.append(argument)
+
+    return positional, options
+
+def get_parameters(options):
+    """
+        Returns the corpus parameters from the given command line options,
+        filling in the defaults.
+    """
+    parameters = dict(DEFAULTS)
+    for name in DEFAULTS:
+        if (name in options and options[name] is not True):
+            parameters[name] = int(options[name])
+    return parameters
+
+def letters(index):
+    """
+        Spells out index in letters, since the regex parser backend does not
+        accept digits in function names, parent names or property keys.
+    """
+    result = ""
+    while (True):
+        result = chr(ord("a") + index % 26) + result
+        index //= 26
+        if (index == 0):
+            return result
+
+def datablock_name(index):
+    return "Gen%sData" % letters(index).capitalize()
+
+def function_name(index):
+    return "genFunction%s" % letters(index).capitalize()
+
+def write_datablock(lines, random_generator, index, parameters, datablock_count):
+    type = DATABLOCK_TYPES[index % len(DATABLOCK_TYPES)]
+
+    # Datablocks form chains of inheritance_depth + 1, each inheriting from the
+    # one declared before it
+    header = "datablock %s(%s)" % (type, datablock_name(index))
+    if (index % (parameters["inheritance-depth"] + 1) != 0):
+        header = "%s : %s" % (header, datablock_name(index - 1))
+
+    lines.append(header)
+    lines.append("{")
+    lines.append("   shapeFile = \"gen%u.dts\";" % index)
+    lines.append("   mass = %u.%u;" % (index % 50, index % 10))
+    lines.append("   category = \"Generated\";")
+    lines.append("   maxEnergy = $Gen::Energy%u;" % (index % 10))
+
+    for reference in range(parameters["fan-out"]):
+        lines.append("   reference%s = %s;" % (letters(reference), datablock_name(random_generator.randrange(datablock_count))))
+
+    lines.append("};")
+    lines.append("")
+
+def write_function(lines, random_generator, index, parameters, function_count):
+    if (index % 2 == 0):
+        lines.append("function %s(%%client, %%value)" % function_name(index))
+    else:
+        lines.append("function %s::%s(%%this, %%obj, %%value)" % (DATABLOCK_TYPES[index % len(DATABLOCK_TYPES)], function_name(index)))
+
+    lines.append("{")
+    lines.append("   // Generated function %u" % index)
+    lines.append("   %%total = %%value * %u;" % index)
+    lines.append("   $Gen::Counter%u += %%total;" % (index % 20))
+    lines.append("   if (%%total > $Gen::Limit%u)" % (index % 10))
+    lines.append("   {")
+    lines.append("      %s(%%client, %%total);" % function_name(random_generator.randrange(function_count)))
+    lines.append("      %%obj.%s(%%total);" % function_name(random_generator.randrange(function_count)))
+    lines.append("   }")
+    lines.append("   schedule(100, 0, \"%s\", %%client);" % function_name(random_generator.randrange(function_count)))
+    lines.append("   return %total;")
+    lines.append("}")
+    lines.append("")
+
+def write_padding(lines, file_index, size):
+    """
+        Grows the file to at least size bytes with a long function body, as
+        found in mission and AI scripts.
+    """
+    lines.append("function genPadding%s(%%value)" % letters(file_index).capitalize())
+    lines.append("{")
+
+    current = sum([len(line) + 1 for line in lines])
+    statement = 0
+    while (current < size):
+        line = "   %%value%u = %%value + %u; // padding" % (statement % 100, statement)
+        lines.append(line)
+        current += len(line) + 1
+        statement += 1
+
+    lines.append("}")
+    lines.append("")
+
+def generate(directory, parameters):
+    """
+        Writes a corpus with the given parameters to directory and returns the
+        list of files written.
+    """
+    random_generator = random.Random(parameters["seed"])
+    datablock_count = max(parameters["files"] * parameters["datablocks"], 1)
+    function_count = max(parameters["files"] * parameters["functions"], 1)
+
+    paths = [ ]
+    for file_index in range(parameters["files"]):
+        lines = [ "// Generated script %u" % file_index, "" ]
+        lines.append("$Gen::Limit%u = %u;" % (file_index % 10, file_index))
+        lines.append("")
+
+        for offset in range(parameters["datablocks"]):
+            write_datablock(lines, random_generator, file_index * parameters["datablocks"] + offset, parameters, datablock_count)
+
+        for offset in range(parameters["functions"]):
+            write_function(lines, random_generator, file_index * parameters["functions"] + offset, parameters, function_count)
+
+        if (parameters["file-size"] != 0):
+            write_padding(lines, file_index, parameters["file-size"] * 1024)
+
+        subdirectory = os.path.join(directory, "scripts", "dir%u" % (file_index // FILES_PER_DIRECTORY))
+        if (not os.path.isdir(subdirectory)):
+            os.makedirs(subdirectory)
+
+        path = os.path.join(subdirectory, "generated%u.cs" % file_index)
+        with open(path, "w") as handle:
+            handle.write("\n".join(lines))
+        paths.append(path)
+
+    return paths
+
+def print_usage():
+    print("Usage: '%s [options] <output directory>'" % sys.argv[0])
+    print("Options:")
+    print("\t--files=<count>    Number of script files (default: %u)." % DEFAULTS["files"])
+    print("\t--file-size=<kb>   Pad every file to at least this many kilobytes (default: no padding).")
+    print("\t--functions=<count>  Functions per file (default: %u)." % DEFAULTS["functions"])
+    print("\t--datablocks=<count>  Datablocks per file (default: %u)." % DEFAULTS["datablocks"])
+    print("\t--inheritance-depth=<depth>  Length of the datablock inheritance chains (default: %u)." % DEFAULTS["inheritance-depth"])
+    print("\t--fan-out=<count>  Datablock references per datablock (default: %u)." % DEFAULTS["fan-out"])
+    print("\t--seed=<seed>      Random seed (default: %u)." % DEFAULTS["seed"])
+
+def main():
+    arguments, options = parse_options(sys.argv[1:])
+    if (len(arguments) < 1):
+        print_usage()
+        return
+
+    parameters = get_parameters(options)
+    paths = generate(arguments[0], parameters)
+    print("Wrote %u files, %u bytes to '%s'." % (len(paths), sum([os.path.getsize(path) for path in paths]), arguments[0]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+    benchmarks/memory.py
+
+    Measures the memory used per parsed entity by the slotted, interned entity
+    model in tsscraper against the dictionary backed model it replaced.
+
+    Usage: 'python benchmarks/memory.py [entity count]'
+"""
+
+import os
+import sys
+import gc
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tsscraper
+
+
+class LegacyFunction(object):
+    """
+        The original Function layout: a per instance __dict__, no interning
+        and an alias list allocated for every function.
+    """
+    def __init__(self, name, type, parameters, filepath, line):
+        self.name = name
+        self.parameters = parameters
+        self.filepath = filepath
+        self.line = line
+        self.aliases = [ ]
+        self.type = type
+
+class LegacyDatablock(object):
+    """
+        The original Datablock layout.
+    """
+    def __init__(self, name, type, properties, filepath, line, derived):
+        self.name = name
+        self.type = type
+        self.derived = derived
+        self.line = line
+        self.aliases = [ ]
+        self.properties = properties
+        self.filepath = filepath
+
+class LegacyGlobal(object):
+    def __init__(self, name):
+        self.name = name
+
+def build_functions(function_class, count):
+    # Names are built fresh for each entity, as a parser would produce them
+    functions = [ ]
+    for index in range(count):
+        filepath = "scripts/weapons%u.cs" % (index % 50)
+        parameters = [ ("%%%s" % "data"), ("%%%s" % "obj"), ("%%%s" % "slot") ]
+        functions.append(function_class(("onfire%u" % (index % 200)).lower(), ("weapon%u" % (index % 40)).lower(), parameters, filepath, index))
+    return functions
+
+def build_datablocks(datablock_class, global_class, count):
+    datablocks = [ ]
+    for index in range(count):
+        filepath = "scripts/weapons%u.cs" % (index % 50)
+        properties = { ("%s" % "pickupradius"): float(index % 5), ("%s" % "image"): "Image%u" % index,
+        ("%s" % "ammo"): global_class("%s" % "Weapon::Ammo") }
+        datablocks.append(datablock_class(("item%u" % index).lower(), ("%s" % "itemdata").lower(), properties, filepath, index, None))
+    return datablocks
+
+def measure(builder, *arguments):
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+
+    entities = builder(*arguments)
+
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (current - start) / float(len(entities)), entities
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print("Bytes per entity over %u entities:" % count)
+    print("%-12s %12s %12s %8s" % ("Entity", "Before", "After", "Saved"))
+
+    before, legacy = measure(build_functions, LegacyFunction, count)
+    del legacy
+    after, current = measure(build_functions, tsscraper.Function, count)
+    del current
+    print("%-12s %12.1f %12.1f %7.1f%%" % ("Function", before, after, 100.0 * (before - after) / before))
+
+    before, legacy = measure(build_datablocks, LegacyDatablock, LegacyGlobal, count)
+    del legacy
+    after, current = measure(build_datablocks, tsscraper.Datablock, tsscraper.Global, count)
+    del current
+    print("%-12s %12.1f %12.1f %7.1f%%" % ("Datablock", before, after, 100.0 * (before - after) / before))
+
+if __name__ == "__main__":
+    main()
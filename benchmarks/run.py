@@ -0,0 +1,245 @@
+"""
+    benchmarks/run.py
+
+    Times each stage of the scraper and each exporter separately over a
+    corpus, by default a synthetic one from generate.py, and compares the
+    timings against a stored baseline to catch performance regressions.
+
+    Usage: 'python benchmarks/run.py [options] [corpus directory]'
+
+    Exits with status 1 when any timing regressed past the tolerance.
+"""
+
+import os
+import os.path
+import sys
+import io
+import json
+import time
+import shutil
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tsscraper
+import main
+import generate
+
+# Bump whenever the set or meaning of the recorded timings changes
+BASELINE_VERSION = 1
+
+# Timings that regress by less than this many seconds are ignored as noise,
+# whatever the tolerance
+MINIMUM_DIFFERENCE = 0.025
+
+
+def time_stages(corpus_directory, pool, parser_backend):
+    """
+        Runs every stage of the scraper once over the corpus, each on the
+        output of the one before it, and returns the wall time of each.
+    """
+    timings = { }
+    scraper = tsscraper.TSScraper(corpus_directory, pool=pool, parser_backend=parser_backend)
+
+    start = time.perf_counter()
+    scraper.get_file_list(corpus_directory)
+    timings["get_file_list"] = time.perf_counter() - start
+
+    target_files = scraper._discovery_stage()
+
+    start = time.perf_counter()
+    parse_results = [payload[3] for payload in scraper._parse_stage(target_files)]
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    datablock_list = dict(scraper._declaration_stage(parse_results))
+    timings["declaration"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scraper._inheritance_stage(parse_results, datablock_list)
+    hierarchy = tsscraper.DatablockHierarchy(datablock_list)
+    timings["inheritance"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference_index = tsscraper.ReferenceIndex(datablock_list)
+    scraper._reference_stage(parse_results, datablock_list, reference_index, hierarchy)
+    timings["reference"] = time.perf_counter() - start
+
+    return timings
+
+def time_exporters(corpus_directory, pool, parser_backend, exporters):
+    """
+        Runs a full analysis, then every given exporter into a fresh output
+        directory, and returns the wall time of each export.
+    """
+    timings = { }
+
+    start = time.perf_counter()
+    results = tsscraper.TSScraper(corpus_directory, pool=pool, parser_backend=parser_backend).process()
+    timings["process"] = time.perf_counter() - start
+
+    previous_working_directory = os.getcwd()
+    for name in sorted(exporters):
+        output_directory = tempfile.mkdtemp(prefix="tsscraper-export-")
+
+        # Some exporters write to the working directory
+        os.chdir(output_directory)
+        try:
+            start = time.perf_counter()
+            exporter = exporters[name].Exporter(results, corpus_directory, { }, pool)
+            exporter.write(output_directory)
+            timings["export.%s" % name] = time.perf_counter() - start
+        finally:
+            os.chdir(previous_working_directory)
+            shutil.rmtree(output_directory, True)
+
+    return timings
+
+def run(corpus_directory, repeat, process_count, parser_backend, exporters):
+    """
+        Returns the best wall time of each stage and exporter over the given
+        number of runs.
+    """
+    best = { }
+    with tsscraper.TSScraper.create_pool(process_count) as pool:
+        for iteration in range(repeat):
+            # The scraper reports its progress on stdout
+            with contextlib.redirect_stdout(io.StringIO()):
+                timings = time_stages(corpus_directory, pool, parser_backend)
+                timings.update(time_exporters(corpus_directory, pool, parser_backend, exporters))
+
+            for name in timings:
+                best[name] = min(best.get(name, timings[name]), timings[name])
+
+    return best
+
+def compare(timings, baseline, tolerance):
+    """
+        Returns (name, baseline time, current time) for every timing that is
+        slower than its baseline by more than the tolerance.
+    """
+    regressions = [ ]
+    for name in sorted(timings):
+        if (name not in baseline):
+            continue
+
+        limit = baseline[name] * (1.0 + tolerance)
+        if (timings[name] > limit and timings[name] - baseline[name] > MINIMUM_DIFFERENCE):
+            regressions.append((name, baseline[name], timings[name]))
+    return regressions
+
+def load_baseline(path):
+    try:
+        with open(path, "r") as handle:
+            document = json.load(handle)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if (document.get("version") != BASELINE_VERSION):
+        return None
+    return document
+
+def save_baseline(path, timings, corpus):
+    document = { "version": BASELINE_VERSION, "parser_version": tsscraper.PARSER_VERSION, "corpus": corpus, "timings": timings }
+    with open(path, "w") as handle:
+        json.dump(document, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+def print_usage():
+    print("Usage: '%s [options] [corpus directory]'" % sys.argv[0])
+    print("Without a corpus directory, a synthetic corpus is generated with the generate.py options.")
+    print("Options:")
+    print("\t--repeat=<count>   Runs per timing; the best one is kept (default: 3).")
+    print("\t--workers=<count>  Parse worker processes (default: 0, parse in this process).")
+    print("\t--parser=<backend> Parse stage implementation to use: %s (default: regex)." % ", ".join(tsscraper.PARSER_BACKENDS))
+    print("\t--exporters=<names>  Comma separated exporters to time (default: all).")
+    print("\t--baseline=<file>  Compare the timings against the baseline in <file>.")
+    print("\t--save-baseline    Write the timings to the --baseline file instead of comparing.")
+    print("\t--tolerance=<fraction>  Allowed slowdown over the baseline (default: 0.25).")
+    print("\t--keep-corpus=<dir>  Generate the synthetic corpus into <dir> and keep it. Use an empty directory.")
+
+def main_benchmark():
+    arguments, options = generate.parse_options(sys.argv[1:])
+    if ("help" in options):
+        print_usage()
+        return 0
+
+    def get_option(name, default=None):
+        if (name not in options or options[name] is True):
+            return default
+        return options[name]
+
+    repeat = int(get_option("repeat", 3))
+    process_count = int(get_option("workers", 0))
+    parser_backend = get_option("parser", "regex")
+    tolerance = float(get_option("tolerance", 0.25))
+
+    # Exporter discovery prints import errors, which are worth seeing here
+    exporters = main.Application().get_available_exporters()
+    if (get_option("exporters") is not None):
+        names = get_option("exporters").split(",")
+        for name in names:
+            if (name not in exporters):
+                print("Error: No such exporter '%s'." % name)
+                return 2
+        exporters = dict([(name, exporters[name]) for name in names])
+
+    generated_directory = None
+    if (len(arguments) != 0):
+        corpus_directory = arguments[0]
+        corpus = { "directory": os.path.abspath(corpus_directory) }
+    else:
+        corpus = generate.get_parameters(options)
+        corpus_directory = get_option("keep-corpus")
+        if (corpus_directory is None):
+            corpus_directory = generated_directory = tempfile.mkdtemp(prefix="tsscraper-corpus-")
+
+        paths = generate.generate(corpus_directory, corpus)
+        print("Generated %u files, %u bytes in '%s'." % (len(paths), sum([os.path.getsize(path) for path in paths]), corpus_directory))
+
+    try:
+        timings = run(corpus_directory, repeat, process_count, parser_backend, exporters)
+    finally:
+        if (generated_directory is not None):
+            shutil.rmtree(generated_directory, True)
+
+    baseline_path = get_option("baseline")
+    baseline = None
+    if (baseline_path is not None and "save-baseline" not in options):
+        baseline = load_baseline(baseline_path)
+        if (baseline is None):
+            print("Warning: No usable baseline in '%s'." % baseline_path)
+        elif (baseline["corpus"] != corpus):
+            print("Warning: The baseline was recorded over a different corpus, the comparison is meaningless.")
+
+    print("%-20s %12s %12s %9s" % ("Timing", "Seconds", "Baseline", "Change"))
+    for name in sorted(timings):
+        if (baseline is not None and name in baseline["timings"] and baseline["timings"][name] != 0):
+            change = 100.0 * (timings[name] - baseline["timings"][name]) / baseline["timings"][name]
+            print("%-20s %12.4f %12.4f %8.1f%%" % (name, timings[name], baseline["timings"][name], change))
+        else:
+            print("%-20s %12.4f %12s %9s" % (name, timings[name], "-", "-"))
+
+    if ("save-baseline" in options):
+        if (baseline_path is None):
+            print("Error: --save-baseline requires --baseline=<file>.")
+            return 2
+
+        save_baseline(baseline_path, timings, corpus)
+        print("Wrote baseline '%s'." % baseline_path)
+        return 0
+
+    if (baseline is None):
+        return 0
+
+    regressions = compare(timings, baseline["timings"], tolerance)
+    for name, baseline_time, current_time in regressions:
+        print("REGRESSION: %s took %.4fs, baseline %.4fs (tolerance %u%%)." % (name, current_time, baseline_time, tolerance * 100))
+
+    if (len(regressions) != 0):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_benchmark())
@@ -0,0 +1,149 @@
+"""
+    cache.py
+
+    Persistent on-disk cache for the parse stage of the scraper.
+"""
+
+import os
+import os.path
+import hashlib
+import pickle
+
+
+class ParseCache(object):
+    """
+        Class representing a persistent cache of scrape_file results. Entries
+        are keyed by the absolute file path and validated against the file's
+        size and modification time. When content hashing is enabled, a file
+        whose modification time changed but whose contents did not (such as
+        after a fresh checkout) is still considered a hit.
+
+        The whole cache is invalidated when the parser fingerprint changes, so
+        any change to the parser version or patterns forces a full re-scrape.
+        Whether call sites and global usages were recorded is kept per entry
+        instead, so runs with and without them can share one cache.
+    """
+    path = None
+    fingerprint = None
+    hash_contents = None
+
+    hits = None
+    misses = None
+
+    _entries = None
+    _touched = None
+
+    def __init__(self, path, fingerprint, hash_contents=False):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.hash_contents = hash_contents
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = { }
+        self._touched = set()
+
+        self.load()
+
+    def load(self):
+        """
+            Loads the cache file from disk, discarding it if it is unreadable
+            or was produced by a different parser fingerprint.
+        """
+        self._entries = { }
+
+        if (os.path.isfile(self.path) is False):
+            return
+
+        try:
+            with open(self.path, "rb") as handle:
+                fingerprint, entries = pickle.load(handle)
+        except Exception as e:
+            print("Warning: Discarding unreadable parse cache '%s': %s" % (self.path, e))
+            return
+
+        if (fingerprint != self.fingerprint):
+            print("INFO: Parser changed since the parse cache was written, discarding '%s'." % self.path)
+            return
+
+        self._entries = entries
+
+    def save(self):
+        """
+            Writes the cache back to disk. Entries for files that were not seen
+            in this session are kept as long as the file still exists, so one
+            cache can be shared between several target directories.
+        """
+        entries = { }
+        for filepath in self._entries:
+            if (filepath in self._touched or os.path.isfile(filepath)):
+                entries[filepath] = self._entries[filepath]
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if (os.path.isdir(directory) is False):
+            os.makedirs(directory)
+
+        temporary_path = "%s.tmp" % self.path
+        with open(temporary_path, "wb") as handle:
+            pickle.dump((self.fingerprint, entries), handle, pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temporary_path, self.path)
+        self._entries = entries
+
+    def _digest(self, filepath):
+        with open(filepath, "rb") as handle:
+            return hashlib.sha1(handle.read()).hexdigest()
+
+    def lookup(self, filepath, usages=False):
+        """
+            Looks up the cached parse result for the given file. With usages,
+            entries scraped without call sites and global usages are misses.
+
+            Returns a tuple of (payload, signature). The payload is None on a
+            cache miss, in which case the signature should be handed back to
+            store() along with the freshly scraped payload.
+        """
+        self._touched.add(filepath)
+
+        stat = os.stat(filepath)
+        size = stat.st_size
+        mtime = stat.st_mtime
+
+        entry = self._entries.get(filepath)
+        if (entry is not None and usages and not entry[3]):
+            entry = None
+
+        if (entry is not None):
+            cached_size, cached_mtime, cached_digest, cached_usages, payload = entry
+
+            if (cached_size == size and cached_mtime == mtime):
+                self.hits += 1
+                return (pickle.loads(payload), None)
+
+            if (self.hash_contents and cached_size == size and cached_digest is not None):
+                digest = self._digest(filepath)
+
+                if (digest == cached_digest):
+                    self._entries[filepath] = (size, mtime, digest, cached_usages, payload)
+                    self.hits += 1
+                    return (pickle.loads(payload), None)
+
+                self.misses += 1
+                return (None, (size, mtime, digest))
+
+        self.misses += 1
+        digest = self._digest(filepath) if self.hash_contents else None
+        return (None, (size, mtime, digest))
+
+    def store(self, filepath, signature, payload, usages=False):
+        """
+            Stores a freshly scraped payload for the given file using the
+            signature that lookup() computed before the file was scraped, and
+            whether it was scraped with usages.
+
+            The payload is serialized immediately: later analysis stages mutate
+            the parsed entities and those changes must not leak into the cache.
+        """
+        size, mtime, digest = signature
+        self._entries[filepath] = (size, mtime, digest, usages, pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
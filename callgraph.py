@@ -0,0 +1,145 @@
+"""
+    callgraph.py
+
+    Call graph over the call sites the parse stage records. Functions are
+    keyed by their lowercased "name" or "type::name"; code outside of any
+    function is the SCRIPT node.
+"""
+
+import collections
+
+import tsscraper
+
+SCRIPT = "<script>"
+
+# Functions with these prefixes are called by the engine or by the network
+# layer rather than by script code, so they are entry points of their own
+ENTRY_PREFIXES = ( "on", "servercmd", "clientcmd" )
+
+
+def function_key(function):
+    if (function.type is None):
+        return function.name
+    return "%s::%s" % (function.type, function.name)
+
+class CallGraph(object):
+    """
+        Class representing the resolved calls between the functions of a set
+        of files, as forward (callees) and reverse (callers) adjacency sets.
+
+        Calls are resolved conservatively: a method call on an object or a
+        Parent:: call may reach every bound function of that name, since the
+        object's namespace is not known statically. Calls to names that no
+        script declares (engine functions) are kept in unresolved.
+    """
+    functions = None
+    callees = None
+    callers = None
+    unresolved = None
+
+    _methods = None
+
+    def __init__(self, files):
+        self.functions = { }
+        self.callees = { SCRIPT: set() }
+        self.callers = { SCRIPT: set() }
+        self.unresolved = { }
+
+        # Bound functions by their name alone, for calls on objects
+        self._methods = { }
+
+        for file in files:
+            for function in file.global_functions:
+                self._add_function(function)
+
+            for type in file.bound_functions:
+                for function in file.bound_functions[type]:
+                    self._add_function(function)
+                    self._methods.setdefault(function.name, set()).add(function_key(function))
+
+        for file in files:
+            for call in file.calls:
+                self._add_call(call)
+
+    def __contains__(self, key):
+        return key in self.functions
+
+    def _add_function(self, function):
+        key = function_key(function)
+        self.functions.setdefault(key, []).append(function)
+        self.callees.setdefault(key, set())
+        self.callers.setdefault(key, set())
+
+    def resolve(self, call):
+        """
+            Returns the keys of every function the given call site may reach.
+        """
+        if (call.kind == tsscraper.CALL_GLOBAL):
+            if (call.name in self.functions):
+                return [ call.name ]
+            return [ ]
+        elif (call.kind == tsscraper.CALL_NAMESPACE):
+            key = "%s::%s" % (call.type, call.name)
+            if (key in self.functions):
+                return [ key ]
+            return [ ]
+
+        # Method and Parent:: calls
+        return self._methods.get(call.name, ())
+
+    def _add_call(self, call):
+        caller = call.caller
+        if (caller is None or caller not in self.callees):
+            caller = SCRIPT
+
+        targets = self.resolve(call)
+        if (len(targets) == 0):
+            self.unresolved.setdefault(call.name, []).append(call)
+            return
+
+        for target in targets:
+            self.callees[caller].add(target)
+            self.callers[target].add(caller)
+
+    def get_callers(self, key):
+        return self.callers.get(key.lower(), set())
+
+    def get_callees(self, key):
+        return self.callees.get(key.lower(), set())
+
+    def entry_points(self):
+        """
+            Returns the default roots for reachability: script level code and
+            every function the engine or network layer may call.
+        """
+        roots = [ SCRIPT ]
+        for key in self.functions:
+            name = key.rsplit("::", 1)[-1]
+            if (name.startswith(ENTRY_PREFIXES)):
+                roots.append(key)
+        return roots
+
+    def reachable(self, roots=None):
+        """
+            Returns the set of function keys reachable from the given roots,
+            which default to entry_points(), with a breadth first search.
+        """
+        if (roots is None):
+            roots = self.entry_points()
+
+        seen = set([root.lower() for root in roots if root.lower() in self.callees])
+        pending = collections.deque(seen)
+        while (len(pending) != 0):
+            for callee in self.callees[pending.popleft()]:
+                if (callee not in seen):
+                    seen.add(callee)
+                    pending.append(callee)
+        return seen
+
+    def unreachable(self, roots=None):
+        """
+            Returns the keys of every declared function that can not be
+            reached from the given roots: candidates for dead code.
+        """
+        seen = self.reachable(roots)
+        return sorted([key for key in self.functions if key not in seen])
@@ -0,0 +1,203 @@
+"""
+    columnar.py
+
+    Optional columnar view of datablock properties, built after parsing. For
+    every datablock type the effective numeric properties of its datablocks
+    are stored as NumPy arrays together with presence masks, so numeric rules
+    can be evaluated as batched vector operations and range, outlier and
+    aggregate queries over thousands of datablocks run in milliseconds.
+
+    Requires NumPy, which is only imported once a store is built so that
+    runs without one don't pay for importing it.
+"""
+
+# Set by import_numpy
+numpy = None
+
+
+def import_numpy():
+    """
+        Imports NumPy on first use and returns it. Raises ImportError when it
+        is not installed.
+    """
+    global numpy
+
+    if (numpy is None):
+        try:
+            import numpy as module
+        except ImportError:
+            raise ImportError("The columnar property store requires NumPy.")
+        numpy = module
+    return numpy
+
+
+class TypeTable(object):
+    """
+        Class representing the columns for every datablock of one type. Row i
+        of every column describes datablocks[i].
+
+        present[property] is True where the property is declared or
+        inherited at all, numeric[property] where its value is a number, and
+        values[property] holds the number (NaN elsewhere). Non numeric
+        values are kept in the row's properties mapping.
+    """
+    type = None
+    datablocks = None
+    properties = None
+
+    _values = None
+    _present = None
+    _numeric = None
+
+    def __init__(self, type, datablocks, properties):
+        self.type = type
+        self.datablocks = datablocks
+        self.properties = properties
+
+        self._values = { }
+        self._present = { }
+        self._numeric = { }
+
+        row_count = len(datablocks)
+        for row, row_properties in enumerate(properties):
+            for name in row_properties:
+                if (name not in self._present):
+                    self._present[name] = numpy.zeros(row_count, dtype=bool)
+                    self._numeric[name] = numpy.zeros(row_count, dtype=bool)
+                    self._values[name] = numpy.full(row_count, numpy.nan)
+
+                self._present[name][row] = True
+
+                value = row_properties[name]
+                if (isinstance(value, float)):
+                    self._numeric[name][row] = True
+                    self._values[name][row] = value
+
+    def __len__(self):
+        return len(self.datablocks)
+
+    def column(self, name):
+        """
+            Returns the (values, present, numeric) arrays for the given
+            property. Properties no datablock of this type has yield all
+            False masks.
+        """
+        if (name not in self._present):
+            row_count = len(self.datablocks)
+            return (numpy.full(row_count, numpy.nan), numpy.zeros(row_count, dtype=bool), numpy.zeros(row_count, dtype=bool))
+
+        return (self._values[name], self._present[name], self._numeric[name])
+
+    def numeric_columns(self):
+        return [name for name in self._numeric if self._numeric[name].any()]
+
+class ColumnarStore(object):
+    """
+        Class representing the per type tables for a set of datablocks. The
+        effective (declared plus inherited) properties of every datablock are
+        used, as resolved by the given DatablockHierarchy.
+    """
+    tables = None
+
+    def __init__(self, datablocks, hierarchy):
+        import_numpy()
+
+        rows = { }
+        for datablock in datablocks:
+            type_rows = rows.setdefault(datablock.type, ([ ], [ ]))
+            type_rows[0].append(datablock)
+            type_rows[1].append(hierarchy.effective_properties(datablock))
+
+        self.tables = { }
+        for type in rows:
+            self.tables[type] = TypeTable(type, rows[type][0], rows[type][1])
+
+    def __contains__(self, type):
+        return type in self.tables
+
+    def get(self, type):
+        return self.tables.get(type)
+
+    def evaluate(self, type, check):
+        """
+            Evaluates a rules.PropertyCheck against every datablock of the given
+            type at once. Returns a pair of boolean arrays: rows missing the
+            property and rows whose value fails the check.
+        """
+        table = self.tables[type]
+        values, present, numeric = table.column(check.property)
+        missing = ~present
+
+        if (check.is_numeric and not check.not_empty and check.type != "string"):
+            failed = present & ~numeric
+
+            with numpy.errstate(invalid="ignore"):
+                if (check.minimum is not None):
+                    failed |= numeric & (values < check.minimum)
+                if (check.maximum is not None):
+                    failed |= numeric & (values > check.maximum)
+        else:
+            # Checks on strings are evaluated row by row
+            failed = numpy.zeros(len(table), dtype=bool)
+            for row in numpy.flatnonzero(present):
+                failed[row] = not check(table.properties[row][check.property])
+
+        return (missing, failed)
+
+    def query(self, type, property, minimum=None, maximum=None):
+        """
+            Returns every datablock of the given type whose numeric property
+            lies within the given inclusive bounds.
+        """
+        table = self.tables.get(type)
+        if (table is None):
+            return [ ]
+
+        values, present, numeric = table.column(property)
+        selected = numeric.copy()
+        if (minimum is not None):
+            selected &= values >= minimum
+        if (maximum is not None):
+            selected &= values <= maximum
+
+        return [table.datablocks[row] for row in numpy.flatnonzero(selected)]
+
+    def aggregate(self, type, property):
+        """
+            Returns count, min, max, mean and standard deviation of a numeric
+            property over every datablock of the given type that has it.
+        """
+        table = self.tables.get(type)
+        if (table is None):
+            return { "count": 0 }
+
+        values, present, numeric = table.column(property)
+        selected = values[numeric]
+        if (len(selected) == 0):
+            return { "count": 0 }
+
+        return { "count": int(len(selected)), "min": float(selected.min()), "max": float(selected.max()),
+        "mean": float(selected.mean()), "std": float(selected.std()) }
+
+    def outliers(self, type, property, threshold=3.0):
+        """
+            Returns (datablock, value, z-score) for every datablock of the given
+            type whose numeric property is more than threshold standard
+            deviations from the mean.
+        """
+        table = self.tables.get(type)
+        if (table is None):
+            return [ ]
+
+        values, present, numeric = table.column(property)
+        selected = values[numeric]
+        if (len(selected) < 2 or selected.std() == 0):
+            return [ ]
+
+        scores = numpy.zeros(len(table))
+        scores[numeric] = (selected - selected.mean()) / selected.std()
+
+        result = [ ]
+        for row in numpy.flatnonzero(numeric & (numpy.abs(scores) > threshold)):
+            result.append((table.datablocks[row], float(values[row]), float(scores[row])))
+        return result
@@ -0,0 +1,123 @@
+/*
+    search.js
+
+    Symbol search for the generated index pages. Symbols are sharded into
+    search/shard-<prefix>.json by the first characters of their lowercased
+    name, with large shards split on longer prefixes; shards are only fetched
+    once a query needs them and are then cached.
+*/
+
+(function() {
+    var maximumResults = 50;
+    var manifest = null;
+    var shards = { };
+
+    function getJSON(url, callback) {
+        var request = new XMLHttpRequest();
+        request.open("GET", url);
+        request.onload = function() {
+            if (request.status == 200 || request.status == 0) {
+                callback(JSON.parse(request.responseText));
+            }
+        };
+        request.send();
+    }
+
+    function searchPrefix(query) {
+        return query.replace(/[^a-z0-9]/g, "_");
+    }
+
+    // Calls back with every shard that may hold symbols starting with query:
+    // those whose prefix starts with the query, and those whose prefix the
+    // query starts with, which hold the names too short to split further
+    function loadShards(query, callback) {
+        var prefix = searchPrefix(query);
+        var names = [ ];
+        for (var name in manifest.shards) {
+            if (name.indexOf(prefix) == 0 || prefix.indexOf(name) == 0) {
+                names.push(name);
+            }
+        }
+
+        var pending = names.length;
+        if (pending == 0) {
+            callback([ ]);
+            return;
+        }
+
+        names.forEach(function(name) {
+            if (name in shards) {
+                if (--pending == 0) {
+                    callback(names.map(function(name) { return shards[name]; }));
+                }
+                return;
+            }
+
+            getJSON("search/shard-" + name + ".json", function(entries) {
+                shards[name] = entries;
+                if (--pending == 0) {
+                    callback(names.map(function(name) { return shards[name]; }));
+                }
+            });
+        });
+    }
+
+    function render(results, element, total) {
+        element.innerHTML = "";
+
+        results.forEach(function(entry) {
+            var link = document.createElement("a");
+            link.href = entry[3] + "#" + entry[5];
+            link.textContent = entry[1] + " (" + entry[2] + ", " + entry[3] + ":" + entry[4] + ")";
+            element.appendChild(link);
+            element.appendChild(document.createElement("br"));
+        });
+
+        if (total > results.length) {
+            element.appendChild(document.createTextNode((total - results.length) + " more ..."));
+        }
+    }
+
+    function search(query, element) {
+        query = query.toLowerCase();
+        if (query.length == 0) {
+            element.innerHTML = "";
+            return;
+        }
+
+        loadShards(query, function(loaded) {
+            var results = [ ];
+            var total = 0;
+            var seen = { };
+
+            loaded.forEach(function(entries) {
+                entries.forEach(function(entry) {
+                    // Methods are listed under both their name and type::name
+                    var key = entry[3] + ":" + entry[4] + ":" + entry[1];
+                    if (entry[0].indexOf(query) == 0 && !(key in seen)) {
+                        seen[key] = true;
+                        total++;
+                        if (results.length < maximumResults) {
+                            results.push(entry);
+                        }
+                    }
+                });
+            });
+
+            render(results, element, total);
+        });
+    }
+
+    document.addEventListener("DOMContentLoaded", function() {
+        var input = document.getElementById("search");
+        var element = document.getElementById("search-results");
+
+        getJSON("search/shards.json", function(document) {
+            manifest = document;
+            input.disabled = false;
+            input.addEventListener("input", function() {
+                search(input.value, element);
+            });
+        });
+    });
+})();
@@ -0,0 +1,188 @@
+"""
+    diagnostics.py
+
+    Structured diagnostics produced by the analysis stages, along with the
+    sinks that write them out as text, JSON Lines or SARIF.
+"""
+
+import sys
+import json
+
+ERROR = "error"
+WARNING = "warning"
+NOTE = "note"
+
+SEVERITIES = [ ERROR, WARNING, NOTE ]
+
+
+class Diagnostic(object):
+    """
+        Class representing a single problem found in the analyzed scripts.
+        The entity is the lowercased name of the function or datablock the
+        diagnostic is about, if any.
+    """
+    __slots__ = ("code", "severity", "message", "filepath", "line", "entity")
+
+    def __init__(self, code, severity, message, filepath=None, line=None, entity=None):
+        self.code = code
+        self.severity = severity
+        self.message = message
+        self.filepath = filepath
+        self.line = line
+        self.entity = entity
+
+    def key(self):
+        return (self.code, self.filepath, self.line, self.entity, self.message)
+
+    def to_dict(self):
+        return { "code": self.code, "severity": self.severity, "message": self.message, "file": self.filepath,
+        "line": self.line, "entity": self.entity }
+
+    def __repr__(self):
+        return "Diagnostic(%s, %s:%s)" % (self.code, self.filepath, self.line)
+
+class DiagnosticCollector(object):
+    """
+        Class representing the diagnostics recorded during a run. Identical
+        diagnostics are only kept once and diagnostics whose code is
+        suppressed are counted but not stored.
+    """
+    diagnostics = None
+    suppressed = None
+    suppressed_count = None
+
+    _seen = None
+
+    def __init__(self, suppressed=None):
+        self.diagnostics = [ ]
+        self.suppressed = set(suppressed or [ ])
+        self.suppressed_count = 0
+        self._seen = set()
+
+    def __iter__(self):
+        return iter(self.diagnostics)
+
+    def __len__(self):
+        return len(self.diagnostics)
+
+    def discard(self, predicate):
+        """
+            Removes every diagnostic the given predicate returns True for, so
+            it can be reported again, and returns the removed diagnostics.
+        """
+        kept = [ ]
+        removed = [ ]
+        for diagnostic in self.diagnostics:
+            if (predicate(diagnostic)):
+                removed.append(diagnostic)
+                self._seen.discard(diagnostic.key())
+            else:
+                kept.append(diagnostic)
+
+        self.diagnostics = kept
+        return removed
+
+    def report(self, code, severity, message, filepath=None, line=None, entity=None):
+        if (code in self.suppressed):
+            self.suppressed_count += 1
+            return None
+
+        diagnostic = Diagnostic(code, severity, message, filepath, line, entity)
+
+        key = diagnostic.key()
+        if (key in self._seen):
+            return None
+        self._seen.add(key)
+
+        self.diagnostics.append(diagnostic)
+        return diagnostic
+
+    def error(self, code, message, filepath=None, line=None, entity=None):
+        return self.report(code, ERROR, message, filepath, line, entity)
+
+    def warning(self, code, message, filepath=None, line=None, entity=None):
+        return self.report(code, WARNING, message, filepath, line, entity)
+
+    def note(self, code, message, filepath=None, line=None, entity=None):
+        return self.report(code, NOTE, message, filepath, line, entity)
+
+    def counts(self):
+        """
+            Returns a dictionary mapping each severity to its diagnostic count.
+        """
+        result = dict((severity, 0) for severity in SEVERITIES)
+        for diagnostic in self.diagnostics:
+            result[diagnostic.severity] += 1
+        return result
+
+class TextSink(object):
+    """
+        Writes diagnostics in the familiar "file:line: severity: message"
+        format.
+    """
+    def render(self, diagnostics):
+        lines = [ ]
+        for diagnostic in diagnostics:
+            location = diagnostic.filepath or "<unknown>"
+            if (diagnostic.line is not None):
+                location = "%s:%u" % (location, diagnostic.line)
+
+            lines.append("%s: %s: %s [%s]\n" % (location, diagnostic.severity, diagnostic.message, diagnostic.code))
+        return "".join(lines)
+
+class JSONLinesSink(object):
+    """
+        Writes one JSON object per diagnostic per line.
+    """
+    def render(self, diagnostics):
+        lines = [ ]
+        for diagnostic in diagnostics:
+            lines.append(json.dumps(diagnostic.to_dict(), sort_keys=True))
+            lines.append("\n")
+        return "".join(lines)
+
+class SARIFSink(object):
+    """
+        Writes a SARIF 2.1.0 log that code review tools can ingest.
+    """
+    def render(self, diagnostics):
+        rules = [ ]
+        rule_indices = { }
+        results = [ ]
+
+        for diagnostic in diagnostics:
+            if (diagnostic.code not in rule_indices):
+                rule_indices[diagnostic.code] = len(rules)
+                rules.append({ "id": diagnostic.code })
+
+            result = { "ruleId": diagnostic.code, "ruleIndex": rule_indices[diagnostic.code], "level": diagnostic.severity,
+            "message": { "text": diagnostic.message } }
+
+            if (diagnostic.filepath is not None):
+                location = { "artifactLocation": { "uri": diagnostic.filepath } }
+                if (diagnostic.line is not None):
+                    location["region"] = { "startLine": diagnostic.line }
+                result["locations"] = [ { "physicalLocation": location } ]
+
+            results.append(result)
+
+        log = { "version": "2.1.0", "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+        "runs": [ { "tool": { "driver": { "name": "TSScraper", "rules": rules } }, "results": results } ] }
+
+        return json.dumps(log, indent=2) + "\n"
+
+SINKS = { "text": TextSink, "jsonl": JSONLinesSink, "sarif": SARIFSink }
+
+def write_diagnostics(diagnostics, format="text", path=None):
+    """
+        Renders the given diagnostics with the named sink and writes them in a
+        single buffered write, either to the given path or to stdout.
+    """
+    output = SINKS[format]().render(diagnostics)
+
+    if (path is None):
+        sys.stdout.write(output)
+        sys.stdout.flush()
+    else:
+        with open(path, "w") as handle:
+            handle.write(output)
@@ -0,0 +1,175 @@
+"""
+    discovery.py
+
+    Finds the script files below a directory tree. The tree is walked with
+    os.scandir, optionally across a thread pool, without ever changing the
+    working directory, so discovery is safe to run from any thread.
+"""
+
+import os
+import os.path
+import fnmatch
+import concurrent.futures
+
+# Extensions that are always scanned, and others that hold TorqueScript as
+# well: missions, GUI definitions and overlays
+DEFAULT_EXTENSIONS = [ ".cs" ]
+SCRIPT_EXTENSIONS = [ ".cs", ".mis", ".gui", ".ovl" ]
+
+# Directories scanned at once by a parallel walk
+DEFAULT_THREADS = 4
+
+
+class DiscoveredFile(object):
+    """
+        Class representing a script file found by discovery. path is the
+        real absolute path, relative_path is relative to the walked directory
+        with "/" separators. The modification time and size are only set when
+        they were asked for.
+    """
+    __slots__ = ("path", "relative_path", "mtime_ns", "size")
+
+    def __init__(self, path, relative_path, mtime_ns=None, size=None):
+        self.path = path
+        self.relative_path = relative_path
+        self.mtime_ns = mtime_ns
+        self.size = size
+
+    def __repr__(self):
+        return "DiscoveredFile(%s)" % self.relative_path
+
+class FileDiscovery(object):
+    """
+        Class representing the rules for which files below a directory are
+        scripts: their extensions, plus optional include and exclude glob
+        patterns matched case insensitively against the "/" separated path
+        relative to the walked directory. A file must match an include
+        pattern, if there are any, and no exclude pattern; directories that
+        match an exclude pattern are not descended into.
+
+        Files reachable through several names, by symbolic or hard links, are
+        only reported once, under the first of their relative paths in case
+        insensitive sorted order. Symbolic links to directories are not followed.
+    """
+    extensions = None
+    include = None
+    exclude = None
+    threads = None
+
+    def __init__(self, extensions=None, include=None, exclude=None, threads=DEFAULT_THREADS):
+        self.extensions = frozenset([extension.lower() for extension in (extensions or DEFAULT_EXTENSIONS)])
+        self.include = [pattern.lower() for pattern in (include or [ ])]
+        self.exclude = [pattern.lower() for pattern in (exclude or [ ])]
+        self.threads = threads
+
+    def _excluded(self, relative_path):
+        relative_path = relative_path.lower()
+        for pattern in self.exclude:
+            if (fnmatch.fnmatchcase(relative_path, pattern)):
+                return True
+        return False
+
+    def _included(self, relative_path):
+        if (len(self.include) == 0):
+            return True
+
+        relative_path = relative_path.lower()
+        for pattern in self.include:
+            if (fnmatch.fnmatchcase(relative_path, pattern)):
+                return True
+        return False
+
+    def _scan(self, directory, relative_directory, device, stat):
+        """
+            Lists a single directory. Returns the (inode key, file) pairs of
+            its script files and the (path, relative path, device) triples of
+            its subdirectories.
+        """
+        files = [ ]
+        subdirectories = [ ]
+
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            return (files, subdirectories)
+
+        with entries:
+            for entry in entries:
+                relative_path = relative_directory + entry.name
+
+                try:
+                    if (entry.is_dir(follow_symlinks=False)):
+                        if (not self._excluded(relative_path)):
+                            # Only mount points change the device, so one
+                            # stat per directory is enough for inode keys
+                            subdirectories.append((entry.path, relative_path + "/", entry.stat(follow_symlinks=False).st_dev))
+                        continue
+
+                    name, extension = os.path.splitext(entry.name)
+                    if (extension.lower() not in self.extensions):
+                        continue
+
+                    if (not self._included(relative_path) or self._excluded(relative_path)):
+                        continue
+
+                    # Free for anything but symbolic links, whose target is
+                    # stat()ed once and cached by the entry
+                    if (not entry.is_file()):
+                        continue
+
+                    symlink = entry.is_symlink()
+                    information = None
+                    if (symlink or stat):
+                        information = entry.stat()
+                        key = (information.st_dev, information.st_ino)
+                    else:
+                        key = (device, entry.inode())
+                except OSError:
+                    # Dangling links and files removed while we walk
+                    continue
+
+                path = os.path.realpath(entry.path) if symlink else entry.path
+                file = DiscoveredFile(path, relative_path)
+                if (information is not None):
+                    file.mtime_ns = information.st_mtime_ns
+                    file.size = information.st_size
+                files.append((key, file))
+
+        return (files, subdirectories)
+
+    def find(self, directory, stat=False):
+        """
+            Returns every script file below the given directory as a list of
+            DiscoveredFile sorted case insensitively by relative path. With stat, each also has
+            its modification time and size.
+        """
+        root = os.path.realpath(directory)
+        found = [ ]
+
+        if (self.threads is None or self.threads <= 1):
+            pending = [ (root, "", os.stat(root).st_dev) ]
+            while (len(pending) != 0):
+                files, subdirectories = self._scan(*pending.pop(), stat=stat)
+                found += files
+                pending += subdirectories
+        else:
+            # Directories are listed as soon as their parent was
+            with concurrent.futures.ThreadPoolExecutor(self.threads) as executor:
+                futures = set([ executor.submit(self._scan, root, "", os.stat(root).st_dev, stat=stat) ])
+                while (len(futures) != 0):
+                    done, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        files, subdirectories = future.result()
+                        found += files
+                        for subdirectory in subdirectories:
+                            futures.add(executor.submit(self._scan, *subdirectory, stat=stat))
+
+        found.sort(key=lambda pair: pair[1].relative_path.lower())
+
+        result = [ ]
+        seen = set()
+        for key, file in found:
+            if (key not in seen):
+                seen.add(key)
+                result.append(file)
+        return result
@@ -7,7 +7,7 @@ import os.path
 class Exporter(object):
     data = None
 
-    def __init__(self, data):
+    def __init__(self, data, target_directory, options=None, pool=None):
         self.data = data
 
     def write(self, directory):        
@@ -4,76 +4,351 @@ import sys
 import importlib
 import os.path
 import shutil
+import functools
+import hashlib
+import json
+import string
+
+import workers
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# Written to the output directory so later exports only touch pages whose
+# inputs changed. Bump MANIFEST_VERSION when the page hashing changes.
+MANIFEST_NAME = ".tsscraper-manifest.json"
+MANIFEST_VERSION = 2
+
+# Files listed per index page
+INDEX_PAGE_SIZE = 500
+
+# Symbols are sharded into search/shard-<prefix>.json by the first characters
+# of their lowercased name, so the browser only loads the shards a query needs.
+# A shard holding more than SEARCH_SHARD_SIZE symbols is split by one more
+# character, as long as the names in it are that long.
+SEARCH_PREFIX_LENGTH = 2
+SEARCH_SHARD_SIZE = 1000
+SEARCH_CHARACTERS = string.ascii_lowercase + string.digits
+
+# Compiled template environments of this process, by template and bytecode
+# cache directory
+_environments = { }
+
+def get_environment(template_directory=DATA_DIRECTORY, bytecode_cache_directory=None):
+    """
+        Returns the jinja2 environment for the given template directory,
+        creating it on first use in this process. Templates are compiled once
+        per environment; with a bytecode cache directory the compiled code is
+        also kept across runs.
+    """
+    key = (template_directory, bytecode_cache_directory)
+    if (key not in _environments):
+        import jinja2
+
+        bytecode_cache = None
+        if (bytecode_cache_directory is not None):
+            if (not os.path.isdir(bytecode_cache_directory)):
+                os.makedirs(bytecode_cache_directory)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_directory)
+
+        _environments[key] = jinja2.Environment(loader=jinja2.FileSystemLoader(template_directory), bytecode_cache=bytecode_cache)
+    return _environments[key]
+
+def render_pages(template_directory, bytecode_cache_directory, pages):
+    """
+        Renders and writes a chunk of (file entry, output path) pages. This
+        runs in the worker processes, each of which compiles the template
+        once.
+    """
+    template = get_environment(template_directory, bytecode_cache_directory).get_template("filetempl.html")
+
+    written = [ ]
+    for file, output_path in pages:
+        with open(output_path, "w") as handle:
+            handle.write(template.render(file=file))
+        written.append(output_path)
+    return written
+
+def hash_directory(directory):
+    """
+        Returns a hash over the names and contents of every file below the
+        given directory.
+    """
+    digest = hashlib.sha1()
+    for root, dirs, files in sorted(os.walk(directory)):
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            digest.update(os.path.relpath(path, directory).encode("utf-8"))
+            with open(path, "rb") as handle:
+                digest.update(handle.read())
+    return digest.hexdigest()
+
+def hash_page(file, template_hash):
+    """
+        Returns a hash over everything the file template renders for the
+        given file entry.
+    """
+    datablocks = [(datablock.name, datablock.line, list(datablock.properties.items())) for datablock in file.datablocks]
+    global_functions = [(function.name, function.line, function.parameters) for function in file.global_functions]
+    bound_functions = [(type, [(function.name, function.line, function.parameters) for function in file.bound_functions[type]]) for type in file.bound_functions]
+
+    digest = hashlib.sha1(template_hash.encode("utf-8"))
+    digest.update(repr((file.mod_path, datablocks, global_functions, bound_functions)).encode("utf-8"))
+    return digest.hexdigest()
+
+def search_prefix(name, length=SEARCH_PREFIX_LENGTH):
+    prefix = name[:length].lower()
+    return "".join([character if character in SEARCH_CHARACTERS else "_" for character in prefix])
+
+def split_search_shards(entries):
+    """
+        Returns a dictionary mapping each search prefix to the entries whose
+        search name starts with it and with no longer prefix in the result.
+        Shards larger than SEARCH_SHARD_SIZE are split on the next character
+        of the names; names no longer than the prefix stay in its shard.
+    """
+    pending = { }
+    for entry in entries:
+        pending.setdefault(search_prefix(entry[0]), []).append(entry)
+
+    shards = { }
+    while (len(pending) != 0):
+        prefix, entries = pending.popitem()
+        if (len(entries) <= SEARCH_SHARD_SIZE):
+            shards.setdefault(prefix, []).extend(entries)
+            continue
+
+        length = len(prefix) + 1
+        for entry in entries:
+            if (len(entry[0]) < length):
+                shards.setdefault(prefix, []).append(entry)
+            else:
+                pending.setdefault(search_prefix(entry[0], length), []).append(entry)
+
+    return shards
+
+def build_search_index(files):
+    """
+        Returns a dictionary mapping each search prefix to its shard: a list of
+        [search name, display name, kind, page, line, anchor] entries sorted
+        by search name. Kind is "datablock", "function" or "method"; bound
+        functions are found both by their own name and as type::name.
+    """
+    entries = [ ]
+    for file in files:
+        if (file.web_path is None):
+            continue
+
+        for datablock in file.datablocks:
+            entries.append([datablock.name.lower(), datablock.name, "datablock", file.web_path, datablock.line, datablock.name])
+
+        for function in file.global_functions:
+            entries.append([function.name.lower(), function.name, "function", file.web_path, function.line, function.name])
+
+        for type in file.bound_functions:
+            for function in file.bound_functions[type]:
+                display_name = "%s::%s" % (type, function.name)
+                entries.append([function.name.lower(), display_name, "method", file.web_path, function.line, "%s-functions" % type])
+                entries.append([display_name.lower(), display_name, "method", file.web_path, function.line, "%s-functions" % type])
+
+    shards = split_search_shards(entries)
+    for prefix in shards:
+        shards[prefix].sort()
+    return shards
+
+class Manifest(object):
+    """
+        Class representing the hashes of the pages in an output directory as
+        of the previous export. A manifest written by a different version or
+        with different templates is treated as empty.
+    """
+    path = None
+    template_hash = None
+    pages = None
+    outputs = None
+    bootstrap = None
+
+    def __init__(self, directory, template_hash):
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.template_hash = template_hash
+        self.pages = { }
+        self.outputs = { }
+
+        try:
+            with open(self.path, "r") as handle:
+                document = json.load(handle)
+        except (IOError, OSError, ValueError):
+            return
+
+        if (document.get("version") != MANIFEST_VERSION or document.get("template") != template_hash):
+            return
+
+        self.pages = document.get("pages", { })
+        self.outputs = document.get("outputs", { })
+        self.bootstrap = document.get("bootstrap")
+
+    def save(self):
+        document = { "version": MANIFEST_VERSION, "template": self.template_hash, "pages": self.pages,
+        "outputs": self.outputs, "bootstrap": self.bootstrap }
+
+        temporary_path = "%s.tmp" % self.path
+        with open(temporary_path, "w") as handle:
+            json.dump(document, handle, indent=1, sort_keys=True)
+            handle.write("\n")
+
+        os.replace(temporary_path, self.path)
 
 class Exporter(object):
     data = None
+    target_directory = None
+    options = None
+    pool = None
 
-    def __init__(self, data, target_directory):
+    def __init__(self, data, target_directory, options=None, pool=None):
         self.data = data
         self.target_directory = target_directory
+        self.options = options or { }
+        self.pool = pool
+
+    def get_bytecode_cache_directory(self):
+        if ("template-cache" not in self.options or self.options["template-cache"] is True):
+            return None
+        return self.options["template-cache"]
 
-    def _path_visitor(self, arg, dirname, names):
-        for name in names:
-            mirrored_path = os.path.join(dirname, name)
-            relative_path = os.path.join(arg, mirrored_path.replace(self.target_directory + "/", ""))
+    def _remove_output(self, directory, relative_path):
+        """
+            Deletes a file that is no longer generated, along with any
+            directories that are left empty.
+        """
+        output_path = os.path.join(directory, relative_path)
+        try:
+            os.remove(output_path)
+        except OSError:
+            return
 
+        output_directory = os.path.dirname(output_path)
+        while (os.path.realpath(output_directory) != os.path.realpath(directory)):
             try:
-                if (os.path.isdir(mirrored_path)):
-                    os.mkdir(relative_path)
+                os.rmdir(output_directory)
             except OSError:
-                pass
+                break
+            output_directory = os.path.dirname(output_directory)
 
-    def write(self, directory):
-        import jinja2
+    def _write_output(self, directory, manifest, outputs, relative_path, content):
+        """
+            Writes a generated file unless the previous export already wrote
+            the same content. Returns True if the file was written.
+        """
+        outputs[relative_path] = hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+        output_path = os.path.join(directory, relative_path)
+        if (manifest.outputs.get(relative_path) == outputs[relative_path] and os.path.isfile(output_path)):
+            return False
 
-        # Read the template files first
-        file_template = None
-        with open("data/filetempl.html", "r") as handle:
-            file_template = handle.read()
+        if (not os.path.isdir(os.path.dirname(output_path))):
+            os.makedirs(os.path.dirname(output_path))
 
-        index_template = None
-        with open("data/indextempl.html", "r") as handle:
-            index_template = handle.read()
+        with open(output_path, "w") as handle:
+            handle.write(content)
+        return True
 
-        html_filenames = [ ]
+    def write(self, directory):
+        target_directory = os.path.realpath(self.target_directory)
+        bytecode_cache_directory = self.get_bytecode_cache_directory()
 
-        # Recurse the target directory and recreate its structure
-        os.path.walk(self.target_directory, self._path_visitor, directory)
+        template_hash = hashlib.sha1()
+        with open(os.path.join(DATA_DIRECTORY, "filetempl.html"), "rb") as handle:
+            template_hash.update(handle.read())
+        manifest = Manifest(directory, template_hash.hexdigest())
 
         # For each file entry...
-        script_relative_paths = [ ]
+        pages = [ ]
+        sizes = [ ]
+        page_hashes = { }
+        output_directories = set()
         for file in self.data["files"]:
             if (len(file.global_functions) == 0 and len(file.bound_functions.keys()) == 0 and len(file.datablocks) == 0):
                 continue
 
             # First, we collapse to a file path relative to our output dir
-            # FIXME: Dirty hack to make sure the os.path.join works
-            html_filename = file.path.replace(self.target_directory + "/", "")
-            script_relative = html_filename
-            file.mod_path = html_filename
-            script_relative_paths.append(script_relative)
-
-            # Next, we ensure that the subdirectories exist
-            #html_filename = html_filename.lstrip("./").replace("/", "-")
-            html_filename, oldextension = os.path.splitext(html_filename)
-            html_filename = "%s.html" % html_filename
-            html_filenames.append(html_filename)
-            file.web_path = html_filename
-
-            with open(os.path.join(directory, html_filename), "w") as handle:
-                template = jinja2.Template(file_template)
-                handle.write(template.render(file=file))
-
-        # Dump the index file
-        with open(os.path.join(directory, "index.html"), "w") as handle:
-            template = jinja2.Template(index_template)
-
-            handle.write(template.render(files=self.data["files"]))
-
-        # Puke bootstrap into the directory
+            file.mod_path = os.path.relpath(file.path, target_directory)
+
+            html_filename, oldextension = os.path.splitext(file.mod_path)
+            file.web_path = "%s.html" % html_filename
+
+            # Pages whose inputs are unchanged since the last export are kept
+            output_path = os.path.join(directory, file.web_path)
+            page_hashes[file.web_path] = hash_page(file, manifest.template_hash)
+            if (manifest.pages.get(file.web_path) == page_hashes[file.web_path] and os.path.isfile(output_path)):
+                continue
+
+            output_directories.add(os.path.dirname(output_path))
+            pages.append((file, output_path))
+            sizes.append(os.path.getsize(file.path))
+
+        # Recreate the structure of the target directory from the file list
+        for output_directory in output_directories:
+            if (not os.path.isdir(output_directory)):
+                os.makedirs(output_directory)
+
+        # Render the changed file pages across the worker pool
+        pool = self.pool
+        if (pool is None):
+            pool = workers.WorkerPool(os.cpu_count() or 1)
+
         try:
-            shutil.copytree("data/bootstrap", os.path.join(directory, "bootstrap"))
-        except OSError:
-            pass
+            for output_path in pool.run(functools.partial(render_pages, DATA_DIRECTORY, bytecode_cache_directory), pages, sizes):
+                pass
+        finally:
+            if (pool is not self.pool):
+                pool.close()
+
+        # Pages of files that are gone
+        removed_pages = [web_path for web_path in manifest.pages if web_path not in page_hashes]
+        for web_path in removed_pages:
+            self._remove_output(directory, web_path)
+
+        outputs = { }
+        written_count = 0
+
+        # Dump the index pages, INDEX_PAGE_SIZE files each
+        indexed_files = [file for file in self.data["files"] if file.web_path is not None]
+        indexed_files.sort(key=lambda file: file.mod_path.lower())
+
+        page_count = max((len(indexed_files) + INDEX_PAGE_SIZE - 1) // INDEX_PAGE_SIZE, 1)
+        index_pages = ["index.html"] + ["index-%u.html" % number for number in range(2, page_count + 1)]
+
+        template = get_environment(DATA_DIRECTORY, bytecode_cache_directory).get_template("indextempl.html")
+        for number in range(page_count):
+            page_files = indexed_files[number * INDEX_PAGE_SIZE:(number + 1) * INDEX_PAGE_SIZE]
+            content = template.render(files=page_files, file_count=len(indexed_files), page=number + 1, pages=index_pages)
+            written_count += self._write_output(directory, manifest, outputs, index_pages[number], content)
+
+        # Dump the search index shards and the script that queries them
+        shards = build_search_index(indexed_files)
+        shard_counts = { }
+        for prefix in shards:
+            shard_counts[prefix] = len(shards[prefix])
+            written_count += self._write_output(directory, manifest, outputs, "search/shard-%s.json" % prefix, json.dumps(shards[prefix], separators=(",", ":")))
+
+        written_count += self._write_output(directory, manifest, outputs, "search/shards.json", json.dumps({ "shards": shard_counts }, sort_keys=True, separators=(",", ":")))
+
+        with open(os.path.join(DATA_DIRECTORY, "search.js"), "r") as handle:
+            written_count += self._write_output(directory, manifest, outputs, "search.js", handle.read())
+
+        removed_outputs = [relative_path for relative_path in manifest.outputs if relative_path not in outputs]
+        for relative_path in removed_outputs:
+            self._remove_output(directory, relative_path)
+
+        # Puke bootstrap into the directory, unless it is already there
+        bootstrap_hash = hash_directory(os.path.join(DATA_DIRECTORY, "bootstrap"))
+        if (manifest.bootstrap != bootstrap_hash or not os.path.isdir(os.path.join(directory, "bootstrap"))):
+            shutil.copytree(os.path.join(DATA_DIRECTORY, "bootstrap"), os.path.join(directory, "bootstrap"), dirs_exist_ok=True)
+
+        manifest.pages = page_hashes
+        manifest.outputs = outputs
+        manifest.bootstrap = bootstrap_hash
+        manifest.save()
 
+        print("INFO: Rendered %u pages, %u unchanged, %u removed." % (len(pages), len(page_hashes) - len(pages), len(removed_pages)))
+        print("INFO: Wrote %u of %u index and search files (%u index pages, %u search shards), removed %u." % (written_count, len(outputs), page_count, len(shards), len(removed_outputs)))
         print("Done processing.")
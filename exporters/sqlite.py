@@ -0,0 +1,200 @@
+"""
+    sqlite.py
+
+    Exports the analysis results into a normalized SQLite database with a
+    full text index over every symbol and datablock property, so editor
+    plugins and scripts can query them without re-running the scraper.
+
+    The database is written to <output directory>/tsscraper.db, or to the
+    path given with --database=<file>.
+"""
+
+import os
+import os.path
+import sqlite3
+
+import tsscraper
+
+# Bump whenever the schema changes
+SCHEMA_VERSION = 1
+
+# Rows are inserted with executemany in batches of this many, each batch in
+# its own transaction
+BATCH_SIZE = 20000
+
+SCHEMA = """
+    CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT NOT NULL, mod_path TEXT);
+    CREATE TABLE functions (id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL REFERENCES files(id), name TEXT NOT NULL,
+        type TEXT, line INTEGER, parameter_count INTEGER);
+    CREATE TABLE parameters (function_id INTEGER NOT NULL REFERENCES functions(id), position INTEGER NOT NULL, name TEXT NOT NULL,
+        PRIMARY KEY (function_id, position)) WITHOUT ROWID;
+    CREATE TABLE datablocks (id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL REFERENCES files(id), name TEXT NOT NULL,
+        type TEXT NOT NULL, line INTEGER);
+    CREATE TABLE inheritance (datablock_id INTEGER NOT NULL REFERENCES datablocks(id), position INTEGER NOT NULL, parent TEXT NOT NULL,
+        PRIMARY KEY (datablock_id, position)) WITHOUT ROWID;
+    CREATE TABLE properties (datablock_id INTEGER NOT NULL REFERENCES datablocks(id), name TEXT NOT NULL, value TEXT,
+        number REAL, is_global INTEGER NOT NULL, PRIMARY KEY (datablock_id, name)) WITHOUT ROWID;
+    CREATE TABLE diagnostics (id INTEGER PRIMARY KEY, code TEXT NOT NULL, severity TEXT NOT NULL, message TEXT NOT NULL,
+        file TEXT, line INTEGER, entity TEXT);
+"""
+
+# Created after the bulk load, which is considerably faster than keeping them
+# up to date row by row
+INDEXES = """
+    CREATE UNIQUE INDEX files_path ON files (path);
+    CREATE INDEX functions_name ON functions (name);
+    CREATE INDEX functions_type_name ON functions (type, name);
+    CREATE INDEX functions_file ON functions (file_id);
+    CREATE INDEX datablocks_name ON datablocks (name);
+    CREATE INDEX datablocks_type ON datablocks (type);
+    CREATE INDEX datablocks_file ON datablocks (file_id);
+    CREATE INDEX inheritance_parent ON inheritance (parent);
+    CREATE INDEX properties_name_value ON properties (name, value);
+    CREATE INDEX properties_value ON properties (value);
+    CREATE INDEX diagnostics_file ON diagnostics (file, line);
+    CREATE INDEX diagnostics_entity ON diagnostics (entity);
+"""
+
+def create_search_table(connection):
+    """
+        Creates the full text search table with the best available FTS
+        module. Returns the module name, or None if SQLite was built without
+        full text search.
+    """
+    for module in [ "fts5", "fts4" ]:
+        try:
+            connection.execute("CREATE VIRTUAL TABLE search USING %s (name, kind, type, file, properties)" % module)
+            return module
+        except sqlite3.OperationalError:
+            continue
+    return None
+
+class Exporter(object):
+    data = None
+    target_directory = None
+    options = None
+    pool = None
+
+    def __init__(self, data, target_directory, options=None, pool=None):
+        self.data = data
+        self.target_directory = target_directory
+        self.options = options or { }
+        self.pool = pool
+
+    def get_database_path(self, directory):
+        if ("database" not in self.options or self.options["database"] is True):
+            return os.path.join(directory, "tsscraper.db")
+        return self.options["database"]
+
+    def _insert(self, connection, statement, rows):
+        """
+            Inserts the given rows in batches of BATCH_SIZE, one transaction
+            per batch.
+        """
+        for start in range(0, len(rows), BATCH_SIZE):
+            connection.execute("BEGIN")
+            connection.executemany(statement, rows[start:start + BATCH_SIZE])
+            connection.execute("COMMIT")
+
+    def _rows(self, files):
+        """
+            Walks the results once and returns the row lists for every table.
+            Row ids are assigned here so that child rows can reference them
+            without a round trip per insert.
+        """
+        target_directory = os.path.realpath(self.target_directory)
+
+        rows = { "files": [ ], "functions": [ ], "parameters": [ ], "datablocks": [ ], "inheritance": [ ], "properties": [ ], "search": [ ] }
+        function_id = 0
+        datablock_id = 0
+
+        for file_id, file in enumerate(files, 1):
+            mod_path = os.path.relpath(file.path, target_directory)
+            rows["files"].append((file_id, file.path, mod_path))
+
+            functions = list(file.global_functions)
+            for type in file.bound_functions:
+                functions += file.bound_functions[type]
+
+            for function in functions:
+                function_id += 1
+                rows["functions"].append((function_id, file_id, function.name, function.type, function.line, len(function.parameters)))
+
+                for position, parameter in enumerate(function.parameters):
+                    rows["parameters"].append((function_id, position, parameter))
+
+                if (function.type is None):
+                    rows["search"].append((function.name, "function", None, mod_path, " ".join(function.parameters)))
+                else:
+                    rows["search"].append(("%s::%s" % (function.type, function.name), "method", function.type, mod_path, " ".join(function.parameters)))
+
+            for datablock in file.datablocks:
+                datablock_id += 1
+                rows["datablocks"].append((datablock_id, file_id, datablock.name, datablock.type, datablock.line))
+
+                if (datablock.derived is not None):
+                    for position, parent in enumerate(datablock.derived):
+                        rows["inheritance"].append((datablock_id, position, parent.lower()))
+
+                searchable = [ ]
+                for name in datablock.properties:
+                    value = datablock.properties[name]
+
+                    if (isinstance(value, tsscraper.Global)):
+                        rows["properties"].append((datablock_id, name, value.name, None, 1))
+                    elif (isinstance(value, float)):
+                        rows["properties"].append((datablock_id, name, repr(value), value, 0))
+                    else:
+                        rows["properties"].append((datablock_id, name, str(value), None, 0))
+                    searchable.append("%s=%s" % (name, value))
+
+                rows["search"].append((datablock.name, "datablock", datablock.type, mod_path, " ".join(searchable)))
+
+        return rows
+
+    def write(self, directory):
+        database_path = self.get_database_path(directory)
+
+        # Built next to the destination and swapped in when complete, so
+        # readers never see a half written database
+        temporary_path = "%s.tmp" % database_path
+        if (os.path.exists(temporary_path)):
+            os.remove(temporary_path)
+
+        connection = sqlite3.connect(temporary_path, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode = OFF")
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.executescript(SCHEMA)
+            search_module = create_search_table(connection)
+
+            rows = self._rows(self.data["files"])
+            self._insert(connection, "INSERT INTO files VALUES (?, ?, ?)", rows["files"])
+            self._insert(connection, "INSERT INTO functions VALUES (?, ?, ?, ?, ?, ?)", rows["functions"])
+            self._insert(connection, "INSERT INTO parameters VALUES (?, ?, ?)", rows["parameters"])
+            self._insert(connection, "INSERT INTO datablocks VALUES (?, ?, ?, ?, ?)", rows["datablocks"])
+            self._insert(connection, "INSERT INTO inheritance VALUES (?, ?, ?)", rows["inheritance"])
+            self._insert(connection, "INSERT INTO properties VALUES (?, ?, ?, ?, ?)", rows["properties"])
+
+            diagnostics = [(diagnostic.code, diagnostic.severity, diagnostic.message, diagnostic.filepath, diagnostic.line, diagnostic.entity) for diagnostic in self.data["diagnostics"]]
+            self._insert(connection, "INSERT INTO diagnostics (code, severity, message, file, line, entity) VALUES (?, ?, ?, ?, ?, ?)", diagnostics)
+
+            if (search_module is not None):
+                self._insert(connection, "INSERT INTO search VALUES (?, ?, ?, ?, ?)", rows["search"])
+            else:
+                print("Warning: SQLite has no full text search support, the search table is not created.")
+
+            meta = [ ("schema_version", str(SCHEMA_VERSION)), ("parser_version", str(tsscraper.PARSER_VERSION)),
+            ("target_directory", os.path.realpath(self.target_directory)), ("search_module", search_module or "") ]
+            self._insert(connection, "INSERT INTO meta VALUES (?, ?)", meta)
+
+            connection.executescript(INDEXES)
+            connection.execute("ANALYZE")
+        finally:
+            connection.close()
+
+        os.replace(temporary_path, database_path)
+
+        print("INFO: Wrote %u files, %u functions and %u datablocks to '%s'." % (len(rows["files"]), len(rows["functions"]), len(rows["datablocks"]), database_path))
+        print("Done processing.")
@@ -0,0 +1,353 @@
+"""
+    lexer.py
+
+    Single pass TorqueScript tokenizer and declaration parser. This is the
+    "lexer" parser backend of the scraper: it produces the same FileEntry
+    structure as the regex backend in tsscraper.scrape_file, but runs in time
+    linear to the size of the input and tracks line and column numbers as it
+    goes instead of recounting newlines for every declaration.
+
+    Tokens are parsed as they are produced and keep the raw text they were
+    matched from; only the names and values stored in the FileEntry are ever
+    decoded. Call sites and global variable usages are recorded by the bytes
+    scan in tsscraper, which serves both backends.
+"""
+
+import re
+
+from tsscraper import Function, Datablock, Global, ENCODING, check_deadline
+
+# Token kinds
+COMMENT = "comment"
+STRING = "string"
+TAGGED_STRING = "tagged"
+NUMBER = "number"
+VARIABLE = "variable"
+IDENTIFIER = "identifier"
+OPERATOR = "operator"
+NEWLINE = "newline"
+
+# Every alternative consumes at least one character and none of them can
+# backtrack across a token boundary, so scanning a file is O(n). Unterminated
+# comments and strings simply end at the end of the file or line. Spaces are
+# consumed along with the token that follows them.
+_token_pattern = re.compile(r"""
+    [ \t\r\f\v]*
+    (?:
+        (?P<newline>\n)
+      | (?P<comment>//[^\n]*|/\*[\s\S]*?(?:\*/|\Z))
+      | (?P<string>"(?:[^"\\\n]|\\.)*"?)
+      | (?P<tagged>'(?:[^'\\\n]|\\.)*'?)
+      | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<variable>[%$][A-Za-z_]\w*(?:::\w+)*)
+      | (?P<identifier>[A-Za-z_]\w*)
+      | (?P<operator>::|==|!=|<=|>=|\+=|-=|\*=|/=|%=|&=|\|=|\^=|<<|>>|\+\+|--|&&|\|\||!\$=|\$=|\S)
+    )
+""", re.VERBOSE)
+
+# The same tokens in a mapped or otherwise bytes-like file. Only ASCII is
+# significant to the grammar, so the patterns match the same tokens.
+_token_bytes_pattern = re.compile(_token_pattern.pattern.encode(ENCODING), re.VERBOSE)
+
+# The parse deadline is checked once per this many tokens; it must be a power
+# of two
+DEADLINE_INTERVAL = 4096
+
+
+class Token(object):
+    """
+        Class representing a single lexical token. Lines and columns are one
+        based, matching what the rest of the scraper reports. The text is a
+        slice of the scanned data, bytes for a bytes-like input.
+    """
+    __slots__ = ("kind", "text", "line", "column")
+
+    def __init__(self, kind, text, line, column):
+        self.kind = kind
+        self.text = text
+        self.line = line
+        self.column = column
+
+    def __repr__(self):
+        return "Token(%s, %r, %u:%u)" % (self.kind, self.text, self.line, self.column)
+
+def tokenize(data, deadline=None):
+    """
+        Yields every significant token in the given script text, which may be
+        a string or a bytes-like object such as a memory map. Whitespace and
+        comments are consumed but not emitted.
+    """
+    line = 1
+    line_start = 0
+
+    binary = not isinstance(data, str)
+    pattern = _token_bytes_pattern if binary else _token_pattern
+    newline = b"\n" if binary else "\n"
+
+    for index, match in enumerate(pattern.finditer(data)):
+        if (deadline is not None and (index & (DEADLINE_INTERVAL - 1)) == 0):
+            check_deadline(deadline)
+
+        kind = match.lastgroup
+
+        if (kind == NEWLINE):
+            line += 1
+            line_start = match.end()
+        elif (kind == COMMENT):
+            # Block comments can span lines
+            text = match.group(kind)
+            newlines = text.count(newline)
+            if (newlines != 0):
+                line += newlines
+                line_start = match.start(kind) + text.rfind(newline) + 1
+        else:
+            yield Token(kind, match.group(kind), line, match.start(kind) - line_start + 1)
+
+def _decode(tokens):
+    return b"".join([token.text for token in tokens]).decode(ENCODING)
+
+def _convert_value(tokens):
+    """
+        Converts the tokens making up a datablock property value into the same
+        representation the regex backend produces.
+    """
+    if (len(tokens) == 1):
+        token = tokens[0]
+
+        if (token.kind == VARIABLE and token.text[0:1] == b"$"):
+            return Global(token.text[1:].decode(ENCODING))
+        elif (token.kind == STRING):
+            return token.text[1:token.text.rfind(b"\"")].decode(ENCODING)
+
+    value = _decode(tokens)
+
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+class _Parser(object):
+    """
+        Recursive descent style parser over the token stream of a bytes-like
+        file. It only understands enough of TorqueScript to locate function
+        and datablock declarations; everything else is skipped token by token.
+
+        Tokens are pulled from the stream as they are needed. Only the body of
+        the declaration being parsed is held on to, so that a body that turns
+        out never to be closed can be pushed back and rescanned as top level
+        code. Such a body runs to the end of the file, so each "{" that is
+        left open in it is remembered and later bodies opened by one of them
+        are given up on at once instead of being read to the end again.
+    """
+    _tokens = None
+    _pending = None
+    _unterminated = None
+    _file = None
+
+    def __init__(self, tokens, file):
+        self._tokens = iter(tokens)
+        self._pending = [ ]
+        self._unterminated = set()
+        self._file = file
+
+    def _next(self):
+        if (len(self._pending) != 0):
+            return self._pending.pop()
+        return next(self._tokens, None)
+
+    def _peek(self):
+        token = self._next()
+        if (token is not None):
+            self._pending.append(token)
+        return token
+
+    def _accept(self, text):
+        token = self._next()
+        if (token is not None and token.text != text):
+            self._pending.append(token)
+            return None
+        return token
+
+    def _push_back(self, opening, body):
+        """
+            Returns the tokens of a body opened by the given "{" that reached
+            the end of the file to the stream, after remembering every "{" in
+            it that is never closed.
+        """
+        opened = [ opening ]
+        for token in body:
+            if (token.text == b"{"):
+                opened.append(token)
+            elif (token.text == b"}" and len(opened) != 0):
+                opened.pop()
+
+        self._unterminated.update(opened)
+        self._pending.extend(reversed(body))
+
+    def _open_body(self):
+        """
+            Consumes the "{" opening a body and returns it, or returns None
+            when the next token is not one or opens a body that is known to
+            run to the end of the file.
+        """
+        token = self._accept(b"{")
+        if (token is not None and token in self._unterminated):
+            return None
+        return token
+
+    def parse(self):
+        while (True):
+            token = self._next()
+            if (token is None):
+                return
+
+            if (token.kind != IDENTIFIER):
+                continue
+
+            keyword = token.text.lower()
+            if (keyword == b"function"):
+                self._parse_function(token)
+            elif (keyword == b"datablock"):
+                self._parse_datablock(token)
+
+    def _parse_function(self, keyword):
+        name = self._peek()
+        if (name is None or name.kind != IDENTIFIER):
+            return
+        self._next()
+
+        type = None
+        if (self._accept(b"::") is not None):
+            method = self._peek()
+            if (method is None or method.kind != IDENTIFIER):
+                return
+            self._next()
+
+            type = name.text.decode(ENCODING).lower()
+            name = method
+
+        if (self._accept(b"(") is None):
+            return
+
+        parameters = [ ]
+        while (True):
+            token = self._next()
+            if (token is None):
+                return
+
+            if (token.text == b")"):
+                break
+            elif (token.text != b","):
+                parameters.append(token.text.decode(ENCODING))
+
+        function = Function(name.text.decode(ENCODING).lower(), type, parameters, self._file.path, keyword.line)
+
+        if (type is None):
+            self._file.global_functions.append(function)
+        else:
+            self._file.bound_functions.setdefault(type, [])
+            self._file.bound_functions[type].append(function)
+
+        # Skip over the body
+        opening = self._open_body()
+        if (opening is None):
+            return
+
+        body = [ ]
+        depth = 1
+        while (depth != 0):
+            token = self._next()
+            if (token is None):
+                # Unterminated body: scan the rest of the file as top level
+                # code
+                self._push_back(opening, body)
+                return
+            body.append(token)
+
+            if (token.text == b"{"):
+                depth += 1
+            elif (token.text == b"}"):
+                depth -= 1
+
+    def _parse_datablock(self, keyword):
+        type = self._peek()
+        if (type is None or type.kind != IDENTIFIER):
+            return
+        self._next()
+
+        if (self._accept(b"(") is None):
+            return
+
+        name_tokens = [ ]
+        while (True):
+            token = self._peek()
+            if (token is None or token.text == b"{" or token.text == b";"):
+                return
+            self._next()
+
+            if (token.text == b")"):
+                break
+            name_tokens.append(token)
+
+        inherited = None
+        if (self._accept(b":") is not None):
+            parent = self._peek()
+            if (parent is None or parent.kind != IDENTIFIER):
+                return
+            self._next()
+            inherited = [ parent.text.decode(ENCODING).lower() ]
+
+        opening = self._open_body()
+        if (opening is None):
+            return
+
+        properties = { }
+        body = [ ]
+        depth = 1
+        statement = [ ]
+        while (depth != 0):
+            token = self._next()
+            if (token is None):
+                # Unterminated datablock: drop it but keep scanning the rest
+                # of the file for declarations
+                self._push_back(opening, body)
+                return
+            body.append(token)
+
+            if (token.text == b"{"):
+                depth += 1
+            elif (token.text == b"}"):
+                depth -= 1
+                statement = [ ]
+            elif (token.text == b";"):
+                self._parse_property(statement, properties)
+                statement = [ ]
+            elif (depth == 1):
+                statement.append(token)
+
+        self._accept(b";")
+
+        name = _decode(name_tokens).lower()
+        self._file.datablocks.append(Datablock(name, type.text.decode(ENCODING).lower(), properties, self._file.path, keyword.line, inherited))
+
+    def _parse_property(self, statement, properties):
+        for index, token in enumerate(statement):
+            if (token.text == b"="):
+                break
+        else:
+            return
+
+        if (index == 0 or index == len(statement) - 1):
+            return
+
+        key = _decode(statement[0:index]).lower()
+        properties[key] = _convert_value(statement[index + 1:])
+
+def scan(data, file, deadline=None):
+    """
+        Parses the given script bytes, appending every function and datablock
+        declaration found to the given FileEntry. Raises ParseTimeout once
+        the given time.perf_counter() deadline passes.
+    """
+    _Parser(tokenize(data, deadline), file).parse()
+    return file
@@ -10,10 +10,18 @@ import multiprocessing
 import importlib
 import os.path
 import timeit
-
-import cProfile
+import time
+import json
 
 import tsscraper
+import cache
+import snapshot
+import rules
+import diagnostics
+import discovery
+import metrics
+import watch
+import server
 
 class Application(object):
     thread_count = 8
@@ -23,25 +31,153 @@ class Application(object):
     target_directory = None
     target_exporter = None
 
+    options = None
+    rule_set = None
+
     def print_usage(self):
-        print("Usage: '%s <exporter> <output directory> <target directories...>'" % sys.argv[0])
+        print("Usage: '%s [options] <exporter> <output directory> <target directories...>'" % sys.argv[0])
         print("Or: '%s exporters' for a list of known exporters." % sys.argv[0])
+        print("Or: '%s [options] snapshot <base directory> <snapshot file>' to prebuild a base index." % sys.argv[0])
+        print("Or: '%s [options] watch <target directory>' to re-check the target whenever a script changes." % sys.argv[0])
+        print("Or: '%s [options] serve <target directory>' to answer JSON queries over stdio, or on --port." % sys.argv[0])
+        print("Options:")
+        print("\t--extensions=<exts>  Comma separated extensions to scan besides .cs, such as .mis,.gui,.ovl.")
+        print("\t--include=<globs>  Only scan files whose path relative to the target matches one of these comma separated globs.")
+        print("\t--exclude=<globs>  Skip files and directories whose relative path matches one of these comma separated globs.")
+        print("\t--discovery-threads=<count>  Threads walking the target directory (default: %u)." % discovery.DEFAULT_THREADS)
+        print("\t--cache=<file>     Persist parse results to <file> so unchanged scripts are not re-scraped.")
+        print("\t--cache-hash       Validate cache entries by content hash when modification times differ.")
+        print("\t--base-snapshot=<file>  Load base results from a snapshot instead of scanning 'base'.")
+        print("\t--rules=<files>    Comma separated rule files to load on top of data/rules.json.")
+        print("\t--diagnostics=<format>  Diagnostic output format: %s (default: text)." % ", ".join(sorted(diagnostics.SINKS.keys())))
+        print("\t--diagnostics-output=<file>  Write diagnostics to <file> instead of stdout.")
+        print("\t--suppress=<codes> Comma separated diagnostic codes to suppress.")
+        print("\t--metrics=<file>   Write per stage timings, counters and peak memory growth to <file> as JSON.")
+        print("\t--profile=<stages> Comma separated stages to run under cProfile (discovery, parse, declaration, inheritance, reference, export).")
+        print("\t--profile-output=<file>  Where to dump profiles (default: tsscraper.prof in the output directory).")
+        print("\t--columnar         Build a NumPy backed property store and run numeric checks as vector operations.")
+        print("\t--parser=<backend> Parse stage implementation to use: %s (default: regex)." % ", ".join(tsscraper.PARSER_BACKENDS))
+        print("\t--usages          Record calls and global variable usages, and report unreachable functions and globals no script sets.")
+        print("\t--parse-timeout=<secs>  Skip and report scripts that take longer than this to parse, 0 for no limit (default: %g)." % tsscraper.PARSE_TIMEOUT)
+        print("\t--template-cache=<dir>  Keep compiled HTML exporter templates in <dir> across runs.")
+        print("\t--database=<file>  Where the sqlite exporter writes its database (default: <output directory>/tsscraper.db).")
+        print("\t--port=<port>      Serve queries on this localhost TCP port instead of stdio.")
+        print("\t--interval=<secs>  How often watch polls for changes when inotify is unavailable (default: 0.5).")
+
+    def parse_options(self, arguments):
+        """
+            Splits the command line into positional arguments and '--name' or
+            '--name=value' options.
+        """
+        positional = [ ]
+        options = { }
+
+        for argument in arguments:
+            if (argument[0:2] == "--"):
+                name, separator, value = argument[2:].partition("=")
+                options[name] = value if separator != "" else True
+            else:
+                positional.append(argument)
+
+        return positional, options
+
+    def get_parser_backend(self):
+        if ("parser" not in self.options or self.options["parser"] is True):
+            return "regex"
+        return self.options["parser"]
+
+    def get_parse_timeout(self):
+        timeout = float(self.get_option("parse-timeout", tsscraper.PARSE_TIMEOUT))
+        if (timeout <= 0):
+            return None
+        return timeout
+
+    def create_discovery(self):
+        extensions = list(discovery.DEFAULT_EXTENSIONS)
+        if (self.get_option("extensions") is not None):
+            extensions += self.get_option("extensions").split(",")
+
+        include = [ ]
+        if (self.get_option("include") is not None):
+            include = self.get_option("include").split(",")
+
+        exclude = [ ]
+        if (self.get_option("exclude") is not None):
+            exclude = self.get_option("exclude").split(",")
+
+        return discovery.FileDiscovery(extensions, include, exclude, int(self.get_option("discovery-threads", discovery.DEFAULT_THREADS)))
+
+    def load_rules(self):
+        paths = [ ]
+        if ("rules" in self.options and self.options["rules"] is not True):
+            paths = self.options["rules"].split(",")
+
+        return rules.load_rules(paths)
+
+    def get_option(self, name, default=None):
+        if (name not in self.options or self.options[name] is True):
+            return default
+        return self.options[name]
+
+    def create_diagnostics(self):
+        suppressed = [ ]
+        if (self.get_option("suppress") is not None):
+            suppressed = self.get_option("suppress").split(",")
+
+        return diagnostics.DiagnosticCollector(suppressed)
+
+    def write_diagnostics(self, collector):
+        diagnostics.write_diagnostics(collector, self.get_option("diagnostics", "text"), self.get_option("diagnostics-output"))
+
+        counts = collector.counts()
+        print("INFO: %u errors, %u warnings, %u notes (%u suppressed)." % (counts[diagnostics.ERROR], counts[diagnostics.WARNING], counts[diagnostics.NOTE], collector.suppressed_count))
+
+    def create_metrics(self):
+        profile_stages = [ ]
+        if (self.get_option("profile") is not None):
+            profile_stages = self.get_option("profile").split(",")
+
+        # Profiles go next to the rest of the output rather than into
+        # whatever the working directory happens to be
+        return metrics.Metrics(profile_stages, self.get_option("profile-output", os.path.join(self.output_directory, "tsscraper.prof")))
+
+    def write_metrics(self, run_metrics):
+        for path in run_metrics["target"].write_profiles():
+            print("INFO: Wrote profile '%s'." % path)
+
+        if (self.get_option("metrics") is None):
+            return
+
+        report = { }
+        for name in run_metrics:
+            report[name] = run_metrics[name].report()
+
+        with open(self.get_option("metrics"), "w") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+        print("INFO: Wrote metrics '%s'." % self.get_option("metrics"))
+
+    def create_cache(self):
+        if ("cache" not in self.options or self.options["cache"] is True):
+            return None
+
+        return cache.ParseCache(self.options["cache"], tsscraper.TSScraper.parse_fingerprint(self.get_parser_backend()), "cache-hash" in self.options)
 
     def get_available_exporters(self):
         exporters = { }
 
-        for root, dirs, files in os.walk("exporters"):
-            for filename in files:
-                module_name, extension = os.path.splitext(filename)
+        # Only the modules directly in exporters/, not their compiled copies
+        for filename in os.listdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), "exporters")):
+            module_name, extension = os.path.splitext(filename)
 
-                if (module_name == "__init__"):
-                    continue
+            if (extension != ".py" or module_name == "__init__"):
+                continue
 
-                try:
-                    module = importlib.import_module('exporters.%s' % (module_name))
-                    exporters[module_name] = module
-                except ImportError as e:
-                    print(e)
+            try:
+                module = importlib.import_module('exporters.%s' % (module_name))
+                exporters[module_name] = module
+            except ImportError as e:
+                print(e)
 
         return exporters
 
@@ -50,28 +186,192 @@ class Application(object):
             The main entry point of the application. This is equivalent to
             the main() method in C and C++.
         """
-        if (len(sys.argv) < 2):
+        arguments, self.options = self.parse_options(sys.argv[1:])
+
+        if (len(arguments) < 1):
            self.print_usage()
            return
 
         exporters = self.get_available_exporters()
 
-        if (sys.argv[1] == "exporters"):
+        if (arguments[0] == "exporters"):
             print("Available Exporters: ")
 
             for exporter in exporters:
                 print("\t- %s" % exporter)
             print("\t- None")
             return
-        elif(len(sys.argv) < 4):
+
+        if (not self.validate_options()):
+            return
+
+        if (arguments[0] == "snapshot"):
+            if (len(arguments) < 3):
+                self.print_usage()
+                return
+
+            self.build_snapshot(arguments[1], arguments[2])
+            return
+        elif (arguments[0] == "watch"):
+            if (len(arguments) < 2):
+                self.print_usage()
+                return
+
+            self.watch(arguments[1])
+            return
+        elif (arguments[0] == "serve"):
+            if (len(arguments) < 2):
+                self.print_usage()
+                return
+
+            self.serve(arguments[1])
+            return
+        elif(len(arguments) < 3):
             self.print_usage()
             return
 
-        self.target_directory = sys.argv[3]
-        self.output_directory = sys.argv[2]
-        self.target_exporter = sys.argv[1]
+        self.target_directory = arguments[2]
+        self.output_directory = arguments[1]
+        self.target_exporter = arguments[0]
         self.run()
 
+    def validate_options(self):
+        """
+            Checks the options every command shares and loads the rules,
+            printing what is wrong and returning False if anything is.
+        """
+        if (self.get_parser_backend() not in tsscraper.PARSER_BACKENDS):
+            print("Error: No such parser backend '%s'." % self.get_parser_backend())
+            self.print_usage()
+            return False
+
+        if (self.get_option("diagnostics", "text") not in diagnostics.SINKS):
+            print("Error: No such diagnostics format '%s'." % self.get_option("diagnostics"))
+            self.print_usage()
+            return False
+
+        for name, convert in (("parse-timeout", float), ("interval", float), ("discovery-threads", int), ("port", int)):
+            if (self.get_option(name) is None):
+                continue
+
+            try:
+                convert(self.get_option(name))
+            except ValueError:
+                print("Error: Invalid value '%s' for --%s." % (self.get_option(name), name))
+                self.print_usage()
+                return False
+
+        if ("columnar" in self.options):
+            try:
+                tsscraper.columnar.import_numpy()
+            except ImportError:
+                print("Error: --columnar requires NumPy.")
+                return False
+
+        try:
+            self.rule_set = self.load_rules()
+        except (IOError, OSError, rules.RuleError) as e:
+            print("Error: Unable to load rules: %s" % e)
+            return False
+
+        return True
+
+    def build_snapshot(self, base_directory, snapshot_path):
+        print("INFO: Processing '%s' for snapshot ..." % base_directory)
+        with tsscraper.TSScraper.create_pool(self.thread_count) as pool:
+            # Snapshots keep the global variable index for serve
+            scraper = tsscraper.TSScraper(base_directory, self.thread_count, cache=self.create_cache(), parser_backend=self.get_parser_backend(), pool=pool, rules=self.rule_set, parse_timeout=self.get_parse_timeout(), discovery=self.create_discovery(), usages=True)
+            results = scraper.process()
+
+        print("INFO: Writing snapshot '%s' ..." % snapshot_path)
+        snapshot.write_snapshot(results, snapshot_path, { "directory": os.path.abspath(base_directory) })
+
+    def load_base_results(self, parse_cache, pool, base_metrics, usages=False):
+        if ("base-snapshot" in self.options and self.options["base-snapshot"] is not True):
+            print("INFO: Loading base snapshot '%s' ..." % self.options["base-snapshot"])
+
+            try:
+                return snapshot.load_snapshot(self.options["base-snapshot"])
+            except (IOError, OSError, snapshot.SnapshotError) as e:
+                print("Warning: Unable to load base snapshot: %s" % e)
+
+        if (os.path.isdir("base") is False):
+            print("Warning: No local copy of base found! Some reference checks will report false positives.")
+            return None
+
+        print("INFO: Processing base ...")
+        base_scraper = tsscraper.TSScraper("base", self.thread_count, cache=parse_cache, parser_backend=self.get_parser_backend(), pool=pool, rules=self.rule_set, metrics=base_metrics, parse_timeout=self.get_parse_timeout(), discovery=self.create_discovery(), usages=usages)
+        base_results = base_scraper.process()
+
+        print("INFO: Base produced %u diagnostics, which are not reported." % len(base_results["diagnostics"]))
+        return base_results
+
+    def watch(self, target_directory):
+        """
+            Analyzes the target once, then keeps the parsed files in memory and
+            only re-scrapes scripts as they change, printing the diagnostics
+            that appeared or went away after each change.
+        """
+        with tsscraper.TSScraper.create_pool(self.thread_count) as pool:
+            base_results = self.load_base_results(self.create_cache(), pool, metrics.Metrics())
+
+            # The target is read rather than mapped, as a mapped file that an
+            # editor truncates while it is parsed kills the worker
+            print("INFO: Processing '%s' ..." % target_directory)
+            scraper = tsscraper.TSScraper(target_directory, self.thread_count, base_results, None, self.get_parser_backend(), pool, self.rule_set, self.create_diagnostics(), parse_timeout=self.get_parse_timeout(), discovery=self.create_discovery(), memory_map=False)
+            results = scraper.process()
+            self.write_diagnostics(results["diagnostics"])
+
+            with watch.Watcher(target_directory, float(self.get_option("interval", 0.5)), discovery=scraper.discovery) as watcher:
+                print("INFO: Watching '%s' for changes, press Ctrl+C to stop ..." % target_directory)
+
+                try:
+                    while (True):
+                        changed, removed = watcher.wait()
+
+                        start = time.perf_counter()
+                        added, resolved = scraper.update(changed, removed)
+                        elapsed = time.perf_counter() - start
+
+                        print("INFO: %u changed, %u removed; re-checked in %.3f seconds." % (len(changed), len(removed), elapsed))
+                        for diagnostic in resolved:
+                            print("Resolved: %s" % diagnostic.message)
+                        diagnostics.write_diagnostics(added, self.get_option("diagnostics", "text"))
+
+                        counts = results["diagnostics"].counts()
+                        print("INFO: %u errors, %u warnings, %u notes." % (counts[diagnostics.ERROR], counts[diagnostics.WARNING], counts[diagnostics.NOTE]))
+                except KeyboardInterrupt:
+                    print("INFO: Stopped watching.")
+
+    def serve(self, target_directory):
+        """
+            Analyzes the target once and answers queries over it until stdin
+            is closed or the process is interrupted, updating the analysis as
+            files change.
+        """
+        # On stdio, stdout carries the protocol; everything else goes to stderr
+        protocol_output = sys.stdout
+        sys.stdout = sys.stderr
+
+        with tsscraper.TSScraper.create_pool(self.thread_count) as pool:
+            # Global variable queries need the usages of base and the target
+            base_results = self.load_base_results(self.create_cache(), pool, metrics.Metrics(), True)
+
+            print("INFO: Processing '%s' ..." % target_directory)
+            scraper = tsscraper.TSScraper(target_directory, self.thread_count, base_results, None, self.get_parser_backend(), pool, self.rule_set, self.create_diagnostics(), parse_timeout=self.get_parse_timeout(), discovery=self.create_discovery(), usages=True, memory_map=False)
+            query_server = server.QueryServer(scraper)
+            query_server.watch(target_directory, float(self.get_option("interval", 0.5)))
+
+            try:
+                if (self.get_option("port") is not None):
+                    print("INFO: Serving queries on 127.0.0.1:%u ..." % int(self.get_option("port")))
+                    query_server.serve_tcp(int(self.get_option("port")))
+                else:
+                    print("INFO: Serving queries on stdio ...")
+                    query_server.serve_stdio(sys.stdin, protocol_output)
+            except KeyboardInterrupt:
+                print("INFO: Stopped serving.")
+
     def run(self):
         exporter = None
         if (self.target_exporter.lower() != "none"):
@@ -83,30 +383,37 @@ class Application(object):
                 self.print_usage()
                 return
 
-        # First, process base
-        base_results = None
-        if (os.path.isdir("base") is False):
-            print("Warning: No local copy of base found! Some reference checks will report false positives.")
-        else:
-            print("INFO: Processing base ...")
-            base_scraper = tsscraper.TSScraper("base", self.thread_count)
-            base_results = base_scraper.process()
-
-        print("INFO: Processing '%s' ..." % self.target_directory)
-        scraper = tsscraper.TSScraper(self.target_directory, self.thread_count, base_results)
-        results = scraper.process()
-
-        # Init the exporter
-        print("INFO: Exporting data ...")
-        if (exporter is not None):
-            # Ensure that the output directory at least exists
+        usages = "usages" in self.options
+        parse_cache = self.create_cache()
+        run_metrics = { "base": metrics.Metrics(), "target": self.create_metrics() }
+
+        # Ensure that the output directory at least exists
+        if (exporter is not None or len(run_metrics["target"].profile_stages) != 0):
             try:
                 os.mkdir(self.output_directory)
             except OSError:
                 pass
 
-            output = exporter.Exporter(results, self.target_directory)
-            output.write(self.output_directory)
+        # Base and the target share one set of worker processes
+        with tsscraper.TSScraper.create_pool(self.thread_count) as pool:
+            # First, process base
+            base_results = self.load_base_results(parse_cache, pool, run_metrics["base"], usages)
+
+            print("INFO: Processing '%s' ..." % self.target_directory)
+            scraper = tsscraper.TSScraper(self.target_directory, self.thread_count, base_results, parse_cache, self.get_parser_backend(), pool, self.rule_set, self.create_diagnostics(), run_metrics["target"], "columnar" in self.options, self.get_parse_timeout(), self.create_discovery(), usages)
+            results = scraper.process()
+
+            self.write_diagnostics(results["diagnostics"])
+
+            # Init the exporter
+            print("INFO: Exporting data ...")
+            if (exporter is not None):
+                # Exporters may use the same workers for rendering
+                with run_metrics["target"].stage("export"):
+                    output = exporter.Exporter(results, self.target_directory, self.options, pool)
+                    output.write(self.output_directory)
+
+        self.write_metrics(run_metrics)
 
 if __name__ == "__main__":
     print("Operation Completion-----------------------\n%f Seconds" % timeit.timeit("Application().main()", number=1, setup="from __main__ import Application"))
@@ -0,0 +1,214 @@
+"""
+    metrics.py
+
+    Per stage timing, counters and optional profiling for the scraper.
+"""
+
+import os
+import time
+import json
+import cProfile
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is simply not reported there
+    resource = None
+
+# Marks the end of an iterable timed by Metrics.timed
+_end = object()
+
+
+def get_peak_memory():
+    """
+        Returns the peak resident set size of this process and of its waited
+        for children so far, in kilobytes, or None when it can't be
+        determined. These are high-water marks for the whole process
+        lifetime and never go down.
+    """
+    if (resource is None):
+        return None
+
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own, children)
+
+class StageMetrics(object):
+    """
+        Class representing the measurements for a single stage. A stage that
+        is entered several times accumulates its times and counters.
+
+        The memory growth figures are how far the stage raised the peak
+        resident set size of the process and of its children, in kilobytes.
+        A stage that stays below an earlier peak grows it by nothing.
+    """
+    name = None
+    wall_time = None
+    cpu_time = None
+    calls = None
+    counters = None
+    peak_memory_growth = None
+    peak_children_memory_growth = None
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.calls = 0
+        self.counters = { }
+
+    def to_dict(self):
+        return { "wall_time": self.wall_time, "cpu_time": self.cpu_time, "calls": self.calls, "counters": self.counters,
+        "peak_memory_growth_kb": self.peak_memory_growth, "peak_children_memory_growth_kb": self.peak_children_memory_growth }
+
+class _StageTimer(object):
+    _metrics = None
+    _stage = None
+    _wall_start = None
+    _cpu_start = None
+    _peak_start = None
+    _profiler = None
+    _call = None
+
+    def __init__(self, metrics, stage, call=True):
+        self._metrics = metrics
+        self._stage = stage
+        self._call = call
+
+    def __enter__(self):
+        # Profilers can't nest, so a stage nested in a profiled stage is
+        # simply included in the outer profile
+        if (self._stage.name in self._metrics.profile_stages and self._metrics.active_profiler is None):
+            self._profiler = self._metrics.get_profiler(self._stage.name)
+            self._metrics.active_profiler = self._profiler
+            self._profiler.enable()
+
+        self._peak_start = get_peak_memory()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self._stage
+
+    def __exit__(self, type, value, traceback):
+        self._stage.wall_time += time.perf_counter() - self._wall_start
+        self._stage.cpu_time += time.process_time() - self._cpu_start
+        if (self._call):
+            self._stage.calls += 1
+
+        if (self._profiler is not None):
+            self._profiler.disable()
+            self._metrics.active_profiler = None
+            self._profiler = None
+
+        peak = get_peak_memory()
+        if (peak is not None):
+            own, children = peak
+            own_start, children_start = self._peak_start
+            self._stage.peak_memory_growth = (self._stage.peak_memory_growth or 0) + own - own_start
+            self._stage.peak_children_memory_growth = (self._stage.peak_children_memory_growth or 0) + children - children_start
+
+class Metrics(object):
+    """
+        Class representing the instrumentation for a run: per stage wall and
+        CPU time, counters and peak memory growth, plus per worker figures for the
+        parse stage. Stages named in profile_stages are also run under
+        cProfile and dumped to profile_output when write_profiles() is called.
+    """
+    stages = None
+    workers = None
+    profile_stages = None
+    profile_output = None
+    active_profiler = None
+
+    _profilers = None
+
+    def __init__(self, profile_stages=None, profile_output=None):
+        self.stages = { }
+        self.workers = { }
+        self.profile_stages = set(profile_stages or [ ])
+        self.profile_output = profile_output
+        self._profilers = { }
+
+    def get_stage(self, name):
+        if (name not in self.stages):
+            self.stages[name] = StageMetrics(name)
+        return self.stages[name]
+
+    def stage(self, name):
+        """
+            Returns a context manager that times the enclosed block as part of
+            the named stage.
+        """
+        return _StageTimer(self, self.get_stage(name))
+
+    def timed(self, name, iterable):
+        """
+            Yields every item of the given iterable, timing the work done to
+            produce them as a single call of the named stage. Whatever the
+            caller does with an item before asking for the next one is not
+            part of the stage.
+        """
+        stage = self.get_stage(name)
+        stage.calls += 1
+
+        iterator = iter(iterable)
+        timer = _StageTimer(self, stage, False)
+        while (True):
+            with timer:
+                item = next(iterator, _end)
+
+            if (item is _end):
+                return
+            yield item
+
+    def count(self, stage, counter, amount=1):
+        counters = self.get_stage(stage).counters
+        counters[counter] = counters.get(counter, 0) + amount
+
+    def record_worker(self, pid, files, bytes, matches, wall_time, cpu_time):
+        worker = self.workers.setdefault(pid, { "files": 0, "bytes": 0, "matches": 0, "wall_time": 0.0, "cpu_time": 0.0 })
+        worker["files"] += files
+        worker["bytes"] += bytes
+        worker["matches"] += matches
+        worker["wall_time"] += wall_time
+        worker["cpu_time"] += cpu_time
+
+    def get_profiler(self, stage):
+        if (stage not in self._profilers):
+            self._profilers[stage] = cProfile.Profile()
+        return self._profilers[stage]
+
+    def write_profiles(self):
+        """
+            Dumps the collected profiles. With a single profiled stage the dump
+            goes to profile_output itself, otherwise to profile_output.<stage>.
+        """
+        paths = [ ]
+        for stage in self._profilers:
+            path = self.profile_output
+            if (len(self._profilers) != 1):
+                path = "%s.%s" % (self.profile_output, stage)
+
+            self._profilers[stage].dump_stats(path)
+            paths.append(path)
+        return paths
+
+    def report(self):
+        stages = { }
+        for name in self.stages:
+            stages[name] = self.stages[name].to_dict()
+
+        workers = { }
+        for pid in self.workers:
+            workers["%u" % pid] = self.workers[pid]
+
+        report = { "pid": os.getpid(), "stages": stages, "workers": workers }
+
+        peak = get_peak_memory()
+        if (peak is not None):
+            report["peak_memory_kb"], report["peak_children_memory_kb"] = peak
+        return report
+
+    def write(self, path):
+        with open(path, "w") as handle:
+            json.dump(self.report(), handle, indent=2, sort_keys=True)
+            handle.write("\n")
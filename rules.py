@@ -0,0 +1,182 @@
+"""
+    rules.py
+
+    Declarative datablock rules. Rule sets are loaded from JSON files (the
+    stock rules live in data/rules.json) and compiled once into per type
+    checker objects. Everything here is plain data, so compiled rules can be
+    pickled to worker processes.
+
+    A rule file looks like:
+
+        {
+            "version": 1,
+            "datablocks": {
+                "itemdata": {
+                    "references": [ ],
+                    "optional_references": [ "image" ],
+                    "declared": [ ],
+                    "checks": {
+                        "pickupradius": { "min": 1, "message": "Items should have >= 1 pickup radius." }
+                    }
+                }
+            }
+        }
+
+    Supported check keys are "min" and "max" (inclusive numeric bounds),
+    "type" ("number" or "string") and "not_empty". Every check needs a
+    "message" that is reported when it fails.
+"""
+
+import os
+import os.path
+import json
+
+# Rule file format versions this module understands
+RULES_VERSION = 1
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "rules.json")
+
+
+class RuleError(Exception):
+    """
+        Raised when a rule file is malformed.
+    """
+
+class PropertyCheck(object):
+    """
+        Class representing a compiled check on a single datablock property.
+        Calling it with the property value returns True when the value is
+        acceptable.
+    """
+    property = None
+    message = None
+    minimum = None
+    maximum = None
+    type = None
+    not_empty = None
+    is_numeric = None
+
+    def __init__(self, property, message, minimum=None, maximum=None, type=None, not_empty=False):
+        self.property = property
+        self.message = message
+        self.minimum = minimum
+        self.maximum = maximum
+        self.type = type
+        self.not_empty = not_empty
+        self.is_numeric = (minimum is not None or maximum is not None or type == "number")
+
+    def __call__(self, value):
+        if (self.not_empty and (value is None or value == "")):
+            return False
+
+        if (self.type == "string" and not isinstance(value, str)):
+            return False
+
+        if (self.is_numeric):
+            if (not isinstance(value, float)):
+                return False
+            if (self.minimum is not None and value < self.minimum):
+                return False
+            if (self.maximum is not None and value > self.maximum):
+                return False
+
+        return True
+
+class DatablockRule(object):
+    """
+        Class representing the compiled rules for one datablock type.
+    """
+    type = None
+    references = None
+    optional_references = None
+    declared = None
+    checks = None
+
+    def __init__(self, type, references=None, optional_references=None, declared=None, checks=None):
+        self.type = type
+        self.references = references or [ ]
+        self.optional_references = optional_references or [ ]
+        self.declared = declared or [ ]
+        self.checks = checks or [ ]
+
+    def all_references(self):
+        return self.references + self.optional_references
+
+class RuleSet(object):
+    """
+        Class representing every known datablock rule, keyed by the lowercased
+        datablock type. Loading several files merges them in order: a later
+        file replaces the fields it specifies for a type and leaves the rest.
+    """
+    _rules = None
+
+    def __init__(self):
+        self._rules = { }
+
+    def __contains__(self, type):
+        return type in self._rules
+
+    def __iter__(self):
+        return iter(self._rules)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def get(self, type):
+        return self._rules.get(type)
+
+    def load(self, path):
+        with open(path, "r") as handle:
+            try:
+                document = json.load(handle)
+            except ValueError as e:
+                raise RuleError("Invalid rule file '%s': %s" % (path, e))
+
+        self.update(document, path)
+        return self
+
+    def update(self, document, source="<rules>"):
+        if (document.get("version", RULES_VERSION) != RULES_VERSION):
+            raise RuleError("Rule file '%s' has unsupported version %s." % (source, document.get("version")))
+
+        datablocks = document.get("datablocks", { })
+        for type in datablocks:
+            specification = datablocks[type]
+            type = type.lower()
+
+            rule = self._rules.get(type)
+            if (rule is None):
+                rule = DatablockRule(type)
+                self._rules[type] = rule
+
+            for field in [ "references", "optional_references", "declared" ]:
+                if (field in specification):
+                    setattr(rule, field, [name.lower() for name in specification[field]])
+
+            if ("checks" in specification):
+                rule.checks = [self._compile_check(type, property, specification["checks"][property], source) for property in specification["checks"]]
+
+    def _compile_check(self, type, property, specification, source):
+        if ("message" not in specification):
+            raise RuleError("Check '%s' on '%s' in '%s' has no message." % (property, type, source))
+
+        unknown = set(specification.keys()) - set([ "message", "min", "max", "type", "not_empty" ])
+        if (len(unknown) != 0):
+            raise RuleError("Check '%s' on '%s' in '%s' has unknown keys: %s" % (property, type, source, ", ".join(sorted(unknown))))
+
+        value_type = specification.get("type")
+        if (value_type not in [ None, "number", "string" ]):
+            raise RuleError("Check '%s' on '%s' in '%s' has unknown type '%s'." % (property, type, source, value_type))
+
+        return PropertyCheck(property.lower(), specification["message"], specification.get("min"), specification.get("max"), value_type, specification.get("not_empty", False))
+
+def load_rules(paths=None):
+    """
+        Loads the stock rules followed by each of the given rule files.
+    """
+    rule_set = RuleSet().load(DEFAULT_RULES_PATH)
+
+    for path in paths or [ ]:
+        rule_set.load(path)
+
+    return rule_set
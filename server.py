@@ -0,0 +1,328 @@
+"""
+    server.py
+
+    Keeps the analysis of a target directory resident and answers editor
+    queries over it as JSON lines, on stdio or on a localhost TCP port.
+
+    Every request is a single line like:
+
+        {"id": 1, "method": "definition", "params": {"name": "Blaster"}}
+
+    and is answered with a single line holding either "result" or "error":
+
+        {"id": 1, "result": [{"kind": "datablock", "name": "blaster", "file": "...", "line": 26}]}
+
+    Methods:
+        definition(name)    Where a datablock, global function or bound
+                            function ("type::name", or just "name" for every
+                            type) is declared.
+        references(name)    Every datablock property whose value is name.
+        ancestors(name)     The linearized inheritance chain of a datablock.
+        properties(name)    The effective properties of a datablock and the
+                            ancestor each one comes from.
+        diagnostics(file)   The current diagnostics for a file.
+        globals(prefix)     Every usage of the globals whose names start
+                            with prefix, such as "$Pref::".
+        unset(prefix)       The globals starting with prefix that scripts
+                            read but never assign, with their usages.
+        callers(name)       The functions that may call a function, by its
+                            "name" or "type::name". Script level code is
+                            "<script>".
+        callees(name)       The functions a function may call.
+        unreachable()       The functions that no script or engine callback
+                            can reach.
+        update(changed, removed)  Re-analyzes after files changed, for
+                            clients that track changes themselves.
+"""
+
+import os
+import os.path
+import sys
+import json
+import threading
+import socketserver
+
+import tsscraper
+import watch
+
+
+def encode_value(value):
+    if (isinstance(value, tsscraper.Global)):
+        return repr(value)
+    return value
+
+class QueryServer(object):
+    """
+        Class representing the resident analysis of one target directory
+        along with the name indexes queries are answered from. All access
+        goes through a lock so the watcher thread can update the analysis
+        between requests.
+    """
+    scraper = None
+    results = None
+
+    _lock = None
+    _functions = None
+    _diagnostics = None
+
+    def __init__(self, scraper):
+        self.scraper = scraper
+        self._lock = threading.Lock()
+
+        self.results = scraper.results
+        if (self.results is None):
+            self.results = scraper.process()
+
+        self._build_indexes()
+
+    def _build_indexes(self):
+        # Global functions by name and bound functions by both "type::name"
+        # and their bare name
+        self._functions = { }
+        for function in self.results["global_functions"]:
+            self._functions.setdefault(function.name.lower(), []).append(function)
+
+        for type in self.results["bound_functions"]:
+            for function in self.results["bound_functions"][type]:
+                self._functions.setdefault(("%s::%s" % (type, function.name)).lower(), []).append(function)
+                self._functions.setdefault(function.name.lower(), []).append(function)
+
+        self._diagnostics = { }
+        for diagnostic in self.results["diagnostics"]:
+            self._diagnostics.setdefault(diagnostic.filepath, []).append(diagnostic)
+
+    def update(self, changed, removed):
+        """
+            Incrementally re-analyzes the given changed and removed files and
+            returns the diagnostics delta.
+        """
+        with self._lock:
+            added, resolved = self.scraper.update(changed, removed)
+            self.results = self.scraper.results
+            self._build_indexes()
+
+        return { "added": [diagnostic.to_dict() for diagnostic in added], "removed": [diagnostic.to_dict() for diagnostic in resolved] }
+
+    def resync(self):
+        """
+            Re-analyzes the whole target from scratch, for when an update
+            failed part way through and may have left the analysis
+            inconsistent.
+        """
+        with self._lock:
+            self.scraper.diagnostics.discard(lambda diagnostic: True)
+            self.results = self.scraper.process()
+            self._build_indexes()
+
+    def definition(self, name):
+        name = name.lower()
+        result = [ ]
+
+        for datablock in self.results["datablocks"].get(name, [ ]):
+            result.append({ "kind": "datablock", "name": datablock.name, "type": datablock.type, "file": datablock.filepath, "line": datablock.line })
+
+        for function in self._functions.get(name, [ ]):
+            if (function.type is None):
+                result.append({ "kind": "function", "name": function.name, "file": function.filepath, "line": function.line, "parameters": function.parameters })
+            else:
+                result.append({ "kind": "method", "name": "%s::%s" % (function.type, function.name), "file": function.filepath, "line": function.line, "parameters": function.parameters })
+
+        return result
+
+    def references(self, name):
+        result = [ ]
+        for datablock, property_name in self.results["references"].references(name):
+            result.append({ "datablock": datablock.name, "property": property_name, "file": datablock.filepath, "line": datablock.line })
+        return result
+
+    def ancestors(self, name):
+        name = name.lower()
+        if (name not in self.results["datablocks"]):
+            raise KeyError("No such datablock '%s'." % name)
+
+        return list(self.results["hierarchy"].ancestors(name))
+
+    def properties(self, name):
+        name = name.lower()
+        if (name not in self.results["datablocks"]):
+            raise KeyError("No such datablock '%s'." % name)
+
+        hierarchy = self.results["hierarchy"]
+        datablock_list = self.results["datablocks"]
+
+        # The nearest ancestor declaring a property is where it comes from
+        result = { }
+        for ancestor in hierarchy.ancestors(name):
+            for declaration in datablock_list[ancestor]:
+                for property_name in declaration.properties:
+                    if (property_name not in result):
+                        result[property_name] = { "from": ancestor, "file": declaration.filepath, "line": declaration.line }
+
+        properties = hierarchy.properties(name)
+        for property_name in result:
+            result[property_name]["value"] = encode_value(properties[property_name])
+        return result
+
+    def diagnostics(self, file):
+        return [diagnostic.to_dict() for diagnostic in self._diagnostics.get(os.path.realpath(file), [ ])]
+
+    def _get_index(self, name, description):
+        if (self.results[name] is None):
+            raise KeyError("%s were not indexed for this target." % description)
+        return self.results[name]
+
+    def globals(self, prefix):
+        global_index = self._get_index("globals", "Global variables")
+
+        result = { }
+        for name in global_index.names(prefix):
+            result[name] = [{ "file": usage.filepath, "line": usage.line, "write": usage.write } for usage in global_index.usages(name)]
+        return result
+
+    def unset(self, prefix):
+        global_index = self._get_index("globals", "Global variables")
+
+        result = { }
+        for name in global_index.unset(prefix):
+            result[name] = [{ "file": usage.filepath, "line": usage.line, "write": usage.write } for usage in global_index.usages(name)]
+        return result
+
+    def callers(self, name):
+        calls = self._get_index("calls", "Calls")
+        if (name.lower() not in calls.callers):
+            raise KeyError("No such function '%s'." % name.lower())
+        return sorted(calls.get_callers(name))
+
+    def callees(self, name):
+        calls = self._get_index("calls", "Calls")
+        if (name.lower() not in calls.callees):
+            raise KeyError("No such function '%s'." % name.lower())
+        return sorted(calls.get_callees(name))
+
+    def unreachable(self):
+        calls = self._get_index("calls", "Calls")
+
+        result = [ ]
+        for key in calls.unreachable(self.scraper.call_roots(calls)):
+            for function in calls.functions[key]:
+                result.append({ "name": key, "file": function.filepath, "line": function.line })
+        return result
+
+    def handle(self, request):
+        """
+            Answers a single decoded request and returns the response object.
+            Malformed requests and failing methods are answered with an error
+            rather than raised, so that one bad request can't end the session.
+        """
+        if (not isinstance(request, dict)):
+            return { "id": None, "error": "Invalid request: expected an object." }
+
+        response = { "id": request.get("id") }
+
+        methods = { "definition": self.definition, "references": self.references, "ancestors": self.ancestors,
+        "properties": self.properties, "diagnostics": self.diagnostics, "globals": self.globals, "unset": self.unset,
+        "callers": self.callers, "callees": self.callees, "unreachable": self.unreachable }
+
+        method = request.get("method")
+        params = request.get("params", { })
+        if (not isinstance(params, dict)):
+            response["error"] = "Invalid params: expected an object."
+            return response
+
+        try:
+            if (method == "update"):
+                changed = params.get("changed", [ ])
+                removed = params.get("removed", [ ])
+                for name, paths in (("changed", changed), ("removed", removed)):
+                    if (not isinstance(paths, list) or not all([isinstance(path, str) for path in paths])):
+                        raise TypeError("Invalid params: %s must be a list of paths." % name)
+
+                response["result"] = self.update(changed, removed)
+            elif (method in methods):
+                with self._lock:
+                    response["result"] = methods[method](**params)
+            else:
+                response["error"] = "Unknown method '%s'." % method
+        except KeyError as e:
+            # The str() of a KeyError is the repr() of its message
+            response["error"] = str(e.args[0]) if len(e.args) != 0 else str(e)
+        except TypeError as e:
+            response["error"] = str(e)
+        except Exception as e:
+            response["error"] = "Internal error: %s: %s" % (type(e).__name__, e)
+
+        return response
+
+    def handle_line(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps({ "id": None, "error": "Invalid request: %s" % e })
+
+        response = self.handle(request)
+        try:
+            return json.dumps(response)
+        except (TypeError, ValueError) as e:
+            return json.dumps({ "id": response["id"], "error": "Internal error: Unable to encode the result: %s" % e })
+
+    def serve_stdio(self, input=sys.stdin, output=sys.stdout):
+        for line in input:
+            if (line.strip() == ""):
+                continue
+
+            output.write(self.handle_line(line))
+            output.write("\n")
+            output.flush()
+
+    def serve_tcp(self, port, host="127.0.0.1"):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if (line.strip() == b""):
+                        continue
+
+                    self.wfile.write(server.handle_line(line.decode("utf-8", "replace")).encode("utf-8"))
+                    self.wfile.write(b"\n")
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        with socketserver.ThreadingTCPServer((host, port), Handler) as tcp_server:
+            tcp_server.daemon_threads = True
+            tcp_server.serve_forever()
+
+    def watch(self, directory, interval=0.5):
+        """
+            Starts a daemon thread that updates the analysis whenever files in
+            the given directory change.
+        """
+        def run():
+            with watch.Watcher(directory, interval, discovery=self.scraper.discovery) as watcher:
+                # Whether the analysis has to be rebuilt rather than updated
+                stale = False
+
+                while (True):
+                    changed, removed = watcher.wait()
+
+                    # Files can change again while they are being updated, so
+                    # a failure is reported and the analysis rebuilt in full
+                    # rather than ending the thread and serving it stale
+                    if (not stale):
+                        try:
+                            self.update(changed, removed)
+                            continue
+                        except Exception as e:
+                            sys.stderr.write("Warning: Unable to update the analysis: %s: %s\n" % (type(e).__name__, e))
+
+                    try:
+                        sys.stderr.write("INFO: Re-analyzing '%s' ...\n" % directory)
+                        self.resync()
+                        stale = False
+                    except Exception as e:
+                        sys.stderr.write("Warning: Unable to re-analyze, retrying on the next change: %s: %s\n" % (type(e).__name__, e))
+                        stale = True
+
+        thread = threading.Thread(target=run, name="watch")
+        thread.daemon = True
+        thread.start()
+        return thread
@@ -0,0 +1,165 @@
+"""
+    snapshot.py
+
+    Versioned on-disk snapshots of TSScraper.process() results. A snapshot of
+    the stock base scripts is built once per release and then handed to the
+    scraper as previous_results instead of re-scanning base on every run.
+
+    Every section is stored as a single pickle and only unpickled when it is
+    first used. The analysis reads every base datablock and function anyway,
+    so loading them one by one would only make loading them slower.
+"""
+
+import mmap
+import pickle
+import struct
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import tsscraper
+
+# Bump whenever the layout of the snapshot file itself changes
+SNAPSHOT_VERSION = 2
+
+_magic = b"TSSNAP"
+_header = struct.Struct("<6sHHQ")
+
+# Result sections kept in a snapshot
+_sections = [ "datablocks", "bound_functions", "global_functions", "globals" ]
+
+
+class SnapshotError(Exception):
+    """
+        Raised when a snapshot file is missing, truncated, corrupt or was
+        written by an incompatible version of the scraper.
+    """
+
+def _unpickle(buffer, offset, length):
+    """
+        Unpickles a single section. Damaged data can fail to unpickle with
+        almost any exception, which is reported as a SnapshotError instead.
+    """
+    try:
+        return pickle.loads(buffer[offset:offset + length])
+    except Exception as e:
+        raise SnapshotError("Snapshot section at offset %u is corrupt: %s" % (offset, e))
+
+class Snapshot(Mapping):
+    """
+        Class representing a loaded snapshot. It behaves like the dictionary
+        returned by TSScraper.process(), minus the per file entries, and can be
+        passed directly as previous_results.
+    """
+    path = None
+    metadata = None
+
+    _handle = None
+    _buffer = None
+    _sections = None
+    _index = None
+
+    def __init__(self, path):
+        self.path = path
+        self._handle = open(path, "rb")
+
+        try:
+            self._buffer = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._handle.close()
+            raise SnapshotError("Snapshot file '%s' is empty." % path)
+
+        if (len(self._buffer) < _header.size):
+            self.close()
+            raise SnapshotError("Snapshot file '%s' is truncated." % path)
+
+        magic, version, parser_version, index_offset = _header.unpack_from(self._buffer, 0)
+        if (magic != _magic):
+            self.close()
+            raise SnapshotError("'%s' is not a TSScraper snapshot." % path)
+
+        if (version != SNAPSHOT_VERSION or parser_version != tsscraper.PARSER_VERSION):
+            self.close()
+            raise SnapshotError("Snapshot '%s' was written by an incompatible version (snapshot %u, parser %u); please rebuild it." % (path, version, parser_version))
+
+        # A snapshot whose writer was interrupted or that was cut short has a
+        # damaged index, which can fail to unpickle with almost any exception
+        try:
+            self.metadata, self._index = pickle.loads(self._buffer[index_offset:])
+            valid = self._check_index(index_offset)
+        except Exception:
+            valid = False
+
+        if (not valid):
+            self.close()
+            raise SnapshotError("Snapshot '%s' is truncated or corrupt; please rebuild it." % path)
+
+        self._sections = { }
+
+    def _check_index(self, index_offset):
+        """
+            Returns whether the index has every section and all of them lie
+            between the header and the index itself.
+        """
+        for section in _sections:
+            offset, length = self._index[section]
+            if (offset < _header.size or offset + length > index_offset):
+                return False
+        return True
+
+    def __getitem__(self, name):
+        if (name not in self._sections):
+            offset, length = self._index[name]
+            self._sections[name] = _unpickle(self._buffer, offset, length)
+
+        return self._sections[name]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        if (self._buffer is not None):
+            self._buffer.close()
+            self._buffer = None
+
+        self._handle.close()
+
+def write_snapshot(results, path, metadata=None):
+    """
+        Serializes the given TSScraper.process() results into a snapshot file
+        at the given path.
+    """
+    index = { }
+
+    with open(path, "wb") as handle:
+        handle.write(_header.pack(_magic, SNAPSHOT_VERSION, tsscraper.PARSER_VERSION, 0))
+
+        def write_blob(value):
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            offset = handle.tell()
+            handle.write(data)
+            return (offset, len(data))
+
+        for section in _sections:
+            index[section] = write_blob(results[section])
+
+        index_offset = handle.tell()
+        handle.write(pickle.dumps((metadata or { }, index), pickle.HIGHEST_PROTOCOL))
+
+        handle.seek(0)
+        handle.write(_header.pack(_magic, SNAPSHOT_VERSION, tsscraper.PARSER_VERSION, index_offset))
+
+def load_snapshot(path):
+    """
+        Loads the snapshot at the given path. The file is memory mapped and
+        sections are only unpickled as they are accessed.
+    """
+    return Snapshot(path)
@@ -1,61 +1,206 @@
 import re
 import os
 import sys
-import multiprocessing
 import importlib
 import os.path
 import timeit
+import time
+import hashlib
+import mmap
+import bisect
+import signal
+import threading
+import multiprocessing
+
+import workers
+import columnar
+import callgraph
+from rules import load_rules
+from diagnostics import DiagnosticCollector
+from discovery import FileDiscovery
+from metrics import Metrics
+
+
+# Bump whenever scrape_file changes the shape or contents of its output so that
+# persistent parse caches are invalidated.
+PARSER_VERSION = 9
+
+# Available implementations of the parse stage. "regex" is the original
+# pattern based scraper, "lexer" is the single pass tokenizer in lexer.py.
+PARSER_BACKENDS = [ "regex", "lexer" ]
+
+# Backends that only ever spend a bounded time between two deadline checks.
+# The others can be stuck in a single runaway match, which only the timer
+# signal of a pool worker interrupts, so with a parse time budget they are
+# always run in worker processes
+POLLED_BACKENDS = [ "lexer" ]
 
-import cProfile
+# Scripts are scanned as bytes and the parts that are kept are decoded with
+# this encoding, which like the engine accepts any byte
+ENCODING = "latin-1"
 
+# Seconds a single file may take to parse before it is skipped and reported,
+# so one malformed script can't stall a worker indefinitely
+PARSE_TIMEOUT = 30.0
+
+# Diagnostics of the usage analysis, which is redone in full on every update
+USAGE_CODES = [ "unreachable-function", "unset-global" ]
+
+# There are only a handful of proper standalone datablock types, which are
+# expected to be referenced by some other datablock
+STANDALONE_TYPES = [ "particledata", "audiodescription", "splashdata", "debrisdata", "sensordata", "decaldata" ] # audioprofile
+
+# Names, types, paths and parameter names repeat across hundreds of thousands
+# of entities, so every one of them is interned to share a single string
+intern = sys.intern
 
 class FileEntry(object):
     """
         Class representing a file in the mod directory. This
         contains all processed nodes within the file data.
     """
-    path = None
-    global_functions = None
-    bound_functions = None
-    datablocks = None
+    __slots__ = ("path", "global_functions", "bound_functions", "datablocks", "calls", "globals", "parse_error", "mod_path", "web_path")
 
     def __init__(self, path):
-        self.path = path
+        self.path = intern(path)
         self.global_functions = [ ]
         self.bound_functions = { }
         self.datablocks = [ ]
+        self.calls = [ ]
+        self.globals = [ ]
+
+        # Why the file could not be parsed, if it could not
+        self.parse_error = None
+
+        # Set by exporters
+        self.mod_path = None
+        self.web_path = None
+
+    def __getstate__(self):
+        return (self.path, self.global_functions, self.bound_functions, self.datablocks, self.calls, self.globals, self.parse_error, self.mod_path, self.web_path)
+
+    def __setstate__(self, state):
+        path, self.global_functions, bound_functions, self.datablocks, self.calls, self.globals, self.parse_error, self.mod_path, self.web_path = state
+        self.path = intern(path)
+
+        self.bound_functions = { }
+        for type in bound_functions:
+            self.bound_functions[intern(type)] = bound_functions[type]
 
 class Function(object):
     """
         Class representing a Function entity in the game code tree
         that the parse stage produces.
     """
-    name = None
-    parameters = None
-    type = None
-    filepath = None
-    line = None
-
-    aliases = None
-    comments = None
+    __slots__ = ("name", "parameters", "type", "filepath", "line", "_aliases", "comments")
 
     def __init__(self, name, type, parameters, filepath, line):
-        self.name = name
-        self.parameters = parameters
-        self.filepath = filepath
+        self.name = intern(name)
+        self.parameters = [intern(parameter) for parameter in parameters]
+        self.filepath = intern(filepath)
+        self.line = line
+        self.type = intern(type) if type is not None else None
+        self.comments = None
+
+        # Only allocated once the function is actually redeclared
+        self._aliases = None
+
+    @property
+    def aliases(self):
+        if (self._aliases is None):
+            return ()
+        return self._aliases
+
+    def add_alias(self, function):
+        if (self._aliases is None):
+            self._aliases = [ ]
+        self._aliases.append(function)
+
+    def clear_aliases(self):
+        """
+            Forgets every redeclaration recorded with add_alias, so that they
+            can be recorded again after the declarations changed.
+        """
+        self._aliases = None
+
+    def __getstate__(self):
+        return (self.name, self.parameters, self.type, self.filepath, self.line, self._aliases, self.comments)
+
+    def __setstate__(self, state):
+        name, parameters, type, filepath, self.line, self._aliases, self.comments = state
+        self.name = intern(name)
+        self.parameters = [intern(parameter) for parameter in parameters]
+        self.type = intern(type) if type is not None else None
+        self.filepath = intern(filepath)
+
+# Kinds of call sites: "foo()", "%obj.foo()", "Namespace::foo()" and
+# "Parent::foo()"
+CALL_GLOBAL = "global"
+CALL_METHOD = "method"
+CALL_NAMESPACE = "namespace"
+CALL_PARENT = "parent"
+
+# Keywords followed by "(" and keywords after which "name(" is not a call
+CALL_KEYWORDS = frozenset([ "if", "while", "for", "switch", "return", "case", "or" ])
+DECLARATION_KEYWORDS = frozenset([ "function", "datablock", "new", "singleton", "package" ])
+
+# Functions taking the name of the function to call as a string argument, and
+# the position of that argument for global and method calls
+INDIRECT_CALLS = { "schedule": (2, 1), "call": (0, 0) }
+
+class CallSite(object):
+    """
+        Class representing a single call in the game code tree. The caller
+        is the lowercased "name" or "type::name" of the enclosing function, or
+        None for code outside of any function. Calls made by name through
+        schedule() or call() are marked indirect.
+    """
+    __slots__ = ("caller", "name", "type", "kind", "indirect", "filepath", "line")
+
+    def __init__(self, caller, name, type, kind, indirect, filepath, line):
+        self.caller = intern(caller) if caller is not None else None
+        self.name = intern(name)
+        self.type = intern(type) if type is not None else None
+        self.kind = kind
+        self.indirect = indirect
+        self.filepath = intern(filepath)
         self.line = line
-        self.aliases = [ ]
-        self.type = type
+
+    def __getstate__(self):
+        return (self.caller, self.name, self.type, self.kind, self.indirect, self.filepath, self.line)
+
+    def __setstate__(self, state):
+        caller, name, type, self.kind, self.indirect, filepath, self.line = state
+        self.caller = intern(caller) if caller is not None else None
+        self.name = intern(name)
+        self.type = intern(type) if type is not None else None
+        self.filepath = intern(filepath)
+
+    def __repr__(self):
+        return "CallSite(%s -> %s, %s:%u)" % (self.caller, self.name if self.type is None else "%s::%s" % (self.type, self.name), self.filepath, self.line)
 
 class Global(object):
     """
-        Class representing a global variable. This is currently unused
-        in the coding.
+        Class representing a global variable. Datablock property values
+        naming a global are Global objects without a location; the usages
+        the parse stage records in FileEntry.globals also carry the file and
+        line of the usage and whether it assigns the variable.
     """
-    name = None
+    __slots__ = ("name", "filepath", "line", "write")
+
+    def __init__(self, name, filepath=None, line=None, write=False):
+        self.name = intern(name)
+        self.filepath = intern(filepath) if filepath is not None else None
+        self.line = line
+        self.write = write
 
-    def __init__(self, name):
-        self.name = name
+    def __getstate__(self):
+        return (self.name, self.filepath, self.line, self.write)
+
+    def __setstate__(self, state):
+        name, filepath, self.line, self.write = state
+        self.name = intern(name)
+        self.filepath = intern(filepath) if filepath is not None else None
 
     def __repr__(self):
         return "$%s" % self.name
@@ -65,140 +210,847 @@ class Datablock(object):
         Class representing a datablock entry. It contains the type, derived
         datablock name, the datablock name itself and all assigned properties.
     """
-    name = None
-    type = None
-    derived = None
-    line = None
-
-    aliases = None
-    properties = None
-    filepath = None
-    comments = None
+    __slots__ = ("name", "type", "derived", "line", "properties", "filepath", "comments")
 
     def __init__(self, name, type, properties, filepath, line, derived):
-        self.name = name
-        self.type = type
-        self.derived = derived
+        self.name = intern(name)
+        self.type = intern(type)
+        self.derived = [intern(parent) for parent in derived] if derived is not None else None
         self.line = line
-        self.aliases = [ ]
-        self.properties = properties
-        self.filepath = filepath
+        self.properties = _intern_keys(properties)
+        self.filepath = intern(filepath)
+        self.comments = None
+
+    @property
+    def aliases(self):
+        # Redeclared datablocks are merged rather than aliased, see
+        # DatablockHierarchy
+        return ()
+
+    def __getstate__(self):
+        return (self.name, self.type, self.derived, self.line, self.properties, self.filepath, self.comments)
+
+    def __setstate__(self, state):
+        name, type, derived, self.line, properties, filepath, self.comments = state
+        self.name = intern(name)
+        self.type = intern(type)
+        self.derived = [intern(parent) for parent in derived] if derived is not None else None
+        self.properties = _intern_keys(properties)
+        self.filepath = intern(filepath)
+
+def _intern_keys(properties):
+    result = { }
+    for key in properties:
+        result[intern(key)] = properties[key]
+    return result
+
+class ReferenceIndex(object):
+    """
+        Class representing an inverted index of datablock property values. It
+        maps each lowercased string value to the datablocks and properties that
+        hold it, answering "who references X" with a single dictionary lookup
+        instead of a scan over every property of every datablock.
+    """
+    _referrers = None
+
+    def __init__(self, datablock_list=None):
+        self._referrers = { }
+
+        if (datablock_list is not None):
+            for name in datablock_list:
+                for datablock in datablock_list[name]:
+                    self.add(datablock)
+
+    @staticmethod
+    def values(datablock):
+        """
+            Returns (lowercased value, property name) for every string property
+            of the given datablock.
+        """
+        result = [ ]
+        for property_name in datablock.properties:
+            property_value = datablock.properties[property_name]
+
+            if (type(property_value) is str):
+                result.append((property_value.lower(), property_name))
+        return result
+
+    def add(self, datablock):
+        for value, property_name in ReferenceIndex.values(datablock):
+            self._referrers.setdefault(value, []).append((datablock, property_name))
+
+    def remove(self, datablock):
+        for value, property_name in ReferenceIndex.values(datablock):
+            references = [reference for reference in self._referrers.get(value, [ ]) if reference[0] is not datablock]
+
+            if (len(references) != 0):
+                self._referrers[value] = references
+            else:
+                self._referrers.pop(value, None)
+
+    def references(self, name):
+        """
+            Returns a list of (datablock, property name) pairs for every
+            datablock property whose value is the given name.
+        """
+        return self._referrers.get(name.lower(), [ ])
+
+    def referrers(self, name):
+        """
+            Returns the list of distinct datablocks that reference the given
+            name in any of their properties.
+        """
+        result = [ ]
+        seen = set()
+
+        for datablock, property_name in self.references(name):
+            if (id(datablock) not in seen):
+                seen.add(id(datablock))
+                result.append(datablock)
+
+        return result
+
+class GlobalIndex(object):
+    """
+        Class representing every recorded usage of every global variable,
+        keyed by the lowercased name without the "$". The names are also kept
+        sorted so that every global of a namespace ("pref::") is found with a
+        binary search rather than a scan over all of them.
+    """
+    _usages = None
+    _names = None
+
+    def __init__(self, files=None):
+        self._usages = { }
+
+        if (files is not None):
+            for file in files:
+                self.add_file(file)
+
+    def __getstate__(self):
+        return self._usages
+
+    def __setstate__(self, state):
+        self._usages = state
+        self._names = None
+
+    def add_file(self, file):
+        for usage in file.globals:
+            self._usages.setdefault(usage.name.lower(), []).append(usage)
+        self._names = None
+
+    def remove_file(self, file):
+        for name in set([usage.name.lower() for usage in file.globals]):
+            usages = [usage for usage in self._usages.get(name, [ ]) if usage.filepath != file.path]
+
+            if (len(usages) != 0):
+                self._usages[name] = usages
+            else:
+                self._usages.pop(name, None)
+        self._names = None
+
+    def merge(self, other):
+        """
+            Adds every usage of another index, such as the one of the base
+            scripts, to this one.
+        """
+        for name in other._usages:
+            self._usages.setdefault(name, []).extend(other._usages[name])
+        self._names = None
+
+    def usages(self, name):
+        """
+            Returns every usage of the given global, with or without the "$".
+        """
+        return self._usages.get(name.lstrip("$").lower(), [ ])
+
+    def names(self, prefix=""):
+        """
+            Returns the sorted lowercased names of every global starting with
+            the given prefix.
+        """
+        if (self._names is None):
+            self._names = sorted(self._usages)
+
+        prefix = prefix.lstrip("$").lower()
+        start = bisect.bisect_left(self._names, prefix)
+        end = start
+        while (end < len(self._names) and self._names[end].startswith(prefix)):
+            end += 1
+        return self._names[start:end]
+
+    def unset(self, prefix=""):
+        """
+            Returns the names of the globals that are read but never assigned
+            by any script. Many of these are set by the engine itself.
+        """
+        return [name for name in self.names(prefix) if not any(usage.write for usage in self._usages[name])]
+
+    def unread(self, prefix=""):
+        """
+            Returns the names of the globals that are assigned but never read
+            by any script. The engine and console may still read them.
+        """
+        return [name for name in self.names(prefix) if all(usage.write for usage in self._usages[name])]
+
+class DatablockHierarchy(object):
+    """
+        Class representing the resolved datablock inheritance graph. Every
+        datablock name is resolved once, parents before children, into a
+        linearized ancestor chain and a flattened mapping of the properties it
+        declares or inherits, so later checks are plain dictionary lookups.
+
+        When a datablock is declared more than once, its declarations are
+        merged in order with later declarations overriding earlier ones.
+        Inheritance cycles are recorded in cycles and the offending edge is
+        ignored rather than followed.
+    """
+    cycles = None
+
+    _datablocks = None
+    _ancestors = None
+    _properties = None
+
+    # Names resolved without one of their parents to break a cycle, and the
+    # per declaration properties of those and of redeclared names, filled in
+    # on demand
+    _partial = None
+    _effective = None
+
+    # Every declared parent name, known or not, and the reverse edges
+    _declared_parents = None
+    _children = None
+
+    def __init__(self, datablock_list):
+        self._datablocks = datablock_list
+        self._ancestors = { }
+        self._properties = { }
+        self._partial = set()
+        self._effective = { }
+        self._declared_parents = { }
+        self._children = { }
+        self.cycles = [ ]
+
+        for name in datablock_list:
+            self._link(name)
+
+        for name in datablock_list:
+            self._resolve(name)
+
+    def _link(self, name):
+        parents = set()
+        for declaration in self._datablocks[name]:
+            if (declaration.derived is not None):
+                parents.update(declaration.derived)
+
+        for parent in parents:
+            self._children.setdefault(parent, set()).add(name)
+        self._declared_parents[name] = parents
+
+    def _unlink(self, name):
+        for parent in self._declared_parents.pop(name, ()):
+            children = self._children[parent]
+            children.discard(name)
+
+            if (len(children) == 0):
+                del self._children[parent]
+
+    def descendants(self, names):
+        """
+            Returns the given names together with every name that inherits
+            from one of them, directly or not.
+        """
+        result = set(names)
+        pending = list(result)
+
+        while (len(pending) != 0):
+            for child in self._children.get(pending.pop(), ()):
+                if (child not in result):
+                    result.add(child)
+                    pending.append(child)
+
+        return result
+
+    def update(self, names):
+        """
+            Re-resolves the given names, whose entries in the datablock list
+            were added, replaced or removed, along with everything inheriting
+            from them. Returns the set of names that were invalidated.
+        """
+        for name in names:
+            self._unlink(name)
+            if (name in self._datablocks):
+                self._link(name)
+
+        affected = self.descendants(names)
+        for name in affected:
+            self._ancestors.pop(name, None)
+            self._properties.pop(name, None)
+            self._partial.discard(name)
+            self._effective.pop(name, None)
+
+        # Every member of a cycle inherits from every other one, so a cycle is
+        # either entirely affected or not at all
+        self.cycles = [cycle for cycle in self.cycles if affected.isdisjoint(cycle)]
+
+        for name in affected:
+            if (name in self._datablocks):
+                self._resolve(name)
+
+        return affected
+
+    def _parents(self, declarations):
+        parents = [ ]
+        for declaration in declarations:
+            if (declaration.derived is not None):
+                for parent in declaration.derived:
+                    if (parent in self._datablocks and parent not in parents):
+                        parents.append(parent)
+        return parents
+
+    def _resolve(self, name):
+        """
+            Resolves the given name and all of its unresolved ancestors using
+            an explicit stack, so deep chains cannot exhaust the recursion
+            limit.
+        """
+        if (name in self._ancestors):
+            return
+
+        stack = [ (name, self._parents(self._datablocks[name])) ]
+        visiting = [ name ]
+
+        while (len(stack) != 0):
+            current, pending = stack[-1]
+
+            # Descend into the next unresolved parent, if any
+            descended = False
+            while (len(pending) != 0):
+                parent = pending[0]
+
+                if (parent in self._ancestors):
+                    pending.pop(0)
+                elif (parent in visiting):
+                    # Start every cycle at its smallest name, so it is reported
+                    # the same way whichever member was resolved first
+                    members = visiting[visiting.index(parent):]
+                    first = members.index(min(members))
+                    members = members[first:] + members[:first]
+                    self.cycles.append(members + [ members[0] ])
+                    pending.pop(0)
+                else:
+                    stack.append((parent, self._parents(self._datablocks[parent])))
+                    visiting.append(parent)
+                    descended = True
+                    break
+
+            if (descended):
+                continue
+
+            # Every parent is resolved (or cut by a cycle), finish this name
+            stack.pop()
+            visiting.pop()
+
+            declarations = self._datablocks[current]
+            ancestors = [ current ]
+            properties = { }
+
+            parents = self._parents(declarations)
+            if (not all(parent in self._ancestors for parent in parents)):
+                parents = [parent for parent in parents if parent in self._ancestors]
+                self._partial.add(current)
+
+            for parent in parents:
+                for ancestor in self._ancestors[parent]:
+                    if (ancestor not in ancestors):
+                        ancestors.append(ancestor)
+
+            # Nearer parents take precedence over further ones
+            for parent in reversed(parents):
+                properties.update(self._properties[parent])
+
+            for declaration in declarations:
+                properties.update(declaration.properties)
+
+            self._ancestors[current] = tuple(ancestors)
+            self._properties[current] = properties
+
+    def ancestors(self, name):
+        """
+            Returns the linearized inheritance chain of the given datablock
+            name, starting with the name itself.
+        """
+        return self._ancestors[name]
+
+    def properties(self, name):
+        """
+            Returns the effective properties of the given datablock name: every
+            property it declares or inherits. The mapping must not be modified.
+        """
+        return self._properties[name]
+
+    def effective_properties(self, datablock):
+        """
+            Returns the effective properties of one specific declaration, which
+            may differ from the merged view of its name when it is redeclared.
+            The mapping must not be modified.
+        """
+        declarations = self._datablocks[datablock.name]
+        if (len(declarations) == 1 and datablock.name not in self._partial):
+            return self._properties[datablock.name]
+
+        effective = self._effective.setdefault(datablock.name, { })
+        properties = effective.get(datablock)
+        if (properties is None):
+            properties = { }
+            for parent in reversed(self._parents([ datablock ])):
+                properties.update(self._properties[parent])
+            properties.update(datablock.properties)
+            effective[datablock] = properties
+
+        return properties
+
+# Compiled patterns used by scrape_file, loaded once per process by
+# initialize_worker rather than being sent along with every task
+_scrape_patterns = None
+
+def read_file(filepath, memory_map=True):
+    """
+        Returns the contents of the given file as a read only memory map, or
+        as empty bytes for an empty file, which can't be mapped. The mapping
+        is released along with the last reference to it.
+
+        Without memory_map the file is read into bytes instead. A mapping
+        of a file that is truncated while it is being scanned kills the
+        process with SIGBUS, which a file being saved by an editor can do.
+    """
+    with open(filepath, "rb") as handle:
+        if (not memory_map):
+            return handle.read()
+
+        try:
+            return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b""
+
+def initialize_worker():
+    """
+        Worker process initializer. Compiles the patterns scrape_file needs and
+        imports the lexer backend once, up front.
+    """
+    global _scrape_patterns
+
+    import lexer
+
+    _scrape_patterns = {
+        "combined": re.compile(TSScraper._combined_pattern.pattern.encode(ENCODING)),
+        "key_value": re.compile("(?<!.)\s*.+\s*=((\s*\S+\s*)|(\"\s*\S+\s*\"));"),
+        "parameter_split": TSScraper.parameter_split,
+        "assignment_split": TSScraper.assignment_split,
+        "comment": re.compile("//.*"),
+        "usage": re.compile(TSScraper._usage_pattern.pattern.encode(ENCODING), re.VERBOSE),
+        "argument": re.compile(TSScraper._argument_pattern.pattern.encode(ENCODING)),
+    }
+
+class ParseTimeout(Exception):
+    """
+        Raised while scraping a file that has taken longer than its parse
+        time budget.
+    """
+
+def check_deadline(deadline):
+    if (deadline is not None and time.perf_counter() > deadline):
+        raise ParseTimeout()
+
+# Whether the parse timer may still interrupt the current file. A timer
+# signal that was already pending when the file finished is handled after
+# this is cleared and ignored
+_alarm_armed = False
+
+def _raise_parse_timeout(signal_number, frame):
+    if (_alarm_armed):
+        raise ParseTimeout()
 
 def scrape_file(input):
+    """
+        Scrapes a single file within its parse time budget, in seconds, or
+        without one when the budget is None, and records its call sites and
+        global variable usages along with its declarations when asked to. A
+        file that runs over is returned without any declarations and with
+        parse_error set. The file is memory mapped unless memory_map is False,
+        see read_file.
+
+        The backends check the deadline between matches and tokens. In a
+        pool worker process, a single runaway regular expression match is
+        also interrupted with a timer signal where the platform supports it.
+        The interval timer and the SIGALRM handler are process wide, so any
+        other process relies on the deadline checks alone rather than taking
+        them over from the host application.
+    """
+    global _alarm_armed
+
+    filepath, backend, timeout, usages, memory_map = input
+
+    if (timeout is None):
+        return _scrape_file(filepath, backend, None, usages, memory_map)
+
+    use_alarm = (hasattr(signal, "setitimer") and multiprocessing.parent_process() is not None
+    and threading.current_thread() is threading.main_thread())
+    previous_handler = None
+    previous_timer = None
+
+    # The timer can go off at any point up to where it is disarmed, including
+    # after the file was scraped, so the whole span is covered by the handler
+    try:
+        try:
+            start = time.perf_counter()
+            if (use_alarm):
+                previous_handler = signal.signal(signal.SIGALRM, _raise_parse_timeout)
+                _alarm_armed = True
+                previous_timer = signal.setitimer(signal.ITIMER_REAL, timeout)
+
+            return _scrape_file(filepath, backend, start + timeout, usages, memory_map)
+        finally:
+            _alarm_armed = False
+            if (previous_timer is not None):
+                # Whatever timer was running before resumes with the time it
+                # had left, going off right away if that ran out meanwhile
+                delay, interval = previous_timer
+                if (delay != 0):
+                    delay = max(delay - (time.perf_counter() - start), 1e-6)
+                signal.setitimer(signal.ITIMER_REAL, delay, interval)
+    except ParseTimeout:
+        file = FileEntry(filepath)
+        file.parse_error = "Parsing took longer than the %g second budget, the file was skipped!" % timeout
+        return (file.global_functions, file.bound_functions, file.datablocks, file)
+    finally:
+        if (previous_handler is not None):
+            signal.signal(signal.SIGALRM, previous_handler)
+
+def _scrape_file(filepath, backend, deadline, usages, memory_map):
     """
         This method is a performance critical code segment in the scraper.
         It is what performs the initial parsing step to produce a sort of
         high level representation of the mod for later steps to process
         and eventually output.
     """
-    filepath, parameter_split, combined_pattern = input
+    if (_scrape_patterns is None):
+        initialize_worker()
 
-    key_value_pattern = re.compile("(?<!.)\s*.+\s*=((\s*\S+\s*)|(\"\s*\S+\s*\"));")
+    # The file is scanned in place as bytes; only the declarations matched
+    # are decoded
+    file_data = read_file(filepath, memory_map)
 
-    global_usages = re.compile("\{.*\$[A-z]+(::([A-z]+))*?.*\}")
-    global_pattern = re.compile("(?<!.)\s*$[A-z]+(::([A-z]+))*?")
+    if (backend == "lexer"):
+        import lexer
 
-    parameter_split = re.compile("\s*,\s*")
-    assignment_split = re.compile("\s*=\s*")
+        file = lexer.scan(file_data, FileEntry(filepath), deadline)
+        if (usages):
+            _scrape_usages(file_data, file, deadline)
+        return (file.global_functions, file.bound_functions, file.datablocks, file)
 
-    comment_pattern = re.compile("//.*")
+    combined_pattern = _scrape_patterns["combined"]
+    key_value_pattern = _scrape_patterns["key_value"]
+    parameter_split = _scrape_patterns["parameter_split"]
+    assignment_split = _scrape_patterns["assignment_split"]
+    comment_pattern = _scrape_patterns["comment"]
 
-    with open(filepath, "r") as handle:
-        file = FileEntry(filepath)
+    file = FileEntry(filepath)
+
+    # Line numbers are counted incrementally from the previous match rather
+    # than from the start of the file for every match
+    line = 1
+    line_position = 0
 
-        file_data = handle.read()
+    # Parse for all sequences now
+    for match in combined_pattern.finditer(file_data):
+        check_deadline(deadline)
 
-        # Parse for all sequences now
-        for match in re.finditer(combined_pattern, file_data):
-            line = file_data[0:match.start()].count("\n") + 1
+        match_bytes = match.group(0)
 
-            match_text = match.group(0).strip()
-            if (match_text[0:8] == "function"):
-                # :: Can't occur correctly in TS in just the function body, so we determine bound functions via the
-                # presence of ::
+        # Skip the leading whitespace the pattern consumes so the line is
+        # that of the declaration itself
+        match_start = match.start() + len(match_bytes) - len(match_bytes.lstrip())
 
-                if ("::" in match_text):
-                    match_split = match.group(0).strip()[9:].split("::")
-                    type = match_split[0].lower()
+        line += file_data[line_position:match_start].count(b"\n")
+        line_position = match_start
 
-                    match_split = match_split[1].split("(")
-                    name = match_split[0].lower()
-                    match_split = match_split[1].replace(")", "").split(",")
+        match_text = match_bytes.decode(ENCODING).strip()
+        if (match_text[0:8] == "function"):
+            # :: Can't occur correctly in TS in just the function body, so we determine bound functions via the
+            # presence of ::
 
-                    parameters = [ ]
-                    for parameter in match_split:
-                        if (parameter == ""):
-                            continue
+            if ("::" in match_text):
+                match_split = match_text[9:].split("::")
+                type = match_split[0].lower()
+
+                match_split = match_split[1].split("(")
+                name = match_split[0].lower()
+                match_split = match_split[1].replace(")", "").split(",")
+
+                parameters = [ ]
+                for parameter in match_split:
+                    if (parameter == ""):
+                        continue
 
                     parameters.append(parameter.lstrip().rstrip())
 
-                    file.bound_functions.setdefault(type, [])
-                    file.bound_functions[type].append(Function(name, type, parameters, filepath, line))
-                else:
-                    match_split = match.group(0).strip()[9:].split("(")
-                    name = match_split[0].lower()
+                file.bound_functions.setdefault(type, [])
+                file.bound_functions[type].append(Function(name, type, parameters, filepath, line))
+            else:
+                match_split = match_text[9:].split("(")
+                name = match_split[0].lower()
 
-                    match_split = re.split(parameter_split, match_split[1].replace(")", ""))
+                match_split = re.split(parameter_split, match_split[1].replace(")", ""))
 
-                    parameters = [ ]
-                    for parameter in match_split:
-                        if (parameter == ""):
-                            continue
+                parameters = [ ]
+                for parameter in match_split:
+                    if (parameter == ""):
+                        continue
 
                     parameters.append(parameter.strip())
-                    file.global_functions.append(Function(name, None, parameters, filepath, line))
+                file.global_functions.append(Function(name, None, parameters, filepath, line))
+        else:
+            header = match_text[0:match_text.find("{")]
+            type = header[10:header.find("(")].strip().lower()
+            name = header[header.find("(") + 1:header.find(")")].strip().lower()
+
+            # Rip off commenting that we sometimes get in our lines
+            header = re.sub(comment_pattern, "", header).rstrip()
+
+            # Inherited?
+            inherited = None
+            inheritor = header.find(":")
+
+            if (inheritor != -1):
+                inherited = [header[inheritor + 1:].strip().lower()]
+
+            # Blow through key, values
+            properties = { }
+            for property_match in re.finditer(key_value_pattern, match_text):
+                check_deadline(deadline)
+
+                property_text = property_match.group(0)
+
+                # Rip out comments and make sure it still matches
+                property_text = re.sub(comment_pattern, "", property_text)
+                if (re.match(key_value_pattern, property_text) is None):
+                    continue
+
+                key, value = re.split(assignment_split, property_text, 1)
+                key = key.lstrip().lower()
+
+                value = value.rstrip().rstrip(";")
+
+                # Global reference
+                if (value[0] == "$"):
+                    value = Global(value[1:])
+                # String
+                elif (value[0] == "\""):
+                    value = value[1:value.rfind("\"")]
+                # Numerics
+                else:
+                    try:
+                        value = float(value)
+                    except ValueError as e:
+                        # If this was raised, treat it as a string
+                        pass
+
+                properties[key] = value
+
+            file.datablocks.append(Datablock(name, type, properties, filepath, line, inherited))
+
+    if (usages):
+        _scrape_usages(file_data, file, deadline)
+
+    return (file.global_functions, file.bound_functions, file.datablocks, file)
+
+def _string_argument(file_data, position, index):
+    """
+        Returns the lowercased contents of the argument at the given index of
+        the call whose arguments start at position, if that argument is a
+        plain string, or None.
+    """
+    argument = [ ]
+    depth = 0
+    for match in _scrape_patterns["argument"].finditer(file_data, position):
+        text = match.group(0)
+
+        if (text[0:2] == b"//" or text[0:2] == b"/*"):
+            continue
+        elif (text == b"(" or text == b"["):
+            depth += 1
+        elif ((text == b")" or text == b"]") and depth != 0):
+            depth -= 1
+        elif ((text == b")" or text == b";") and depth == 0):
+            break
+        elif (text == b"," and depth == 0):
+            if (index == 0):
+                break
+            index -= 1
+            continue
+
+        if (index == 0):
+            argument.append(text)
+
+    if (len(argument) == 1 and argument[0][0:1] in (b"\"", b"'")):
+        text = argument[0][1:]
+        if (text[-1:] == argument[0][0:1]):
+            text = text[:-1]
+        return text.decode(ENCODING).lower()
+    return None
+
+def _scrape_usages(file_data, file, deadline):
+    """
+        Records the call sites and global variable usages in a mapped file,
+        for both parser backends. Calls in a function body are made by that function, calls in a datablock body are
+        ignored and the rest are made by no function. Only what the usage
+        pattern looks for is matched, so most of the file is skipped over by
+        the pattern itself.
+    """
+    usage_pattern = _scrape_patterns["usage"]
+    path = file.path
+
+    line = 1
+    line_position = 0
+
+    # The kind of body being scanned, if any, how deeply its braces are
+    # nested and the (name, type, kind, indirect, line) of its calls so far
+    body = None
+    caller = None
+    depth = 0
+    body_calls = [ ]
+
+    for match in usage_pattern.finditer(file_data):
+        check_deadline(deadline)
+
+        kind = match.lastgroup
+        if (kind == "skip"):
+            continue
+        elif (kind == "global"):
+            name_start = match.start("global_name")
+            line += file_data[line_position:name_start].count(b"\n")
+            line_position = name_start
+
+            # Compound assignments, "++" and "--" read the variable as well
+            name = match.group("global_name").decode(ENCODING)
+            operator = match.group("operator")
+            if (operator == b"="):
+                file.globals.append(Global(name, path, line, True))
+            elif (operator is not None or match.group("increment") is not None):
+                file.globals.append(Global(name, path, line, False))
+                file.globals.append(Global(name, path, line, True))
             else:
-                line = file_data[0:match.start()].count("\n") + 1
-                match_text = match.group(0).lstrip().rstrip()
+                file.globals.append(Global(name, path, line, False))
+            continue
+        elif (kind == "brace"):
+            if (body is None):
+                continue
 
-                header = match_text[0:match_text.find("{")]
-                type = header[10:header.find("(")].strip().lower()
-                name = header[header.find("(") + 1:header.find(")")].strip().lower()
+            if (match.group(kind) == b"{"):
+                depth += 1
+                continue
 
-                # Rip off commenting that we sometimes get in our lines
-                header = re.sub(comment_pattern, "", header).rstrip()
+            depth -= 1
+            if (depth == 0):
+                if (body == "function"):
+                    file.calls += [CallSite(caller, name, type, call_kind, indirect, path, call_line) for name, type, call_kind, indirect, call_line in body_calls]
+                body = None
+                body_calls = [ ]
+            continue
+        elif (kind == "function" or kind == "datablock"):
+            if (match.group("%s_body" % kind) is None):
+                continue
 
-                # Inherited?
-                inherited = None
-                inheritor = header.find(":")
+            # Declarations nested in a body are not declarations at all
+            if (body is not None):
+                depth += 1
+                continue
 
-                if (inheritor != -1):
-                    inherited = [header[inheritor + 1:].strip().lower()]
+            body = kind
+            depth = 1
+            if (kind == "function"):
+                caller = b"".join(match.group("function_name").split()).decode(ENCODING).lower()
+            continue
+
+        # "new Type(", "function name(" and the like
+        if (match.group("keyword") is not None):
+            continue
+
+        name_start = match.start("name")
+        line += file_data[line_position:name_start].count(b"\n")
+        line_position = name_start
+
+        name = match.group("name").decode(ENCODING).lower()
+        type = None
+        argument_index = None
+        if (match.group("method") is not None):
+            call_kind = CALL_METHOD
+            if (name in INDIRECT_CALLS):
+                argument_index = INDIRECT_CALLS[name][1]
+        elif (match.group("namespace") is not None):
+            type = match.group("namespace").decode(ENCODING).lower()
+            call_kind = CALL_NAMESPACE
+            if (type == "parent"):
+                type = None
+                call_kind = CALL_PARENT
+        elif (name in CALL_KEYWORDS or name in DECLARATION_KEYWORDS):
+            continue
+        else:
+            call_kind = CALL_GLOBAL
+            if (name in INDIRECT_CALLS):
+                argument_index = INDIRECT_CALLS[name][0]
+
+        calls = [ (name, type, call_kind, False, line) ]
+        if (argument_index is not None):
+            target = _string_argument(file_data, match.end(), argument_index)
+            if (target is not None):
+                calls.append((target, None, call_kind, True, line))
+
+        if (body is not None):
+            body_calls += calls
+        else:
+            file.calls += [CallSite(None, name, type, call_kind, indirect, path, call_line) for name, type, call_kind, indirect, call_line in calls]
 
-                # Blow through key, values
-                properties = { }
-                for property_match in re.finditer(key_value_pattern, match_text):
-                    property_text = property_match.group(0)
+    # Like the lexer, an unterminated body is taken for code outside of any
+    # function
+    file.calls += [CallSite(None, name, type, call_kind, indirect, path, call_line) for name, type, call_kind, indirect, call_line in body_calls]
 
-                    # Rip out comments and make sure it still matches
-                    property_text = re.sub(comment_pattern, "", property_text)
-                    if (re.match(key_value_pattern, property_text) is None):
-                        continue
+def scrape_files(inputs):
+    """
+        Scrapes a chunk of files in one worker task. Batching files amortizes
+        the per task overhead of the process pool.
 
-                    key, value = re.split(assignment_split, property_text, 1)
-                    key = key.lstrip().lower()
+        Each result is a (payload, statistics) pair where the statistics are
+        the worker's pid and the wall and CPU time spent on the file.
+    """
+    results = [ ]
+    pid = os.getpid()
 
-                    value = value.rstrip().rstrip(";")
+    for input in inputs:
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
 
-                    # Global reference
-                    if (value[0] == "$"):
-                        value = Global(value[1:])
-                    # String
-                    elif (value[0] == "\""):
-                        value = value[1:value.rfind("\"")]
-                    # Numerics
-                    else:
-                        try:
-                            value = float(value)
-                        except ValueError as e:
-                            # If this was raised, treat it as a string
-                            pass
+        payload = scrape_file(input)
+        results.append((payload, (pid, time.perf_counter() - wall_start, time.process_time() - cpu_start)))
 
-                    properties[key] = value
+    return results
 
-                file.datablocks.append(Datablock(name, type, properties, filepath, line, inherited))
+class DeclarationState(object):
+    """
+        Class representing the tables the declaration stage builds up as
+        parsed files are fed to it one by one. Each table maps a name to every
+        declaration of it, in the order the files were discovered once the
+        declarations are finished.
+    """
+    global_functions = None
+    bound_functions = None
+    datablocks = None
 
-        return (file.global_functions, file.bound_functions, file.datablocks, file)
+    def __init__(self):
+        self.global_functions = { }
+        self.bound_functions = { }
+        self.datablocks = { }
 
 class TSScraper(object):
     _process_count = None
@@ -216,11 +1068,32 @@ class TSScraper(object):
 
     key_value_pattern = re.compile("(?<!.)\s*[A-z]+\s*=\s*(\S+);")
 
-    #block_iterator = re.compile("function\s+[A-z]+\s*\(\s*(%[A-z]+(\w*,\s*%[A-z]+)*)*\s*\)\{\S*\}")
+    # What the regex backend looks for when recording usages: comments and
+    # strings, which are skipped, braces, function and datablock headers
+    # along with the "{" opening their body, names followed by "(" along with
+    # the ".", "Namespace::" or declaration keyword before them, and "$"
+    # variables along with the "++" or "--" before them and the assignment
+    # operator after them and their subscript. Matches can only start at one
+    # of those characters or at the start of a name, which rules out most
+    # positions before any alternative is tried
+    _usage_pattern = re.compile(r"""
+        (?:(?=[/"'{}.$+-])|(?<![\w%$:])(?=[A-Za-z_]))
+        (?:
+            (?P<skip>//[^\n]*|/\*[\s\S]*?(?:\*/|\Z)|"(?:[^"\\\n]|\\.)*"?|'(?:[^'\\\n]|\\.)*'?)
+          | (?P<brace>[{}])
+          | (?P<function>(?i:function)\s+(?P<function_name>[A-Za-z_]\w*(?:\s*::\s*[A-Za-z_]\w*)?)\s*\([^(){};]*(?:\)(?P<function_body>(?:\s|//[^\n]*|/\*[\s\S]*?\*/)*\{)?)?)
+          | (?P<datablock>(?i:datablock)\s+[A-Za-z_]\w*\s*\([^(){};]*\)(?:\s*:\s*[A-Za-z_]\w*)?(?P<datablock_body>(?:\s|//[^\n]*|/\*[\s\S]*?\*/)*\{)?)
+          | (?P<call>(?:(?P<keyword>(?i:new|singleton|package|function|datablock))\s+|(?P<method>\.)\s*|(?P<namespace>[A-Za-z_]\w*)\s*::\s*)?(?P<name>[A-Za-z_]\w*)\s*\()
+          | (?P<global>(?P<increment>\+\+|--)?\s*\$(?P<global_name>[A-Za-z_]\w*(?:::\w+)*)
+                (?=\s*(?:\[[^\[\];\n]*(?:\[[^\[\];\n]*\][^\[\];\n]*)*\]\s*)?(?P<operator>[-+*/%&|^]=|\+\+|--|=(?!=))|))
+        )
+    """, re.VERBOSE)
+
+    # Pieces of the argument list of a call: strings, comments, brackets,
+    # separators and runs of anything else
+    _argument_pattern = re.compile(r"""(?:"(?:[^"\\\n]|\\.)*"?|'(?:[^'\\\n]|\\.)*'?|//[^\n]*|/\*[\s\S]*?(?:\*/|\Z)|[()\[\],;]|[^\s"'()\[\],;/]+|/)""")
 
-    # (?<!{)\s*\$[A-z]+(::([A-z]+))*?\s*(?!})
-    global_usages = re.compile("\{.*\$[A-z]+(::([A-z]+))*?.*\}")
-    global_pattern = re.compile("(?<!.)\s*$[A-z]+(::([A-z]+))*?")
+    #block_iterator = re.compile("function\s+[A-z]+\s*\(\s*(%[A-z]+(\w*,\s*%[A-z]+)*)*\s*\)\{\S*\}")
 
     parameter_split = re.compile("\s*,\s*")
     assignment_split = re.compile("\s*=\s*")
@@ -228,679 +1101,772 @@ class TSScraper(object):
 
     _log_lines = None
 
-    # Rules for verifying datablock information
-    _datablock_rules = {
-        "tracerprojectiledata": {
-            "references": [ ],
-            "optional_references": [ "projectile", "item", "sound", "splash", "explosion" ],
-            "declared": [ ],
-            "checks": {
-                "fizzletimems": (lambda x: x >= 0, "Cannot use negative fizzle time!")
-            }
-        },
-
-        "shapebaseimagedata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ "shapefile" ],
-            "checks": {
-            }
-        },
-
-        "itemdata": {
-            "references": [ ],
-            "optional_references": [ "image" ],
-            "declared": [ ],
-            "checks": { "pickupradius": (lambda x: x >= 1, "Items should have >= 1 pickup radius.")
-            }
-        },
-
-        "audioprofile": {
-            "references": [ "description" ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "simdatablock": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "jeteffectdata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ "texture" ],
-            "checks": { },
-        },
-
-        "hovervehicledata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ "catagory" ],
-            "checks": { "dragforce": (lambda x: x >= 0.01, "dragForce must be at least 0.01"),
-                        "vertfactor": (lambda x: x >= 0 and x <= 1.0, "vertFactor must be >= 0 && <= 1.0"),
-                        "floatingthrustfactor": (lambda x: x >= 0 and x <= 1.0, "floatThrustFactor must be >= 0 && <= 1.0") },
-        },
-
-        "stationfxpersonaldata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "cameradata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "triggerdata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "wheeledvehicledata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ "catagory" ],
-            "checks": { },
-        },
-
-        "tsshapeconstructor": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "bombprojectiledata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "stationfxvehicledata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "runninglightdata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { "radius": (lambda x: x >= 1, "Lights should have a radius of >= 1.") },
-        },
-
-        "staticshapedata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "decaldata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ "texturename" ],
-            "checks": { },
-        },
-
-        "repairprojectiledata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "explosiondata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "linearprojectiledata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "elfprojectiledata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "linearflareprojectiledata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "sensordata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "forcefieldbaredata": {
-            "optional_references": [ ],
-            "references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "particledata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "particleemitterdata": {
-            "references": [ "particles" ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "playerdata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { "shapefile": (lambda x: x is not None and x != "", "Must have a valid shapefile!") },
-        },
-
-        "turretdata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "turretimagedata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "shockwavedata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "seekerprojectiledata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "debrisdata": {
-            "references": [ ],
-            "declared": [ ],
-            "optional_references": [ ],
-            "checks": { },
-        },
-
-        "grenadeprojectiledata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "sniperprojectiledata": {
-            "references": [ ],
-            "declared": [ ],
-            "optional_references": [ ],
-            "checks": { },
-        },
-
-        "sniperprojectiledata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "flyingvehicledata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ "catagory" ],
-            "checks": { },
-        },
-
-        "splashdata": {
-            "references": [ ],
-            "declared": [ ],
-            "optional_references": [ ],
-            "checks": { },
-        },
-
-        "energyprojectiledata": {
-            "references": [ ],
-            "declared": [ ],
-            "optional_references": [ ],
-            "checks": { },
-        },
-
-        "flareprojectiledata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "targetprojectiledata": {
-            "references": [ ],
-            "declared": [ ],
-            "optional_references": [ ],
-            "checks": { },
-        },
-
-        "shocklanceprojectiledata": {
-            "references": [ ],
-            "declared": [ ],
-            "optional_references": [ ],
-            "checks": { },
-        },
-
-        "effectprofile": {
-            "references": [ ],
-            "declared": [ ],
-            "optional_references": [ ],
-            "checks": { },
-        },
-
-        "precipitationdata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-        },
-
-        "commandericondata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-       },
-
-        "missionmarkerdata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-       },
-
-       "particleemissiondummydata": {
-            "references": [ ],
-            "declared": [ ],
-            "optional_references": [ ],
-            "checks": { },
-      },
-
-      "fireballatmospheredata": {
-            "references": [ ],
-            "optional_references": [ ],
-            "declared": [ ],
-            "checks": { },
-      },
-
-      "audiodescription": {
-          "references": [ ],
-          "optional_references": [ ],
-          "declared": [ ],
-          "checks": { },
-      },
-
-      "lightningdata": {
-          "references": [ ],
-          "declared": [ ],
-          "checks": { },
-          "optional_references": [ ],
-      },
-
-      "audioenvironment": {
-          "references": [ ],
-          "optional_references": [ ],
-          "declared": [ ],
-          "checks": { },
-      },
-    }
+    def __init__(self, target_directory, process_count = 0, previous_results = None, cache = None, parser_backend = "regex", pool = None, rules = None, diagnostics = None, metrics = None, columnar = False, parse_timeout = PARSE_TIMEOUT, discovery = None, usages = False, memory_map = True):
+        if (parser_backend not in PARSER_BACKENDS):
+            raise ValueError("Unknown parser backend '%s'! (Available: %s)" % (parser_backend, ", ".join(PARSER_BACKENDS)))
 
-    def __init__(self, target_directory, process_count = 0, previous_results = None):
         self._process_count = process_count
+        self._parser_backend = parser_backend
         self._target_directory = target_directory
         self.previous_results = previous_results
+        self.cache = cache
+        self.pool = pool
         self._log_lines = [ ]
 
-    def get_file_list(self, directory):
-        output = [ ]
+        # Everything the analysis stages find is recorded here rather than printed
+        if (diagnostics is None):
+            diagnostics = DiagnosticCollector()
+        self.diagnostics = diagnostics
+
+        # Per stage timings and counters
+        if (metrics is None):
+            metrics = Metrics()
+        self.metrics = metrics
+
+        # Whether to build the NumPy backed property store and run numeric
+        # checks as vector operations
+        self.columnar = columnar
+
+        # Parse time budget per file in seconds, or None for no limit
+        self.parse_timeout = parse_timeout
+
+        # Which files below the target directory are scanned
+        if (discovery is None):
+            discovery = FileDiscovery()
+        self.discovery = discovery
+
+        # Whether to record call sites and global variable usages and build
+        # the call graph and global variable index from them. Neither is
+        # needed to check a mod, so they are only collected on request
+        self.usages = usages
+
+        # Whether files are memory mapped for parsing rather than read, see
+        # read_file. Watching processes that outlive edits to the files read
+        # them instead
+        self.memory_map = memory_map
+
+        # Parsed files by absolute path, the order they were declared in, the
+        # declaration tables and the latest results, kept so that update() can
+        # re-analyze without re-scraping or re-checking unchanged files
+        self._file_entries = { }
+        self._file_order = { }
+        self._declarations = None
+        self.results = None
+
+        # Rules for verifying datablock information
+        if (rules is None):
+            rules = load_rules()
+        self.rules = rules
+
+    @staticmethod
+    def create_pool(process_count):
+        """
+            Creates a worker pool suitable for the parse stage. A single pool
+            can be passed to several scrapers so workers are only started once.
+        """
+        return workers.WorkerPool(process_count, initializer=initialize_worker)
+
+    @classmethod
+    def parse_fingerprint(cls, parser_backend = "regex"):
+        """
+            Returns a string identifying the parser that produced a given set
+            of scrape_file results. Persistent caches are only valid for the
+            fingerprint they were written with.
+        """
+        fingerprint = hashlib.sha1()
+        fingerprint.update(("%u:%s" % (PARSER_VERSION, parser_backend)).encode("utf-8"))
+        fingerprint.update(cls._combined_pattern.pattern.encode("utf-8"))
+        fingerprint.update(cls._usage_pattern.pattern.encode("utf-8"))
+        fingerprint.update(cls.parameter_split.pattern.encode("utf-8"))
+        return fingerprint.hexdigest()
 
-        previous_working_directory = os.getcwd()
-        os.chdir(directory)
+    def get_file_list(self, directory):
+        """
+            Returns the (absolute path, lowercased relative path) pairs of the
+            script files below the given directory.
+        """
+        return [(file.path, file.relative_path.lower()) for file in self.discovery.find(directory)]
 
-        for root, dirs, files in os.walk("."):
-            for filename in files:
-                relative_path = os.path.join(root, filename)
+    def _parse_stage(self, target_files):
+        """
+            Generator yielding the scrape_file results of each target file as
+            they become available. Cached results are produced first; the rest
+            are scraped by the worker pool, largest files first, and come back
+            in whatever order the workers finish them, so the caller can merge
+            each result and drop it before the remaining files have been
+            parsed. Anything that depends on the order of the files must use
+            their order in target_files instead.
+        """
+        positions = { }
+        for target_file in target_files:
+            positions.setdefault(target_file, len(positions))
+
+        # Consult the parse cache first so only changed files are scraped
+        pending_files = [ ]
+        signatures = { }
+        if (self.cache is not None):
+            hit_count = 0
+            for target_file in positions:
+                payload, signature = self.cache.lookup(target_file, self.usages)
+
+                if (payload is not None):
+                    hit_count += 1
+                    self.metrics.count("parse", "cache_hits")
+                    yield payload
+                else:
+                    signatures[target_file] = signature
+                    pending_files.append(target_file)
 
-                if (not os.path.isfile(relative_path)):
-                    continue
+            print("INFO: Parse cache: %u hits, %u files to scrape." % (hit_count, len(pending_files)))
+        else:
+            pending_files = list(positions)
 
-                absolute_path = os.path.realpath(relative_path)
+        input = [ ]
+        sizes = [ ]
+        for target_file in pending_files:
+            input.append((target_file, self._parser_backend, self.parse_timeout, self.usages, self.memory_map))
+            sizes.append(os.stat(target_file).st_size)
 
-                # Only check TS files
-                name, extension = os.path.splitext(filename)
-                if (extension != ".cs"):
-                    continue
+        file_sizes = dict(zip(pending_files, sizes))
 
-                output.append((absolute_path, relative_path.lower()))
+        pool = self.pool
+        if (pool is None):
+            pool = TSScraper.create_pool(self._process_count)
 
-        os.chdir(previous_working_directory)
-        return output
+        try:
+            isolated = self.parse_timeout is not None and self._parser_backend not in POLLED_BACKENDS
+            for payload, statistics in pool.run(scrape_files, input, sizes, isolated):
+                global_functions, bound_functions, datablocks, file = payload
+                pid, wall_time, cpu_time = statistics
 
-    def _parse_stage(self, target_files):
-        results = None
-        if (self._process_count > 0):
-            # Create a list with all the required data for the multi-process
-            input = [ ]
+                matches = len(global_functions) + len(datablocks)
+                for classname in bound_functions:
+                    matches += len(bound_functions[classname])
 
-            for target_file in target_files:
-                input.append((target_file, self.parameter_split, self._combined_pattern))
+                self.metrics.count("parse", "files_scraped")
+                self.metrics.count("parse", "bytes", file_sizes[file.path])
+                self.metrics.count("parse", "matches", matches)
+                self.metrics.record_worker(pid, 1, file_sizes[file.path], matches, wall_time, cpu_time)
 
-            pool = multiprocessing.Pool(processes=self._process_count)
-            results = pool.map(scrape_file, input)
-        else:
-            results = [ ]
+                # Files that ran out of time are retried on the next run
+                if (self.cache is not None and file.parse_error is None):
+                    self.cache.store(file.path, signatures[file.path], payload, self.usages)
 
-            for target_file in target_files:
-                results.append(scrape_file((target_file, self.parameter_split, self._combined_pattern)))
+                yield payload
+        finally:
+            # Only pools we created ourselves are torn down here
+            if (pool is not self.pool):
+                pool.close()
 
-        return results
+        if (self.cache is not None):
+            self.cache.save()
 
     def _declaration_stage(self, parse_results):
-         # Entries we've already processed
-        processed_entries = { }
-
-        # For each file entry
-        known_datablocks = { }
+        declarations = DeclarationState()
 
         for file in parse_results:
-            # For each global function
-            for global_function in file.global_functions:
-                processed_entries.setdefault(global_function.name, global_function)
-
-                # Check for declarations
-                if (processed_entries[global_function.name] is not global_function):
-                    known_entry = processed_entries[global_function.name]
-
-                    # Redeclaration with different param count
-                    if (len(known_entry.parameters) != len(global_function.parameters)):
-                        global_function.aliases.append(known_entry)
-                        known_entry.aliases.append(global_function)
-                        print("Warning: Global function '%s' redeclared with %u parameters in %s, line %u! (Original declaration in %s, line %u with %u parameters)" % (known_entry.name, len(global_function.parameters), global_function.filepath, global_function.line, known_entry.filepath, known_entry.line, len(known_entry.parameters)))
-                    # Regular Redeclaration
-                    else:
-                        global_function.aliases.append(known_entry)
-                        known_entry.aliases.append(global_function)
-                        print("Warning: Global function '%s' redeclared in %s, line %u! (Original declaration in %s, line %u)" % (known_entry.name, global_function.filepath, global_function.line, known_entry.filepath, known_entry.line))
-
-            processed_entries = { }
-
-            # For each bound function
-            for bound_type in file.bound_functions.keys():
-                for bound_function in file.bound_functions[bound_type]:
-                    processed_entries.setdefault(bound_function.type, {})
-                    processed_entries[bound_function.type].setdefault(bound_function.name, bound_function)
-
-                    # Check for declarations
-                    if (processed_entries[bound_function.type][bound_function.name] is not bound_function):
-                        known_entry = processed_entries[bound_function.type][bound_function.name]
-
-                        # Redeclaration with different param count
-                        if (len(known_entry.parameters) != len(bound_function.parameters)):
-                            bound_function.aliases.append(known_entry)
-                            known_entry.aliases.append(bound_function)
-                            print("Warning: Bound function '%s::%s' redeclared with %u parameters in %s, line %u! (Original declaration in %s, line %u with %u parameters)" % (known_entry.type, known_entry.name, len(bound_function.parameters), bound_function.filepath, bound_function.line, known_entry.filepath, known_entry.line, len(known_entry.parameters)))
-                        # Regular Redeclaration
-                        else:
-                            bound_function.aliases.append(known_entry)
-                            known_entry.aliases.append(bound_function)
-                            print("Warning: Bound function '%s::%s' redeclared in %s, line %u! (Original declaration in %s, line %u)" % (known_entry.type, known_entry.name, bound_function.filepath, bound_function.line, known_entry.filepath, known_entry.line))
-
-            processed_entries = { }
-
-            # For each datablock
-            for datablock in file.datablocks:
-                processed_entries.setdefault(datablock.name, datablock)
-
-                known_datablocks.setdefault(datablock.name, [])
-                known_datablocks[datablock.name].append(datablock)
-
+            self._file_order.setdefault(file.path, len(self._file_order))
+            self._declare_file(file, declarations)
+
+        return self._finish_declarations(declarations)
+
+    def _report_redeclaration(self, known_entry, function):
+        """
+            Links a redeclared function with its original declaration and
+            reports it.
+        """
+        function.add_alias(known_entry)
+        known_entry.add_alias(function)
+
+        if (function.type is None):
+            # Redeclaration with different param count
+            if (len(known_entry.parameters) != len(function.parameters)):
+                self.diagnostics.warning("global-function-redeclared", "Global function '%s' redeclared with %u parameters! (Original declaration in %s, line %u with %u parameters)" % (known_entry.name, len(function.parameters), known_entry.filepath, known_entry.line, len(known_entry.parameters)), function.filepath, function.line, function.name)
+            # Regular Redeclaration
+            else:
+                self.diagnostics.warning("global-function-redeclared", "Global function '%s' redeclared! (Original declaration in %s, line %u)" % (known_entry.name, known_entry.filepath, known_entry.line), function.filepath, function.line, function.name)
+        else:
+            # Redeclaration with different param count
+            if (len(known_entry.parameters) != len(function.parameters)):
+                self.diagnostics.warning("bound-function-redeclared", "Bound function '%s::%s' redeclared with %u parameters! (Original declaration in %s, line %u with %u parameters)" % (known_entry.type, known_entry.name, len(function.parameters), known_entry.filepath, known_entry.line, len(known_entry.parameters)), function.filepath, function.line, "%s::%s" % (function.type, function.name))
+            # Regular Redeclaration
+            else:
+                self.diagnostics.warning("bound-function-redeclared", "Bound function '%s::%s' redeclared! (Original declaration in %s, line %u)" % (known_entry.type, known_entry.name, known_entry.filepath, known_entry.line), function.filepath, function.line, "%s::%s" % (function.type, function.name))
+
+    def _declare_file(self, file, declarations):
+        """
+            Adds the declarations of a single parsed file to the declaration
+            tables. This is called as each file's parse results arrive, in no
+            particular order, so the declaration stage overlaps with the parse
+            stage; _finish_declarations puts them in discovery order.
+        """
+        # For each global function
+        for global_function in file.global_functions:
+            declarations.global_functions.setdefault(global_function.name, []).append(global_function)
+
+        # For each bound function
+        for bound_type in file.bound_functions.keys():
+            for bound_function in file.bound_functions[bound_type]:
+                declarations.bound_functions.setdefault(bound_function.type, {}).setdefault(bound_function.name, []).append(bound_function)
+
+        # For each datablock
+        for datablock in file.datablocks:
+            declarations.datablocks.setdefault(datablock.name, [])
+            declarations.datablocks[datablock.name].append(datablock)
+
+    def _report_datablock_redeclaration(self, name, occurrences):
+        if (len(occurrences) != 1):
+            locations = ", ".join(["%s:%u" % (occurrence.filepath, occurrence.line) for occurrence in occurrences])
+            self.diagnostics.warning("datablock-redeclared", "Datablock '%s' redeclared %u times! (In %s)" % (name, len(occurrences), locations), occurrences[0].filepath, occurrences[0].line, name)
+
+    def _declaration_order(self, entry):
+        return (self._file_order[entry.filepath], entry.line)
+
+    def _finish_declarations(self, declarations):
+        """
+            Sorts the declarations of every name by where their files were
+            discovered, so that the first one is the original regardless of
+            which file was parsed first, and reports the redeclarations.
+        """
+        redeclared = [ ]
+        function_tables = [ declarations.global_functions ] + list(declarations.bound_functions.values())
+        for table in function_tables:
+            for entries in table.values():
+                if (len(entries) != 1):
+                    entries.sort(key=self._declaration_order)
+                    redeclared += [(entries[0], entry) for entry in entries[1:]]
+
+        # Reported file by file, global functions first
+        redeclared.sort(key=lambda pair: (self._file_order[pair[1].filepath], pair[1].type is not None, pair[1].line))
+        for known_entry, function in redeclared:
+            self._report_redeclaration(known_entry, function)
+
+        for entries in declarations.datablocks.values():
+            if (len(entries) != 1):
+                entries.sort(key=self._declaration_order)
+
+        # Names are listed in the order they were first declared in
+        declarations.datablocks = dict(sorted(declarations.datablocks.items(), key=lambda item: self._declaration_order(item[1][0])))
+        known_datablocks = declarations.datablocks
 
         # Check for datablock declarations
         for datablock in known_datablocks:
-            occurrence_count = len(known_datablocks[datablock])
-            if (occurrence_count != 1):
-                print("Warning: Datablock '%s' redeclared %u times!" % (datablock, occurrence_count))
-
-                for occurrence in known_datablocks[datablock]:
-                    print("   In %s:%u" % (occurrence.filepath, occurrence.line))
+            self._report_datablock_redeclaration(datablock, known_datablocks[datablock])
 
         return known_datablocks
 
+    def _check_inheritance(self, datablock, datablock_list):
+        # Process all parents
+        if (datablock.derived is not None):
+            for parent in datablock.derived:
+                # Unknown parents are left in place so a later update can
+                # resolve them; DatablockHierarchy skips them
+                if (parent.lower() not in datablock_list):
+                    self.diagnostics.warning("unknown-parent", "Datablock '%s' derives from non-existent parent '%s'!" % (datablock.name, parent), datablock.filepath, datablock.line, datablock.name)
+
     def _inheritance_stage(self, parse_results, datablock_list):
         # For each file entry
         for file in parse_results:
             # For each datablock
             for datablock in file.datablocks:
-                # Process all parents
-                if (datablock.derived is not None):
-                    for parent in datablock.derived:
-                        if (parent.lower() not in datablock_list):
-                            print("Warning: Datablock '%s' derives from non-existent parent '%s'! (Declaration in %s, line %u)" % (datablock.name, parent, datablock.filepath, datablock.line))
-                            datablock.derived.remove(parent)
-                elif (datablock.derived is not None):
-                    datablock.derived = datablock_list[datablock.derived]
-
-    def _reference_stage(self, parse_results, datablock_list):
-        # For each file entry
-        for file in parse_results:
-            # For each datablock
-            for datablock in file.datablocks:
-                if (datablock.type in self._datablock_rules):
-                    # We have a bunch of rules to check, so we recurse parent classes where necessary.
-                    parent_classes = [ datablock.name ]
-
-                    # Recurse down the hierarchy
-                    def process_parents(current, result):
-                        if (current.derived is not None):
-                            result += current.derived
-                            for parent in current.derived:
-                                parent_declarations = datablock_list[parent]
-
-                                # Check for the property on each parent block
-                                for parent in parent_declarations:
-                                    process_parents(parent, result)
-                        return result
-
-                    process_parents(datablock, parent_classes)
-
-                    # Flip through each reference in the table
-                    references = self._datablock_rules[datablock.type]["references"] + self._datablock_rules[datablock.type]["optional_references"]
-                    for reference in references:
-                        found_reference = False
-
-                        for parent in parent_classes:
-                            # FIXME: Deal with datablock redeclarations?
-                            parent_datablock = datablock_list[parent][0]
+                self._check_inheritance(datablock, datablock_list)
+
+    def _report_missing_check(self, datablock, check):
+        self.diagnostics.warning("missing-checked-property", "%s Datablock %s '%s' property not declared and parent datablocks do not declare it!" % (datablock.type, datablock.name, check.property), datablock.filepath, datablock.line, datablock.name)
+
+    def _report_failed_check(self, datablock, check):
+        self.diagnostics.warning("property-check", "Datablock '%s', type %s: %s" % (datablock.name, datablock.type, check.message), datablock.filepath, datablock.line, datablock.name)
+
+    def _columnar_checks(self, store):
+        """
+            Runs the custom property checks of every rule as vector operations
+            over the columnar store, one batch per datablock type and check.
+        """
+        for type in store.tables:
+            rule = self.rules.get(type)
+            if (rule is None):
+                continue
 
-                            if (reference in parent_datablock.properties):
-                                if (parent_datablock.properties[reference].lower() not in datablock_list):
-                                    print("Reference Warning: %s Datablock '%s' references '%s' in property '%s', which does not exist! (Declaration in %s, line %u)" % (datablock.type, datablock.name, datablock.properties[reference], reference, datablock.filepath, datablock.line))
-                                    break
-                                else:
-                                    found_reference = True
-                                    break
+            table = store.get(type)
+            for check in rule.checks:
+                missing, failed = store.evaluate(type, check)
 
-                        if (found_reference is False and reference in self._datablock_rules[datablock.type]["references"]):
-                            print("Reference Warning: %s datablock '%s' has no '%s' declaration! (Declaration in %s, line %u)" % (datablock.type, datablock.name, reference, datablock.filepath, datablock.line))
+                for row in missing.nonzero()[0]:
+                    self._report_missing_check(table.datablocks[row], check)
+                for row in failed.nonzero()[0]:
+                    self._report_failed_check(table.datablocks[row], check)
 
-                    # Check each declaration
-                    for declaration in self._datablock_rules[datablock.type]["declared"]:
-                        found_declaration = False
+    def _check_datablock(self, datablock, datablock_list, hierarchy, store=None):
+        rule = self.rules.get(datablock.type)
 
-                        for parent in parent_classes:
-                            # FIXME: Deal with datablock redeclarations?
-                            parent_datablock = datablock_list[parent][0]
+        if (rule is not None):
+            # Everything declared on the datablock or inherited from its parents
+            properties = hierarchy.effective_properties(datablock)
 
-                            if (declaration in parent_datablock.properties):
-                                found_declaration = True
-                                break
+            # Flip through each reference in the table
+            for reference in rule.all_references():
+                if (reference in properties):
+                    value = properties[reference]
 
-                        if (found_declaration is False):
-                            print("Declaration Warning: %s Datablock '%s' required property '%s' not declared or inherited! (Declaration in %s, line %u)" % (datablock.type, datablock.name, declaration, datablock.filepath, datablock.line))
+                    # References through globals can't be resolved statically
+                    if (isinstance(value, Global)):
+                        continue
 
-                    # Run custom checks
-                    for check in self._datablock_rules[datablock.type]["checks"].keys():
-                        found_check = False
+                    if (str(value).lower() not in datablock_list):
+                        self.diagnostics.warning("missing-reference", "%s Datablock '%s' references '%s' in property '%s', which does not exist!" % (datablock.type, datablock.name, value, reference), datablock.filepath, datablock.line, datablock.name)
+                elif (reference in rule.references):
+                    self.diagnostics.warning("undeclared-reference", "%s datablock '%s' has no '%s' declaration!" % (datablock.type, datablock.name, reference), datablock.filepath, datablock.line, datablock.name)
+
+            # Check each declaration
+            for declaration in rule.declared:
+                if (declaration not in properties):
+                    self.diagnostics.warning("missing-declaration", "%s Datablock '%s' required property '%s' not declared or inherited!" % (datablock.type, datablock.name, declaration), datablock.filepath, datablock.line, datablock.name)
+
+            # Run custom checks, unless they run batched over the columnar store
+            if (store is None):
+                for check in rule.checks:
+                    if (check.property not in properties):
+                        self._report_missing_check(datablock, check)
+                    elif (not check(properties[check.property])):
+                        self._report_failed_check(datablock, check)
+        else:
+            self.diagnostics.error("unknown-datablock-type", "Unknown datablock type '%s'! This means the software does not know how to check this datablock." % datablock.type, datablock.filepath, datablock.line, datablock.name)
 
-                        for parent in parent_classes:
-                            # FIXME: Deal with datablock redeclarations?
-                            parent_datablock = datablock_list[parent][0]
+    def _check_referenced(self, name, datablock_list, reference_index):
+        current_datablock = datablock_list[name][0]
 
-                            # Is it declared?
-                            if (check not in parent_datablock.properties.keys()):
-                                continue
+        # Not a reference-only type
+        if (current_datablock.type not in STANDALONE_TYPES):
+            return
 
-                            found_check = True
-                            method, message = self._datablock_rules[parent_datablock.type]["checks"][check]
+        # Check if any other datablock has a property value equal to our current datablock name
+        for checked_datablock in reference_index.referrers(name):
+            if (checked_datablock.name != name):
+                return
 
-                            if (not method(parent_datablock.properties[check])):
-                                print("Property Warning (Datablock '%s', type %s. Declaration in %s, line %u): %s" % (datablock.name, datablock.type, datablock.filepath, datablock.line, message))
+        self.diagnostics.warning("unreferenced-datablock", "%s Datablock %s does not appear to be referenced by any other datablock!" % (current_datablock.type, current_datablock.name), current_datablock.filepath, current_datablock.line, current_datablock.name)
 
-                            break
+    def _reference_stage(self, parse_results, datablock_list, reference_index, hierarchy, store=None):
+        # For each file entry
+        for file in parse_results:
+            # For each datablock
+            for datablock in file.datablocks:
+                self._check_datablock(datablock, datablock_list, hierarchy, store)
 
-                        if (found_check is False):
-                            print("Inherited Property Warning: %s Datablock %s '%s' property not declared and parent datablocks do not declare it! (Declaration in %s, line %u)" % (datablock.type, datablock.name, check, datablock.filepath, datablock.line))
-                else:
-                    print("Program Error: Unknown datablock type '%s'! This means the software does not know how to check this datablock. (Declaration in %s, line %u)" % (datablock.type, datablock.filepath, datablock.line))
+        if (store is not None):
+            self._columnar_checks(store)
 
         # Datablock referential analysis
         print("INFO: Performing datablock referential analysis ...")
 
-        # There are only a handful of proper standalone types:
-        standalone_types = [ "particledata", "audiodescription", "splashdata", "debrisdata", "sensordata", "decaldata" ] # audioprofile
         for current_datablock_name in datablock_list:
-            current_datablock = datablock_list[current_datablock_name][0]
-
-            # Not a reference-only type
-            if (current_datablock.type not in standalone_types):
-                continue
+            self._check_referenced(current_datablock_name, datablock_list, reference_index)
 
-            found_reference = False
-            for checked_datablock_name in datablock_list:
-                if (checked_datablock_name == current_datablock_name):
-                    continue
-
-                checked_datablock = datablock_list[checked_datablock_name][0]
-
-                # Check if any of the property values equals our current datablock name
-                for property_name in checked_datablock.properties:
-                    property_value = checked_datablock.properties[property_name]
-
-                    if (type(property_value) is str and property_value.lower() == current_datablock_name):
-                        found_reference = True
-                        break
-
-                if (found_reference is True):
-                    break
-
-            if (found_reference is False):
-                print("Datablock Referential Warning: %s Datablock %s does not appear to be referenced by any other datablock! (Declaration in %s, line %u)" % (current_datablock.type, current_datablock.name, current_datablock.filepath, current_datablock.line))
-
-    def process(self):
+    def _discovery_stage(self):
         # Process each directory sequentially
         target_files = { }
 
         if (os.path.isdir(self._target_directory) is False):
-            raise IOError("No such directory to recurse (#%u): '%s'" % (index, self._target_directory))
+            raise IOError("No such directory to recurse: '%s'" % self._target_directory)
 
         print("INFO: Building file list for directory '%s' ..." % self._target_directory)
-        current_files = self.get_file_list(self._target_directory)
+        with self.metrics.stage("discovery"):
+            current_files = self.get_file_list(self._target_directory)
 
-        # Does a previous entry exist in the target file list?
-        for current_absolute_path, current_relative_path in current_files:
-            target_files[current_relative_path] = current_absolute_path
+            # Does a previous entry exist in the target file list?
+            for current_absolute_path, current_relative_path in current_files:
+                target_files[current_relative_path] = current_absolute_path
 
-        # Build the list now
-        target_file_list = [ ]
+            # Build the list now
+            target_file_list = [ ]
 
-        for current_relative_file in target_files.keys():
-            target_file_list.append(target_files[current_relative_file])
+            for current_relative_file in target_files.keys():
+                target_file_list.append(target_files[current_relative_file])
 
-        # Perform the initial parse
-        print("INFO: Performing parse stage ...")
+            self.metrics.count("discovery", "files", len(target_file_list))
 
-        file_list = [ ]
+        return target_file_list
+
+    def _analyze(self, file_list, declarations):
+        """
+            Runs every stage after parsing over the given parsed files and
+            returns the results dictionary. The declaration state holds the
+            files that were already declared while parsing.
+        """
         global_function_list = [ ]
         bound_function_list = { }
-        datablock_list = { }
-        for payload in self._parse_stage(target_file_list):
-            global_functions, bound_functions, datablocks, file = payload
+        for file in file_list:
+            global_function_list += file.global_functions
 
-            file_list.append(file)
-            global_function_list += global_functions
+            for classname in file.bound_functions:
+                bound_function_list.setdefault(classname, [])
+                bound_function_list[classname] += file.bound_functions[classname]
 
-            # Write out datablocks
-            for datablock in datablocks:
-                datablock_list[datablock.name] = datablock
+        self._declarations = declarations
 
-            for classname in bound_functions:
-                bound_function_list.setdefault(classname, [])
-                bound_function_list[classname] += bound_functions[classname]
+        with self.metrics.stage("declaration"):
+            datablock_list = dict(self._finish_declarations(declarations))
 
-        # Perform the declaration analysis
-        print("INFO: Performing declaration analysis. ...")
-        datablock_list = self._declaration_stage(file_list)
+            # Combine previous datablock listings with current ones
+            # TODO: Refactor the programming to use a global lookup when performing referential checks
+            if (self.previous_results is not None):
+                for datablock_name in self.previous_results["datablocks"]:
+                    # Don't overwrite current datablock listings with base ones
+                    if (datablock_name not in datablock_list):
+                        datablock_list[datablock_name] = self.previous_results["datablocks"][datablock_name]
 
-        # Combine previous datablock listings with current ones
-        # TODO: Refactor the programming to use a global lookup when performing referential checks
-        if (self.previous_results is not None):
-            for datablock_name in self.previous_results["datablocks"]:
-                # Don't overwrite current datablock listings with base ones
-                if (datablock_name not in datablock_list):
-                    datablock_list[datablock_name] = self.previous_results["datablocks"][datablock_name]
+            # Build the inverted index of datablock property values once so the
+            # referential analysis and consumers of the results can query it
+            reference_index = ReferenceIndex(datablock_list)
+            self.metrics.count("declaration", "datablock_names", len(datablock_list))
 
         # Perform DB inheritance analysis
         print("INFO: Performing datablock inheritance analysis ...")
-        self._inheritance_stage(file_list, datablock_list)
+        with self.metrics.stage("inheritance"):
+            self._inheritance_stage(file_list, datablock_list)
+
+            # Resolve every inheritance chain once, up front
+            hierarchy = DatablockHierarchy(datablock_list)
+            for cycle in hierarchy.cycles:
+                datablock = datablock_list[cycle[0]][0]
+                self.diagnostics.warning("inheritance-cycle", "Datablock '%s' has a cyclic inheritance chain: %s!" % (datablock.name, " -> ".join(cycle)), datablock.filepath, datablock.line, datablock.name)
+
+        store = None
+        if (self.columnar):
+            print("INFO: Building columnar property store ...")
+            with self.metrics.stage("columnar"):
+                store = columnar.ColumnarStore((datablock for file in file_list for datablock in file.datablocks), hierarchy)
 
         # Perform DB reference analysis
         print("INFO: Performing datablock reference analysis ...")
-        self._reference_stage(file_list, datablock_list)
+        with self.metrics.stage("reference"):
+            self._reference_stage(file_list, datablock_list, reference_index, hierarchy, store)
+
+        calls = None
+        global_index = None
+        if (self.usages):
+            print("INFO: Building call graph ...")
+            with self.metrics.stage("callgraph"):
+                calls = callgraph.CallGraph(file_list)
+                self.metrics.count("callgraph", "functions", len(calls.functions))
+
+            print("INFO: Indexing global variables ...")
+            with self.metrics.stage("globals"):
+                global_index = GlobalIndex(file_list)
+
+                # Usages in the base scripts count towards the mod's as well
+                if (self.previous_results is not None and self.previous_results.get("globals") is not None):
+                    global_index.merge(self.previous_results["globals"])
+                self.metrics.count("globals", "names", len(global_index.names()))
+
+            print("INFO: Performing usage analysis ...")
+            with self.metrics.stage("usages"):
+                self._usage_stage(calls, global_index)
 
         # We're done, return the results
         print("INFO: Done.")
 
-        return { "files": file_list, "datablocks": datablock_list, "bound_functions": bound_function_list,
-        "global_functions": global_function_list }
+        self.results = { "files": file_list, "datablocks": datablock_list, "bound_functions": bound_function_list,
+        "global_functions": global_function_list, "references": reference_index, "hierarchy": hierarchy,
+        "diagnostics": self.diagnostics, "metrics": self.metrics, "columns": store, "calls": calls,
+        "globals": global_index }
+        return self.results
+
+    def process(self):
+        target_file_list = self._discovery_stage()
+
+        # Perform the initial parse, running the declaration analysis on each
+        # file as its results arrive
+        print("INFO: Performing parse stage and declaration analysis ...")
+
+        # Files arrive in no particular order, so everything that depends on
+        # their order goes by where they were discovered
+        self._file_entries = { }
+        self._file_order = { }
+        for target_file in target_file_list:
+            self._file_order.setdefault(target_file, len(self._file_order))
+
+        declarations = DeclarationState()
+        # Files are declared as they are parsed, which is not part of the
+        # parse stage
+        for payload in self.metrics.timed("parse", self._parse_stage(target_file_list)):
+            global_functions, bound_functions, datablocks, file = payload
+            self._file_entries[file.path] = file
+
+            with self.metrics.stage("declaration"):
+                self._declare_file(file, declarations)
+
+        self.metrics.count("parse", "files", len(self._file_entries))
+
+        file_list = sorted(self._file_entries.values(), key=lambda file: self._file_order[file.path])
+        self._file_entries = dict([(file.path, file) for file in file_list])
+        for file in file_list:
+            self._report_parse_error(file)
+
+        return self._analyze(file_list, declarations)
+
+    def call_roots(self, calls):
+        """
+            Returns the functions of the given call graph that are assumed to
+            be called from outside of the target: script level code, engine
+            and network callbacks, and every function overriding one declared
+            in base, which base itself may call.
+        """
+        roots = calls.entry_points()
+        if (self.previous_results is not None):
+            roots += [callgraph.function_key(function) for function in self.previous_results["global_functions"]]
+            for type in self.previous_results["bound_functions"]:
+                roots += [callgraph.function_key(function) for function in self.previous_results["bound_functions"][type]]
+        return roots
+
+    def _usage_stage(self, calls, global_index):
+        """
+            Reports the functions of the target that nothing can call and the
+            globals the target reads that no script assigns. Both are notes,
+            since the engine and the console call functions and set globals
+            that no script mentions.
+        """
+        for key in calls.unreachable(self.call_roots(calls)):
+            for function in calls.functions[key]:
+                self.diagnostics.note("unreachable-function", "Function '%s' is never called by any script!" % key, function.filepath, function.line, key)
+
+        for name in global_index.unset():
+            usages = [usage for usage in global_index.usages(name) if usage.filepath in self._file_entries]
+            if (len(usages) != 0):
+                self.diagnostics.note("unset-global", "Global '$%s' is read but never assigned by any script!" % name, usages[0].filepath, usages[0].line, "$%s" % name)
+
+    def _report_parse_error(self, file):
+        if (file.parse_error is not None):
+            self.diagnostics.error("parse-timeout", file.parse_error, file.path)
+            self.metrics.count("parse", "timeouts")
+
+    def _merge_declarations(self, entries, new_entries, affected_paths):
+        """
+            Replaces the declarations of one name that came from the affected
+            files with their new versions, keeping declaration order.
+        """
+        result = [entry for entry in entries if entry.filepath not in affected_paths] + new_entries
+        result.sort(key=self._declaration_order)
+        return result
+
+    def update(self, changed_paths, removed_paths):
+        """
+            Incrementally re-analyzes the target after the given files were
+            created, modified or removed. process() must have been called
+            first and self.results is updated in place.
+
+            Only the changed files are re-scraped. Redeclaration checks are
+            re-run for the names declared in the old or new versions of those
+            files; inheritance and reference checks for the changed datablocks,
+            everything inheriting from them and every datablock referencing
+            them; and the unreferenced check for every name they referenced
+            before or after. Returns the (added, removed) lists of diagnostics.
+
+            The global variable index is updated by file as well, but the call
+            graph and the columnar property store, when they were built, are
+            rebuilt in full from every file: a changed declaration can change
+            how calls anywhere resolve and the inherited properties of any
+            datablock below it.
+        """
+        results = self.results
+        declarations = self._declarations
+        datablock_list = results["datablocks"]
+        reference_index = results["references"]
+        hierarchy = results["hierarchy"]
+
+        changed_paths = [path for path in changed_paths if os.path.isfile(path)]
+        affected_paths = set(changed_paths) | set(removed_paths)
+
+        old_files = [self._file_entries[path] for path in affected_paths if path in self._file_entries]
+        for path in removed_paths:
+            self._file_entries.pop(path, None)
+
+        new_files = [ ]
+        with self.metrics.stage("parse"):
+            for payload in self._parse_stage(changed_paths):
+                file = payload[3]
+                self._file_order.setdefault(file.path, len(self._file_order))
+                self._file_entries[file.path] = file
+                new_files.append(file)
+
+        with self.metrics.stage("update"):
+            # Every entity declared in the old or new version of an affected file
+            new_global_functions = { }
+            new_bound_functions = { }
+            new_datablocks = { }
+            for file in new_files:
+                for global_function in file.global_functions:
+                    new_global_functions.setdefault(global_function.name, []).append(global_function)
+
+                for bound_type in file.bound_functions:
+                    for bound_function in file.bound_functions[bound_type]:
+                        new_bound_functions.setdefault((bound_function.type, bound_function.name), []).append(bound_function)
+
+                for datablock in file.datablocks:
+                    new_datablocks.setdefault(datablock.name, []).append(datablock)
+
+            global_names = set(new_global_functions)
+            bound_names = set(new_bound_functions)
+            datablock_names = set(new_datablocks)
+            for file in old_files:
+                global_names.update([global_function.name for global_function in file.global_functions])
+                for bound_type in file.bound_functions:
+                    bound_names.update([(bound_function.type, bound_function.name) for bound_function in file.bound_functions[bound_type]])
+                datablock_names.update([datablock.name for datablock in file.datablocks])
+
+            # Update the declaration tables
+            for name in global_names:
+                entries = self._merge_declarations(declarations.global_functions.get(name, [ ]), new_global_functions.get(name, [ ]), affected_paths)
+                if (len(entries) != 0):
+                    declarations.global_functions[name] = entries
+                else:
+                    declarations.global_functions.pop(name, None)
+
+            for type, name in bound_names:
+                type_functions = declarations.bound_functions.setdefault(type, { })
+                entries = self._merge_declarations(type_functions.get(name, [ ]), new_bound_functions.get((type, name), [ ]), affected_paths)
+                if (len(entries) != 0):
+                    type_functions[name] = entries
+                else:
+                    type_functions.pop(name, None)
+
+            # Swap the changed datablock entries, falling back to base where the
+            # target no longer declares a name, and re-index their values
+            referenced_names = set(datablock_names)
+            base_datablocks = None
+            if (self.previous_results is not None):
+                base_datablocks = self.previous_results["datablocks"]
+
+            for name in datablock_names:
+                entries = self._merge_declarations(declarations.datablocks.get(name, [ ]), new_datablocks.get(name, [ ]), affected_paths)
+
+                current = entries
+                if (len(entries) != 0):
+                    declarations.datablocks[name] = entries
+                else:
+                    declarations.datablocks.pop(name, None)
+                    current = None
+                    if (base_datablocks is not None and name in base_datablocks):
+                        current = base_datablocks[name]
+
+                for datablock in datablock_list.get(name, [ ]):
+                    reference_index.remove(datablock)
+                    referenced_names.update([value for value, property_name in ReferenceIndex.values(datablock)])
+
+                if (current is None):
+                    datablock_list.pop(name, None)
+                    continue
+
+                datablock_list[name] = current
+                for datablock in current:
+                    reference_index.add(datablock)
+                    referenced_names.update([value for value, property_name in ReferenceIndex.values(datablock)])
+
+            # Everything whose effective properties or referenced names changed
+            affected_names = hierarchy.update(datablock_names)
+            referrer_names = set()
+            for name in datablock_names:
+                referrer_names.update([datablock.name for datablock in reference_index.referrers(name)])
+            affected_names |= hierarchy.descendants(referrer_names)
+
+            bound_entities = set(["%s::%s" % (type, name) for type, name in bound_names])
+            def is_stale(diagnostic):
+                if (diagnostic.code == "parse-timeout"):
+                    return diagnostic.filepath in affected_paths
+                elif (diagnostic.code == "global-function-redeclared"):
+                    return diagnostic.entity in global_names
+                elif (diagnostic.code == "bound-function-redeclared"):
+                    return diagnostic.entity in bound_entities
+                elif (diagnostic.code == "datablock-redeclared"):
+                    return diagnostic.entity in datablock_names
+                elif (diagnostic.code == "unreferenced-datablock"):
+                    return diagnostic.entity in referenced_names
+                return diagnostic.entity in affected_names
+
+            removed = self.diagnostics.discard(is_stale)
+            first_added = len(self.diagnostics.diagnostics)
+
+            for file in new_files:
+                self._report_parse_error(file)
+
+            # Re-run the checks for everything affected
+            for name in global_names:
+                entries = declarations.global_functions.get(name, [ ])
+                for entry in entries:
+                    entry.clear_aliases()
+                for entry in entries[1:]:
+                    self._report_redeclaration(entries[0], entry)
+
+            for type, name in bound_names:
+                entries = declarations.bound_functions[type].get(name, [ ])
+                for entry in entries:
+                    entry.clear_aliases()
+                for entry in entries[1:]:
+                    self._report_redeclaration(entries[0], entry)
+
+            for name in datablock_names:
+                if (name in declarations.datablocks):
+                    self._report_datablock_redeclaration(name, declarations.datablocks[name])
+
+            for name in affected_names:
+                for datablock in declarations.datablocks.get(name, [ ]):
+                    self._check_inheritance(datablock, datablock_list)
+
+            for cycle in hierarchy.cycles:
+                if (cycle[0] in affected_names):
+                    datablock = datablock_list[cycle[0]][0]
+                    self.diagnostics.warning("inheritance-cycle", "Datablock '%s' has a cyclic inheritance chain: %s!" % (datablock.name, " -> ".join(cycle)), datablock.filepath, datablock.line, datablock.name)
+
+            for name in affected_names:
+                for datablock in declarations.datablocks.get(name, [ ]):
+                    self._check_datablock(datablock, datablock_list, hierarchy)
+
+            for name in referenced_names:
+                if (name in datablock_list):
+                    self._check_referenced(name, datablock_list, reference_index)
+
+            added = self.diagnostics.diagnostics[first_added:]
+
+            self.metrics.count("update", "files", len(affected_paths))
+            self.metrics.count("update", "datablocks_rechecked", len(affected_names))
+
+            # Refresh the flat listings in the results
+            file_list = list(self._file_entries.values())
+            global_function_list = [ ]
+            bound_function_list = { }
+            for file in file_list:
+                global_function_list += file.global_functions
+
+                for classname in file.bound_functions:
+                    bound_function_list.setdefault(classname, [])
+                    bound_function_list[classname] += file.bound_functions[classname]
+
+            results["files"] = file_list
+            results["global_functions"] = global_function_list
+            results["bound_functions"] = bound_function_list
+
+        if (self.usages):
+            with self.metrics.stage("callgraph"):
+                results["calls"] = callgraph.CallGraph(file_list)
+
+            with self.metrics.stage("globals"):
+                for file in old_files:
+                    results["globals"].remove_file(file)
+                for file in new_files:
+                    results["globals"].add_file(file)
+
+            # Both are rebuilt in full, and so are their diagnostics
+            with self.metrics.stage("usages"):
+                removed += self.diagnostics.discard(lambda diagnostic: diagnostic.code in USAGE_CODES)
+                first_added = len(self.diagnostics.diagnostics)
+                self._usage_stage(results["calls"], results["globals"])
+                added = added + self.diagnostics.diagnostics[first_added:]
+
+        if (results["columns"] is not None):
+            with self.metrics.stage("columnar"):
+                results["columns"] = columnar.ColumnarStore((datablock for file in file_list for datablock in file.datablocks), hierarchy)
+
+        # Diagnostics that were removed and re-reported unchanged are not news
+        removed_keys = set([diagnostic.key() for diagnostic in removed])
+        added_keys = set([diagnostic.key() for diagnostic in added])
+        return ([diagnostic for diagnostic in added if diagnostic.key() not in removed_keys], [diagnostic for diagnostic in removed if diagnostic.key() not in added_keys])
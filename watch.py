@@ -0,0 +1,127 @@
+"""
+    watch.py
+
+    Detects changed TorqueScript files in a directory tree, either through
+    inotify when the optional inotify_simple package is installed or by
+    periodically comparing os.scandir stat sweeps.
+"""
+
+import os
+import os.path
+import time
+
+from discovery import FileDiscovery
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class Watcher(object):
+    """
+        Class representing a watch over every script file below a directory,
+        as found by the given FileDiscovery or one for the given extensions.
+        wait() blocks until at least one file was created, modified or
+        removed and returns the absolute paths that changed and the ones that
+        were removed.
+    """
+    directory = None
+    interval = None
+    discovery = None
+
+    _state = None
+    _inotify = None
+    _watches = None
+
+    def __init__(self, directory, interval=0.5, extensions=None, use_inotify=True, discovery=None):
+        self.directory = os.path.realpath(directory)
+        self.interval = interval
+
+        if (discovery is None):
+            discovery = FileDiscovery(extensions)
+        self.discovery = discovery
+
+        self._state = self.sweep()
+
+        if (use_inotify and inotify_simple is not None):
+            self._inotify = inotify_simple.INotify()
+            self._watches = { }
+            for directory in self._directories():
+                self._add_watch(directory)
+
+    def close(self):
+        if (self._inotify is not None):
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _directories(self):
+        pending = [ self.directory ]
+        while (len(pending) != 0):
+            directory = pending.pop()
+            yield directory
+
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if (entry.is_dir(follow_symlinks=False)):
+                            pending.append(entry.path)
+            except OSError:
+                continue
+
+    def _add_watch(self, directory):
+        flags = inotify_simple.flags
+        mask = flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO
+        try:
+            self._watches[self._inotify.add_watch(directory, mask)] = directory
+        except OSError:
+            pass
+
+    def sweep(self):
+        """
+            Returns a dictionary mapping the absolute path of every watched
+            file to its (modification time, size) pair.
+        """
+        state = { }
+        for file in self.discovery.find(self.directory, stat=True):
+            state[file.path] = (file.mtime_ns, file.size)
+        return state
+
+    def poll(self):
+        """
+            Sweeps the tree once and returns the (changed, removed) path lists
+            since the previous sweep.
+        """
+        state = self.sweep()
+
+        changed = [path for path in state if self._state.get(path) != state[path]]
+        removed = [path for path in self._state if path not in state]
+
+        self._state = state
+        return (sorted(changed), sorted(removed))
+
+    def wait(self):
+        while (True):
+            if (self._inotify is not None):
+                events = self._inotify.read()
+
+                # New directories need watches of their own
+                for event in events:
+                    if (event.mask & inotify_simple.flags.ISDIR and event.mask & (inotify_simple.flags.CREATE | inotify_simple.flags.MOVED_TO)):
+                        self._add_watch(os.path.join(self._watches.get(event.wd, self.directory), event.name))
+
+                # Editors save in several steps, let them settle first
+                time.sleep(min(self.interval, 0.05))
+                self._inotify.read(timeout=0)
+            else:
+                time.sleep(self.interval)
+
+            changed, removed = self.poll()
+            if (len(changed) != 0 or len(removed) != 0):
+                return (changed, removed)
@@ -0,0 +1,185 @@
+"""
+    workers.py
+
+    Long lived worker pool shared by every TSScraper in a run.
+"""
+
+import itertools
+import concurrent.futures
+import concurrent.futures.process
+
+
+class WorkerPool(object):
+    """
+        Class representing a reusable pool of worker processes.
+
+        The underlying process pool is only started the first time a
+        batch of work is large enough to be worth it, and is then kept alive
+        until close() so base and mod scans share the same workers. Work items
+        are scheduled largest first and packed into chunks of roughly equal
+        size so that a few big scripts do not leave one worker running long
+        after the others have finished.
+
+        A worker that dies without returning, killed by the system or by a
+        signal such as SIGBUS, breaks the pool. The chunks that were lost
+        with it are then processed in the calling process instead, and a new
+        pool is started for the next batch.
+    """
+    process_count = None
+    initializer = None
+
+    # Maximum number of items per task and maximum number of tasks in flight.
+    # A window of None uses four tasks per process.
+    chunk_size = None
+    window = None
+
+    # Batches with fewer items or fewer total bytes than this are processed
+    # in the calling process, where they finish before a pool could start.
+    serial_item_threshold = None
+    serial_byte_threshold = None
+
+    _pool = None
+    _serial_initialized = None
+
+    def __init__(self, process_count, initializer=None, chunk_size=8, window=None, serial_item_threshold=32, serial_byte_threshold=512 * 1024):
+        self.process_count = process_count
+        self.initializer = initializer
+        self.chunk_size = chunk_size
+        self.window = window
+        self.serial_item_threshold = serial_item_threshold
+        self.serial_byte_threshold = serial_byte_threshold
+
+        self._serial_initialized = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if (type is None):
+            self.close()
+        else:
+            self.terminate()
+
+    def _get_pool(self):
+        if (self._pool is None):
+            self._pool = concurrent.futures.ProcessPoolExecutor(max(self.process_count, 1), initializer=self.initializer)
+        return self._pool
+
+    def close(self):
+        if (self._pool is not None):
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def terminate(self):
+        if (self._pool is not None):
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def _run_serial(self, function, chunks):
+        if (self.initializer is not None and self._serial_initialized is False):
+            self.initializer()
+            self._serial_initialized = True
+
+        for chunk in chunks:
+            for result in function(chunk):
+                yield result
+
+    def _build_chunks(self, items, sizes):
+        """
+            Sorts the items largest first and packs them into chunks holding at
+            most chunk_size items and roughly an equal share of the bytes, so
+            large items end up in chunks of their own.
+        """
+        order = sorted(range(len(items)), key=lambda index: sizes[index], reverse=True)
+        target_bytes = max(sum(sizes) // max(self.process_count * 8, 1), 1)
+
+        chunks = [ ]
+        chunk = [ ]
+        chunk_bytes = 0
+        for index in order:
+            chunk.append(items[index])
+            chunk_bytes += sizes[index]
+
+            if (len(chunk) >= self.chunk_size or chunk_bytes >= target_bytes):
+                chunks.append(chunk)
+                chunk = [ ]
+                chunk_bytes = 0
+
+        if (len(chunk) != 0):
+            chunks.append(chunk)
+
+        return chunks
+
+    def is_serial(self, items, sizes):
+        return (self.process_count <= 0 or len(items) < self.serial_item_threshold or sum(sizes) < self.serial_byte_threshold)
+
+    def run(self, function, items, sizes, isolated=False):
+        """
+            Generator applying function to chunks of the given items and
+            yielding each individual result as soon as its chunk completes.
+            function receives a list of items and must return a list of
+            results; results arrive in no particular order.
+
+            With isolated, the items are processed in worker processes even
+            when the batch is small enough to be processed in this one, or
+            the pool was created without any, at least one then being started.
+        """
+        if (len(items) == 0):
+            return
+
+        chunks = self._build_chunks(items, sizes)
+
+        if (not isolated and self.is_serial(items, sizes)):
+            for result in self._run_serial(function, chunks):
+                yield result
+            return
+
+        window = self.window
+        if (window is None):
+            window = max(self.process_count, 1) * 4
+
+        chunks = iter(chunks)
+        pool = self._get_pool()
+
+        # Chunks by the future of their task, and those lost with a worker
+        in_flight = { }
+        lost = [ ]
+        try:
+            for chunk in itertools.islice(chunks, max(window, 1)):
+                in_flight[pool.submit(function, chunk)] = chunk
+
+            while (len(in_flight) != 0):
+                done, pending = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    chunk = in_flight.pop(future)
+
+                    if (isinstance(future.exception(), concurrent.futures.process.BrokenProcessPool)):
+                        lost.append(chunk)
+                        continue
+                    results = future.result()
+
+                    # Keep the window full before handing results to the
+                    # caller, unless the pool already broke
+                    if (len(lost) == 0):
+                        for chunk in itertools.islice(chunks, 1):
+                            in_flight[pool.submit(function, chunk)] = chunk
+
+                    for result in results:
+                        yield result
+        except BaseException:
+            # Nothing is waiting for the outstanding tasks any more
+            for future in in_flight:
+                future.cancel()
+            raise
+
+        if (len(lost) == 0):
+            return
+
+        # A broken pool can't be used again; its surviving workers exit once
+        # it is shut down
+        lost += list(chunks)
+        print("Warning: A worker process died, processing the %u work items it took with it and those left in this process." % sum([len(chunk) for chunk in lost]))
+        self.terminate()
+        for result in self._run_serial(function, lost):
+            yield result